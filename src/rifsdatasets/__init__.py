@@ -1,27 +1,103 @@
 """
 Package for downloading and loading the rifs datasets
+
+Datasets and functions are imported from their modules on first use, so
+importing the package does not import pandas, git or the dataset modules.
+merge_rifsdatasets and split_dataset defer their heavy imports and are
+imported eagerly, since their names are shared with their modules.
 """
 
-from rifsdatasets.librivox import LibriVoxDansk
-from rifsdatasets.den2radio import Den2Radio
-from rifsdatasets.forskerzonen import Forskerzonen
-from rifsdatasets.danpass import DanPASS
-from rifsdatasets.nstdanishspråkbanken import NSTDanishSpråkbanken
-from rifsdatasets.commonvoicedansk import CommonVoiceDansk
-from rifsdatasets.dansketaler import DanskeTaler
+from collections.abc import Mapping
+from typing import TYPE_CHECKING
+
 from rifsdatasets.merge_rifsdatasets import merge_rifsdatasets
 from rifsdatasets.split_dataset import split_dataset
 
 __version__ = "0.2.6"
 
-all_datasets = {
-    "LibriVoxDansk": LibriVoxDansk,
-    "Den2Radio": Den2Radio,
-    "Forskerzonen": Forskerzonen,
-    "DanPASS": DanPASS,
-    "NSTDanishSpråkbanken": NSTDanishSpråkbanken,
-    "CommonVoiceDansk": CommonVoiceDansk,
-    "DanskeTaler": DanskeTaler,
+#: Module of every lazily imported public name of the package.
+_modules = {
+    "LibriVoxDansk": "rifsdatasets.librivox",
+    "Den2Radio": "rifsdatasets.den2radio",
+    "Forskerzonen": "rifsdatasets.forskerzonen",
+    "DanPASS": "rifsdatasets.danpass",
+    "NSTDanishSpråkbanken": "rifsdatasets.nstdanishspråkbanken",
+    "CommonVoiceDansk": "rifsdatasets.commonvoicedansk",
+    "DanskeTaler": "rifsdatasets.dansketaler",
+    "SegmentDataset": "rifsdatasets.loader",
+    "build_audio_index": "rifsdatasets.audio_index",
 }
 
-__all__ = ["all_datasets", "merge_rifsdatasets", "split_dataset"]
+
+class _Datasets(Mapping):
+    """Dataset classes by name, each imported when it is first looked up."""
+
+    def __init__(self, names):
+        self._names = list(names)
+
+    def __getitem__(self, name):
+        """Import and return the dataset class called name."""
+        if name not in self._names:
+            raise KeyError(name)
+        return __getattr__(name)
+
+    def __iter__(self):
+        """Iterate over the names of the datasets."""
+        return iter(self._names)
+
+    def __len__(self):
+        """Return the number of datasets."""
+        return len(self._names)
+
+    def __repr__(self):
+        """Show the names of the datasets without importing them."""
+        return f"all_datasets({', '.join(self._names)})"
+
+
+all_datasets = _Datasets(
+    [
+        "LibriVoxDansk",
+        "Den2Radio",
+        "Forskerzonen",
+        "DanPASS",
+        "NSTDanishSpråkbanken",
+        "CommonVoiceDansk",
+        "DanskeTaler",
+    ]
+)
+
+
+def __getattr__(name: str):
+    """Import a dataset class or function from its module on first use."""
+    import importlib
+
+    if name not in _modules:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_modules[name]), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    """List the names of the package, including those not imported yet."""
+    return sorted(set(globals()) | set(_modules))
+
+
+if TYPE_CHECKING:
+    from rifsdatasets.librivox import LibriVoxDansk  # noqa: F401
+    from rifsdatasets.den2radio import Den2Radio  # noqa: F401
+    from rifsdatasets.forskerzonen import Forskerzonen  # noqa: F401
+    from rifsdatasets.danpass import DanPASS  # noqa: F401
+    from rifsdatasets.nstdanishspråkbanken import NSTDanishSpråkbanken  # noqa: F401
+    from rifsdatasets.commonvoicedansk import CommonVoiceDansk  # noqa: F401
+    from rifsdatasets.dansketaler import DanskeTaler  # noqa: F401
+    from rifsdatasets.loader import SegmentDataset  # noqa: F401
+    from rifsdatasets.audio_index import build_audio_index  # noqa: F401
+
+__all__ = [
+    "all_datasets",
+    "merge_rifsdatasets",
+    "split_dataset",
+    "SegmentDataset",
+    "build_audio_index",
+]
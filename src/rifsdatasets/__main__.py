@@ -0,0 +1,127 @@
+"""
+Command line interface for rifsdatasets.
+
+Example
+-------
+    python -m rifsdatasets download Den2Radio LibriVoxDansk --target data
+    python -m rifsdatasets benchmark --scale small --save baseline.json
+"""
+
+from typing import List, Optional
+
+
+def main(argv: Optional[List[str]] = None):
+    """
+    Run the rifsdatasets command line interface.
+
+    Parameters
+    ----------
+    argv: List[str]
+        Command line arguments. Defaults to sys.argv.
+
+    Returns
+    -------
+    None
+    """
+    import argparse
+    import sys
+
+    from rifsdatasets import all_datasets
+    from rifsdatasets.orchestrator import download_datasets
+
+    parser = argparse.ArgumentParser(prog="rifsdatasets", description=__doc__)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    download = commands.add_parser(
+        "download", help="Download one or more datasets concurrently."
+    )
+    download.add_argument(
+        "datasets",
+        nargs="+",
+        help=f"Datasets to download, 'all' or any of: {', '.join(all_datasets)}",
+    )
+    download.add_argument("--target", required=True, help="Destination folder.")
+    download.add_argument(
+        "--parallel", type=int, help="Datasets downloading at once. Default: all."
+    )
+    download.add_argument(
+        "--connections", type=int, default=16, help="Maximum network connections."
+    )
+    download.add_argument(
+        "--workers", type=int, help="Conversion processes. Default: cpu count."
+    )
+    download.add_argument(
+        "--shallow", action="store_true", help="Shallow, sparse clones."
+    )
+    download.add_argument("--cache-dir", help="Folder of the download cache.")
+    download.add_argument(
+        "--cache-max-gb",
+        type=float,
+        help="Size of the download cache before old entries are evicted. "
+        "Default: 100.",
+    )
+    download.add_argument("--sample-rate", type=int, help="Resample audio.")
+    download.add_argument("--channels", type=int, help="Downmix audio.")
+    download.add_argument("-v", "--verbose", action="store_true")
+    download.add_argument("-q", "--quiet", action="store_true")
+
+    benchmark = commands.add_parser(
+        "benchmark", help="Benchmark the pipeline on synthetic data."
+    )
+    benchmark.add_argument(
+        "--scale", choices=["small", "medium", "large"], default="small"
+    )
+    benchmark.add_argument("--stages", nargs="+", help="Stages to run. Default: all.")
+    benchmark.add_argument("--workdir", help="Keep the synthetic data here.")
+    benchmark.add_argument("--save", help="Save the results as a baseline.")
+    benchmark.add_argument("--compare", help="Compare with a saved baseline.")
+    benchmark.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.1,
+        help="Relative slowdown that counts as a regression. Default: 0.1.",
+    )
+
+    args = parser.parse_args(argv)
+
+    if args.command == "download":
+        names = list(all_datasets) if args.datasets == ["all"] else args.datasets
+        summary = download_datasets(
+            names,
+            args.target,
+            max_parallel=args.parallel,
+            max_connections=args.connections,
+            num_workers=args.workers,
+            verbose=args.verbose,
+            quiet=args.quiet,
+            shallow=args.shallow,
+            cache_dir=args.cache_dir,
+            cache_max_bytes=(
+                None if args.cache_max_gb is None else int(args.cache_max_gb * 2**30)
+            ),
+            sample_rate=args.sample_rate,
+            channels=args.channels,
+        )
+        if any(result["status"] != "done" for result in summary.values()):
+            sys.exit(1)
+
+    elif args.command == "benchmark":
+        import json
+
+        from rifsdatasets.benchmark import compare, run_benchmarks
+
+        results = run_benchmarks(args.scale, args.stages, args.workdir)
+        if args.save:
+            with open(args.save, "w") as f:
+                json.dump(results, f, indent=2)
+        if args.compare:
+            with open(args.compare) as f:
+                regressions = compare(results, json.load(f), args.tolerance)
+            for regression in regressions:
+                print(f"Regression: {regression}")
+            if regressions:
+                sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""
+Index the audio files of a dataset.
+
+The module contains the function build_audio_index, which scans the wav files
+of a dataset in parallel, reading only their headers, and writes their
+duration, sample rate, channels and size to the ``audio_index`` manifest next
+to ``all.csv``. Rebuilding the index only reads the headers of files whose
+size or modification time changed. split_dataset takes durations from the
+index and merge_rifsdatasets merges the indices of the merged datasets.
+"""
+
+from typing import Dict, List, Optional
+
+import os
+
+INDEX_NAME = "audio_index"
+
+
+def build_audio_index(
+    dataset_path: str,
+    folders: Optional[List[str]] = None,
+    num_workers: int = 16,
+    output_format: str = "csv",
+    verbose: bool = False,
+    quiet: bool = False,
+):
+    """
+    Build or update the audio index of a dataset.
+
+    Parameters
+    ----------
+    dataset_path: str
+        Path to dataset.
+    folders: List[str]
+        Folders of the dataset to scan for wav files. Default is ['audio'].
+    num_workers: int
+        Number of threads reading headers.
+    output_format: str
+        Format of the index, 'csv' or 'parquet'. Default is csv.
+    verbose: bool
+        Print the progress.
+    quiet: bool
+        Prints nothing.
+
+    Returns
+    -------
+    pd.DataFrame
+        The index, with the columns 'id' (path relative to the folder without
+        extension, as in all.csv), 'file' (path relative to the dataset),
+        'duration', 'sample_rate', 'channels', 'sample_width', 'frames',
+        'size' and 'mtime' (nanoseconds).
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    import pandas as pd
+    from rifsdatasets.manifest import read_manifest, write_manifest
+    from rifsdatasets.utils import read_wav_header
+
+    folders = folders or ["audio"]
+    stats = {}
+    for folder in folders:
+        root = os.path.join(dataset_path, folder)
+        for dirpath, _, filenames in os.walk(root, followlinks=True):
+            for filename in filenames:
+                if not filename.lower().endswith(".wav"):
+                    continue
+                path = os.path.join(dirpath, filename)
+                stat = os.stat(path)
+                file = os.path.relpath(path, dataset_path)
+                stats[file] = (
+                    os.path.splitext(os.path.relpath(path, root))[0],
+                    stat.st_size,
+                    stat.st_mtime_ns,
+                )
+
+    try:
+        previous = read_manifest(dataset_path, INDEX_NAME)
+        previous = previous.set_index("file", drop=False)
+    except FileNotFoundError:
+        previous = None
+
+    rows, scan = [], []
+    for file, (file_id, size, mtime) in stats.items():
+        if (
+            previous is not None
+            and file in previous.index
+            and previous.at[file, "size"] == size
+            and previous.at[file, "mtime"] == mtime
+        ):
+            rows.append(previous.loc[file].to_dict())
+        else:
+            scan.append(file)
+    if verbose and not quiet:
+        print(
+            f"Indexing {len(stats)} wav files in '{dataset_path}', "
+            f"{len(scan)} new or changed"
+        )
+
+    def read(file: str):
+        """Read the header of a file, None if it is not a valid wav file."""
+        try:
+            return read_wav_header(os.path.join(dataset_path, file))
+        except (OSError, ValueError) as e:
+            if verbose and not quiet:
+                print(f"Skipping {file}: {e}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        for file, header in zip(scan, executor.map(read, scan)):
+            if header is None:
+                continue
+            file_id, size, mtime = stats[file]
+            rows.append(
+                dict(
+                    id=file_id,
+                    file=file,
+                    duration=header.duration,
+                    sample_rate=header.sample_rate,
+                    channels=header.channels,
+                    sample_width=header.sample_width,
+                    frames=header.frames,
+                    size=size,
+                    mtime=mtime,
+                )
+            )
+
+    index = pd.DataFrame(
+        rows,
+        columns=[
+            "id",
+            "file",
+            "duration",
+            "sample_rate",
+            "channels",
+            "sample_width",
+            "frames",
+            "size",
+            "mtime",
+        ],
+    )
+    index = index.sort_values("file", ignore_index=True)
+    write_manifest(index, dataset_path, INDEX_NAME, output_format)
+    if not quiet:
+        print(
+            f"Indexed {len(index)} wav files, "
+            f"{index['duration'].sum() / 3600:.2f} hours"
+        )
+    return index
+
+
+def read_durations(dataset_path: str) -> Dict[str, float]:
+    """
+    Read the durations from the audio index of a dataset.
+
+    Parameters
+    ----------
+    dataset_path: str
+        Path to dataset.
+
+    Returns
+    -------
+    Dict[str, float]
+        Duration in seconds by path relative to the dataset. Empty if the
+        dataset has no index.
+    """
+    from rifsdatasets.manifest import read_manifest
+
+    try:
+        index = read_manifest(dataset_path, INDEX_NAME, columns=["file", "duration"])
+    except FileNotFoundError:
+        return {}
+    return dict(zip(index["file"].astype(str), index["duration"]))
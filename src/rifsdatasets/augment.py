@@ -0,0 +1,576 @@
+"""
+Mix noise from FreeSoundOrg packs into the segments of a split.
+
+The module contains the following:
+
+    - NoiseBank: The sounds of a split of a noise pack, memory-mapped or
+      pre-loaded.
+    - NoiseMixer: Draw noise and a signal-to-noise ratio for a segment and mix.
+    - mix: Mix batches of noise into batches of speech, vectorized with NumPy.
+    - NoisyDataset: A SegmentDataset with noise mixed in on the fly.
+    - augment_split: Write noisy copies of the segments of a split on a
+      process pool.
+
+The noise and SNR of a segment are drawn from a generator seeded with the
+seed, the copy or epoch and the row, so the same segment gets the same noise
+regardless of the number of workers or the order of the rows.
+
+Example
+-------
+    FreeSoundOrg.download("noise", pack_id, name="rain")
+    mixer = NoiseMixer(NoiseBank("noise/rain", "train"), snr_range=(5, 20))
+    dataset = NoisyDataset(SegmentDataset("data/merged", "train"), mixer)
+"""
+
+from typing import Any, List, Optional, Tuple
+
+import os
+
+from rifsdatasets.instrument import traced
+
+#: The mixer of a worker process of augment_split, sent once per process.
+_worker_mixer: Optional["NoiseMixer"] = None
+
+
+class NoiseBank:
+    """
+    The sounds of a split of a noise pack.
+
+    The split is the ``<split>.txt`` list written by FreeSoundOrg.download,
+    naming wav files in the ``audio`` folder of the pack. By default the
+    files are memory-mapped and only the window of a drawn noise is read and
+    converted. With preload all sounds are converted to mono float32 at
+    sample_rate once, which is faster when the bank fits in memory.
+    """
+
+    def __init__(
+        self,
+        pack_path: str,
+        split: str = "train",
+        preload: bool = False,
+        sample_rate: int = 16000,
+    ):
+        """
+        Initialize the bank.
+
+        Parameters
+        ----------
+        pack_path: str
+            Folder of the noise pack.
+        split: str
+            Name of the split of the pack, 'train', 'dev' or 'test'.
+        preload: bool
+            Convert all sounds into memory instead of memory-mapping them.
+        sample_rate: int
+            Sample rate of the pre-loaded sounds.
+        """
+        self.pack_path = pack_path
+        self.split = split
+        self.preload = preload
+        self.sample_rate = sample_rate
+        with open(os.path.join(pack_path, f"{split}.txt")) as f:
+            names = [line.strip() for line in f if line.strip()]
+        self.files = [os.path.join(pack_path, "audio", name) for name in names]
+        self._sounds: Optional[List[Tuple[Any, int]]] = None
+        self._load()
+        assert self.files, f"No sounds in the {split} split of {pack_path}."
+
+    def _load(self) -> List[Tuple[Any, int]]:
+        """Map or load the sounds, dropping the empty ones."""
+        from rifsdatasets.features import as_float_signal
+        from rifsdatasets.loader import map_wav
+
+        if self._sounds is not None:
+            return self._sounds
+        sounds, files = [], []
+        for file in self.files:
+            audio, sample_rate = map_wav(file)
+            if self.preload:
+                audio = as_float_signal(audio, sample_rate, self.sample_rate)
+                sample_rate = self.sample_rate
+            if len(audio):
+                sounds.append((audio, sample_rate))
+                files.append(file)
+        self.files = files
+        self._sounds = sounds
+        return sounds
+
+    def __len__(self) -> int:
+        """Return the number of non-empty sounds."""
+        return len(self.files)
+
+    def sample(self, rng, length: int, sample_rate: int):
+        """
+        Draw a noise of length samples.
+
+        A sound and an offset in it are drawn from rng. Sounds shorter than
+        the noise are repeated.
+
+        Parameters
+        ----------
+        rng: np.random.Generator
+            Generator the sound and offset are drawn from.
+        length: int
+            Number of samples of the noise.
+        sample_rate: int
+            Sample rate of the noise.
+
+        Returns
+        -------
+        Tuple[np.ndarray, int]
+            The mono float32 noise and the index of the sound in files.
+        """
+        import numpy as np
+        from rifsdatasets.features import as_float_signal
+
+        sounds = self._load()
+        choice = int(rng.integers(len(sounds)))
+        audio, rate = sounds[choice]
+        # One sample more than needed, so resampling covers the whole noise.
+        window = int(np.ceil(length * rate / sample_rate)) + 1
+        offset = int(rng.integers(max(1, len(audio) - window + 1)))
+        stop = offset + window
+        noise = as_float_signal(audio[offset:stop], rate, sample_rate)
+        return np.resize(noise, length), choice
+
+    def __getstate__(self):
+        """
+        Get the state to pickle, without the memory-mapped sounds.
+
+        Mapped files are not shared with worker processes, which map them
+        again on first use. Pre-loaded sounds are kept.
+        """
+        state = self.__dict__.copy()
+        if not self.preload:
+            state["_sounds"] = None
+        return state
+
+
+def mix(speech, noise, snr, lengths=None):
+    """
+    Mix noise into speech at signal-to-noise ratios.
+
+    The noise is scaled so the ratio of the mean power of the speech to the
+    mean power of the noise is snr decibels. Silent noise is not mixed in.
+
+    Parameters
+    ----------
+    speech: np.ndarray
+        Speech shaped (samples,) or (batch, samples).
+    noise: np.ndarray
+        Noise shaped like speech.
+    snr: float or np.ndarray
+        Signal-to-noise ratio in decibels, one or one per row of the batch.
+    lengths: np.ndarray
+        Number of valid samples of every row of a padded batch. Optional.
+        The padding is left out of the powers and left silent.
+
+    Returns
+    -------
+    np.ndarray
+        The mixed float32 audio, shaped like speech.
+    """
+    import numpy as np
+
+    speech = np.asarray(speech, dtype=np.float32)
+    noise = np.asarray(noise, dtype=np.float32)
+    snr = np.asarray(snr, dtype=np.float32)
+    if speech.ndim == 2:
+        snr = snr.reshape(-1, 1)
+    if lengths is not None:
+        mask = np.arange(speech.shape[-1]) < np.asarray(lengths).reshape(-1, 1)
+        noise = noise * mask
+        count = np.maximum(np.asarray(lengths).reshape(-1, 1), 1)
+    else:
+        count = max(speech.shape[-1], 1)
+    speech_power = np.sum(np.square(speech), axis=-1, keepdims=True) / count
+    noise_power = np.sum(np.square(noise), axis=-1, keepdims=True) / count
+    scale = np.sqrt(
+        np.divide(
+            speech_power,
+            noise_power * 10.0 ** (snr / 10.0),
+            out=np.zeros_like(noise_power),
+            where=noise_power > 0,
+        )
+    )
+    return speech + scale * noise
+
+
+class NoiseMixer:
+    """
+    Mix noise from a NoiseBank into segments.
+
+    The draws of a segment depend only on the seed, the copy and the row, so
+    they can be made in any process and in any order.
+    """
+
+    def __init__(
+        self,
+        bank: NoiseBank,
+        snr_range: Tuple[float, float] = (0.0, 20.0),
+        probability: float = 1.0,
+        seed: int = 0,
+    ):
+        """
+        Initialize the mixer.
+
+        Parameters
+        ----------
+        bank: NoiseBank
+            The noise.
+        snr_range: Tuple[float, float]
+            Lowest and highest signal-to-noise ratio in decibels. The ratio
+            of a segment is drawn uniformly between them.
+        probability: float
+            Probability that noise is mixed into a segment at all.
+        seed: int
+            Seed of the draws.
+        """
+        assert snr_range[0] <= snr_range[1], "The SNR range must be increasing."
+        assert 0 <= probability <= 1, "Probability must be between 0 and 1."
+        self.bank = bank
+        self.snr_range = snr_range
+        self.probability = probability
+        self.seed = seed
+
+    def draw(self, row: int, length: int, sample_rate: int, copy: int = 0):
+        """
+        Draw the noise and SNR of a segment.
+
+        Parameters
+        ----------
+        row: int
+            Row of the segment in the manifest.
+        length: int
+            Number of samples of the segment.
+        sample_rate: int
+            Sample rate of the segment.
+        copy: int
+            Number of the noisy copy of the segment, or the epoch.
+
+        Returns
+        -------
+        Tuple[np.ndarray, float, Optional[str]]
+            The noise, the SNR in decibels and the noise file, which are
+            silence, NaN and None if no noise is mixed in.
+        """
+        import numpy as np
+
+        rng = np.random.default_rng([self.seed, copy, row])
+        apply = rng.random() < self.probability
+        snr = float(rng.uniform(*self.snr_range))
+        noise, choice = self.bank.sample(rng, length, sample_rate)
+        if not apply:
+            return np.zeros(length, dtype=np.float32), float("nan"), None
+        return noise, snr, os.path.relpath(self.bank.files[choice], self.bank.pack_path)
+
+    def __call__(self, audio, sample_rate: int, row: int, copy: int = 0):
+        """
+        Mix noise into a segment.
+
+        Parameters
+        ----------
+        audio: np.ndarray
+            Samples shaped (frames,) or (frames, channels).
+        sample_rate: int
+            Sample rate of audio.
+        row: int
+            Row of the segment in the manifest.
+        copy: int
+            Number of the noisy copy of the segment, or the epoch.
+
+        Returns
+        -------
+        Tuple[np.ndarray, float, Optional[str]]
+            The mixed mono float32 audio, the SNR and the noise file.
+        """
+        from rifsdatasets.features import as_float_signal
+
+        speech = as_float_signal(audio, sample_rate)
+        noise, snr, file = self.draw(row, len(speech), sample_rate, copy)
+        if file is None:
+            return speech, snr, file
+        return mix(speech, noise, snr), snr, file
+
+
+class NoisyDataset:
+    """
+    A SegmentDataset with noise mixed into every segment when it is read.
+
+    Segments are returned as mono float32 with the 'snr' and 'noise' of the
+    mix added to the row. Call set_epoch to draw new noise for every epoch.
+    """
+
+    def __init__(self, dataset, mixer: NoiseMixer):
+        """
+        Initialize the dataset.
+
+        Parameters
+        ----------
+        dataset: rifsdatasets.loader.SegmentDataset
+            The speech.
+        mixer: NoiseMixer
+            The noise.
+        """
+        self.dataset = dataset
+        self.mixer = mixer
+        self.epoch = 0
+
+    def set_epoch(self, epoch: int):
+        """
+        Set the epoch, which changes the noise of every segment.
+
+        Parameters
+        ----------
+        epoch: int
+            The epoch.
+
+        Returns
+        -------
+        None
+        """
+        self.epoch = epoch
+
+    def __len__(self) -> int:
+        """Return the number of segments."""
+        return len(self.dataset)
+
+    def __getitem__(self, index: int):
+        """
+        Get a noisy segment.
+
+        Parameters
+        ----------
+        index: int
+            Row of the segment in the manifest.
+
+        Returns
+        -------
+        Segment
+            The mixed audio, the sample rate and the row with 'snr' and
+            'noise'.
+        """
+        from rifsdatasets.loader import Segment
+
+        if index < 0:
+            index += len(self)
+        segment = self.dataset[index]
+        audio, snr, file = self.mixer(
+            segment.audio, segment.sample_rate, index, self.epoch
+        )
+        return Segment(
+            audio=audio,
+            sample_rate=segment.sample_rate,
+            row={**segment.row, "snr": snr, "noise": file},
+        )
+
+    def __iter__(self):
+        """Iterate over the noisy segments in order."""
+        for index in range(len(self)):
+            yield self[index]
+
+
+@traced("augment")
+def augment_split(
+    dataset_path: str,
+    split: str,
+    mixer: NoiseMixer,
+    output_path: str,
+    copies: int = 1,
+    path_column: str = "id",
+    num_workers: Optional[int] = None,
+    batch_size: int = 64,
+    output_format: str = "csv",
+    verbose: bool = False,
+    quiet: bool = False,
+) -> str:
+    """
+    Write noisy copies of the segments of a split as a new dataset.
+
+    Every segment is written as a 16 bit mono wav to
+    ``audio/<split>/<row>_<copy>.wav`` in output_path. The rows of the
+    ``<split>`` manifest of the new dataset point to these files and keep the
+    columns of the original rows, with 'source' (the original path), 'copy',
+    'snr' and 'noise' added. The segments of a batch are mixed at once in
+    padded arrays, and batches run on a process pool.
+
+    Parameters
+    ----------
+    dataset_path: str
+        Path to dataset.
+    split: str
+        Name of the manifest, e.g. 'train'.
+    mixer: NoiseMixer
+        The noise.
+    output_path: str
+        Folder of the noisy dataset.
+    copies: int
+        Number of noisy copies of every segment, each with its own noise.
+    path_column: str
+        Column with the path of the wav files relative to dataset_path.
+    num_workers: int
+        Number of processes mixing. Defaults to the number of cpus.
+    batch_size: int
+        Number of segments per task of a process.
+    output_format: str
+        Format of the manifest, 'csv' or 'parquet'. Default is csv.
+    verbose: bool
+        Print the progress.
+    quiet: bool
+        Prints nothing.
+
+    Returns
+    -------
+    str
+        Path to the manifest of the noisy dataset.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    import pandas as pd
+    from rifsdatasets.manifest import manifest_path, read_manifest, write_manifest
+
+    manifest = read_manifest(dataset_path, split)
+    os.makedirs(os.path.join(output_path, "audio", split), exist_ok=True)
+    jobs = [
+        (dataset_path, split, path_column, manifest.iloc[batch], batch.start)
+        for batch in (
+            slice(i, i + batch_size) for i in range(0, len(manifest), batch_size)
+        )
+    ]
+    if verbose and not quiet:
+        print(
+            f"Mixing {copies} noisy copies of {len(manifest)} segments "
+            f"in {len(jobs)} batches"
+        )
+
+    frames = []
+    # The mixer, and the bank with it, is pickled once per worker, not per batch.
+    with ProcessPoolExecutor(
+        max_workers=num_workers, initializer=_init_worker, initargs=(mixer,)
+    ) as executor:
+        for copy in range(copies):
+            args = [job + (output_path, copy) for job in jobs]
+            for rows in executor.map(_augment_batch, *zip(*args)) if args else []:
+                frames.append(rows)
+            if verbose and not quiet:
+                print(f"Wrote copy {copy + 1} of {copies}")
+
+    columns = list(dict.fromkeys([*manifest.columns, "source", "copy", "snr", "noise"]))
+    augmented = pd.concat(frames, ignore_index=True) if frames else None
+    if augmented is None:
+        augmented = pd.DataFrame(columns=columns)
+    write_manifest(augmented[columns], output_path, split, output_format)
+    if not quiet:
+        print(f"Wrote {len(augmented)} noisy segments to {output_path}")
+    return manifest_path(output_path, split)
+
+
+def _init_worker(mixer: NoiseMixer):
+    """
+    Set the mixer of a worker process and map or load its sounds.
+
+    Parameters
+    ----------
+    mixer: NoiseMixer
+        The noise.
+
+    Returns
+    -------
+    None
+    """
+    global _worker_mixer
+
+    mixer.bank._load()
+    _worker_mixer = mixer
+
+
+def _augment_batch(
+    dataset_path: str,
+    split: str,
+    path_column: str,
+    rows,
+    first_row: int,
+    output_path: str,
+    copy: int,
+):
+    """
+    Mix and write a noisy copy of a batch of segments with the worker mixer.
+
+    Parameters
+    ----------
+    dataset_path: str
+        Path to dataset.
+    split: str
+        Name of the manifest.
+    path_column: str
+        Column with the path of the wav files relative to dataset_path.
+    rows: pd.DataFrame
+        The rows of the batch.
+    first_row: int
+        Row of the first segment of the batch in the manifest.
+    output_path: str
+        Folder of the noisy dataset.
+    copy: int
+        Number of the noisy copy.
+
+    Returns
+    -------
+    pd.DataFrame
+        The rows of the noisy segments.
+    """
+    import wave
+
+    import numpy as np
+    from rifsdatasets.features import as_float_signal
+    from rifsdatasets.loader import map_wav, segment_bounds
+
+    mixer = _worker_mixer
+    nan = np.full(len(rows), np.nan)
+    starts = rows["start"].to_numpy(float) if "start" in rows.columns else nan
+    ends = rows["end"].to_numpy(float) if "end" in rows.columns else nan
+    speech, noise, snrs, files, rates = [], [], [], [], []
+    for row, (path, start, end) in enumerate(zip(rows[path_column], starts, ends)):
+        audio, sample_rate = map_wav(os.path.join(dataset_path, str(path)))
+        start, end = segment_bounds(start, end, sample_rate, len(audio))
+        signal = as_float_signal(audio[start:end], sample_rate)
+        drawn, snr, file = mixer.draw(first_row + row, len(signal), sample_rate, copy)
+        speech.append(signal)
+        noise.append(drawn)
+        snrs.append(0.0 if file is None else snr)
+        files.append(file)
+        rates.append(sample_rate)
+
+    # Pad the batch so all segments are mixed in a single vectorized call.
+    lengths = np.array([len(signal) for signal in speech])
+    width = int(lengths.max()) if len(lengths) else 0
+    padded_speech = np.zeros((len(speech), width), dtype=np.float32)
+    padded_noise = np.zeros((len(speech), width), dtype=np.float32)
+    for i, (signal, drawn, length) in enumerate(zip(speech, noise, lengths)):
+        padded_speech[i, :length] = signal
+        padded_noise[i, :length] = drawn
+    mixed = mix(padded_speech, padded_noise, np.array(snrs), lengths)
+    pcm = (np.clip(mixed, -1.0, 1.0 - 2**-15) * 32768).astype("<i2")
+
+    ids = []
+    for i, (length, sample_rate) in enumerate(zip(lengths, rates)):
+        file_id = os.path.join("audio", split, f"{first_row + i}_{copy}")
+        with wave.open(os.path.join(output_path, f"{file_id}.wav"), "wb") as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(2)
+            wav.setframerate(sample_rate)
+            wav.writeframes(pcm[i, :length].tobytes())
+        ids.append(f"{file_id}.wav")
+
+    augmented = rows.copy()
+    augmented["source"] = rows[path_column].to_numpy()
+    augmented[path_column] = ids
+    if "start" in augmented.columns:
+        augmented["start"] = 0.0
+    if "end" in augmented.columns:
+        augmented["end"] = lengths / np.array(rates, dtype=float)
+    augmented["copy"] = copy
+    augmented["snr"] = [
+        np.nan if file is None else snr for snr, file in zip(snrs, files)
+    ]
+    augmented["noise"] = files
+    return augmented
@@ -3,6 +3,7 @@ Base class for all datasets.
 """
 
 from abc import ABC, abstractmethod
+from typing import Optional
 
 
 class Base(ABC):
@@ -10,9 +11,30 @@ class Base(ABC):
     Base class for all datasets.
     """
 
+    #: Git repository the dataset is cloned from, None if it is not cloned.
+    repo_url: Optional[str] = None
+
+    def __init_subclass__(cls, **kwargs):
+        """Report the download of every dataset class as a 'download' event."""
+        from rifsdatasets.instrument import traced
+
+        super().__init_subclass__(**kwargs)
+        download = cls.__dict__.get("download")
+        if isinstance(download, staticmethod):
+            cls.download = staticmethod(
+                traced("download", cls.__name__)(download.__func__)
+            )
+
     @staticmethod
     @abstractmethod
-    def download(target_folder: str, verbose: bool = False, quiet: bool = False):
+    def download(
+        target_folder: str,
+        verbose: bool = False,
+        quiet: bool = False,
+        shallow: bool = False,
+        cache_dir: Optional[str] = None,
+        cache_max_bytes: Optional[int] = None,
+    ):
         """
         Download the dataset to the specified destination.
 
@@ -24,5 +46,70 @@ class Base(ABC):
             Whether to print the download progress with steps.
         quiet: bool
             Prints nothing.
+        shallow: bool
+            Clone only the latest commit of the default branch and check out
+            only the files the dataset uses. Ignored by datasets that are not
+            cloned from repo_url.
+        cache_dir: str
+            Folder of a DatasetCache to reuse clones and conversions from
+            earlier downloads. Optional. Defaults to no cache.
+        cache_max_bytes: int
+            Size of the cache before the least recently used entries are
+            evicted. Optional. Defaults to 100 GiB.
         """
         ...
+
+    @classmethod
+    def download_and_featurize(
+        cls,
+        target_folder: str,
+        config=None,
+        num_workers: Optional[int] = None,
+        verbose: bool = False,
+        quiet: bool = False,
+        **download_kwargs,
+    ) -> str:
+        """
+        Download the dataset and extract log-mel features of all its audio.
+
+        The audio of the downloaded dataset is indexed with build_audio_index
+        and the features of every indexed file are extracted with
+        extract_features. Both steps only redo what changed.
+
+        Parameters
+        ----------
+        target_folder: str
+            The destination folder to download the dataset to. The dataset is
+            in a folder named after the class.
+        config: FeatureConfig
+            The feature parameters. Optional. Defaults to FeatureConfig().
+        num_workers: int
+            Number of processes extracting features.
+        verbose: bool
+            Whether to print the progress with steps.
+        quiet: bool
+            Prints nothing.
+        download_kwargs:
+            Passed on to download, e.g. shallow or cache_dir.
+
+        Returns
+        -------
+        str
+            Folder of the features, see load_features.
+        """
+        from os.path import join
+        from rifsdatasets.audio_index import INDEX_NAME, build_audio_index
+        from rifsdatasets.features import extract_features
+
+        cls.download(target_folder, verbose=verbose, quiet=quiet, **download_kwargs)
+        dataset_path = join(target_folder, cls.__name__)
+        build_audio_index(dataset_path, verbose=verbose, quiet=quiet)
+        return extract_features(
+            dataset_path,
+            INDEX_NAME,
+            config=config,
+            path_column="file",
+            num_workers=num_workers,
+            verbose=verbose,
+            quiet=quiet,
+        )
@@ -0,0 +1,411 @@
+"""
+Benchmark the download, convert, split and merge pipeline.
+
+Every stage runs on synthetic data generated offline: silent mp3 files, a
+local git repository standing in for the dataset remotes, a local http server,
+``alignments/**/segments.csv`` trees and datasets with split manifests. Each
+stage runs in its own process, so its peak memory is measured alone, and the
+wall time, files/s, MB/s and peak RSS of every stage are reported. Results can
+be saved as a baseline and later runs compared against it.
+
+Example
+-------
+    python -m rifsdatasets benchmark --scale medium --save baseline.json
+    python -m rifsdatasets benchmark --scale medium --compare baseline.json
+
+The module contains the following:
+
+    - run_benchmarks: Run the stages and return their results.
+    - compare: Compare results with a baseline.
+
+"""
+
+from typing import Dict, List, Optional
+
+import json
+import os
+import sys
+
+#: Multiplier of the number of files in every stage.
+SCALES = {"small": 1, "medium": 10, "large": 100}
+
+#: Stages in the order they run.
+STAGES = ["import", "clone", "download", "convert", "split", "merge"]
+
+# Silent MPEG-1 layer III frame, 128 kbit/s, 44.1 kHz, mono. Zeroed side
+# information decodes as silence, so valid mp3 files need no encoder.
+_MP3_FRAME = bytes([0xFF, 0xFB, 0x90, 0xC0]) + bytes(413)
+
+
+def run_benchmarks(
+    scale: str = "small",
+    stages: Optional[List[str]] = None,
+    workdir: Optional[str] = None,
+    quiet: bool = False,
+) -> Dict[str, dict]:
+    """
+    Run benchmark stages on synthetic data.
+
+    Parameters
+    ----------
+    scale: str
+        'small', 'medium' or 'large'.
+    stages: List[str]
+        Stages to run. Defaults to all of STAGES.
+    workdir: str
+        Folder for the synthetic data, kept after the run. Defaults to a
+        temporary folder that is removed.
+    quiet: bool
+        Prints nothing.
+
+    Returns
+    -------
+    Dict[str, dict]
+        For every stage the wall time in seconds, files, bytes, files per
+        second, MB per second and peak RSS in MB.
+    """
+    import subprocess
+    import tempfile
+
+    assert scale in SCALES, f"Scale must be one of {', '.join(SCALES)}."
+    stages = stages or STAGES
+    unknown = [stage for stage in stages if stage not in STAGES]
+    assert not unknown, f"Unknown stages: {', '.join(unknown)}."
+
+    package_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        filter(None, [package_root, env.get("PYTHONPATH")])
+    )
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        root = workdir or tmpdirname
+        for stage in stages:
+            stage_dir = os.path.join(root, stage)
+            os.makedirs(stage_dir, exist_ok=True)
+            _SETUP[stage](stage_dir, SCALES[scale])
+            process = subprocess.run(
+                [sys.executable, "-m", "rifsdatasets.benchmark", stage, stage_dir],
+                env=env,
+                capture_output=True,
+                text=True,
+            )
+            if process.returncode != 0:
+                raise RuntimeError(f"Stage {stage} failed:\n{process.stderr}")
+            results[stage] = json.loads(process.stdout.strip().splitlines()[-1])
+            if not quiet:
+                print(_format(stage, results[stage]))
+    return results
+
+
+def compare(
+    results: Dict[str, dict], baseline: Dict[str, dict], tolerance: float = 0.1
+) -> List[str]:
+    """
+    Compare benchmark results with a baseline.
+
+    Parameters
+    ----------
+    results: Dict[str, dict]
+        Results of run_benchmarks.
+    baseline: Dict[str, dict]
+        Saved results of an earlier run.
+    tolerance: float
+        Relative increase in wall time or peak RSS that counts as a
+        regression. Default is 0.1.
+
+    Returns
+    -------
+    List[str]
+        The regressions, empty if there are none.
+    """
+    regressions = []
+    for stage, result in results.items():
+        if stage not in baseline:
+            continue
+        for metric in ["seconds", "peak_rss_mb"]:
+            before, after = baseline[stage][metric], result[metric]
+            if before and after > before * (1 + tolerance):
+                regressions.append(
+                    f"{stage}: {metric} {before:.2f} -> {after:.2f} "
+                    f"(+{(after / before - 1) * 100:.0f}%)"
+                )
+    return regressions
+
+
+def _format(stage: str, result: dict) -> str:
+    """One line of the report."""
+    return (
+        f"{stage:<9} {result['seconds']:8.2f}s {result['files_per_second']:10.1f} "
+        f"files/s {result['megabytes_per_second']:8.1f} MB/s "
+        f"{result['peak_rss_mb']:8.1f} MB peak RSS"
+    )
+
+
+def _write_tree(folder: str, files: int, size: int, extension: str = ".txt"):
+    """Write files of size bytes into a tree of ten subfolders."""
+    for i in range(files):
+        subfolder = os.path.join(folder, f"{i % 10:02d}")
+        os.makedirs(subfolder, exist_ok=True)
+        with open(os.path.join(subfolder, f"{i:06d}{extension}"), "wb") as f:
+            f.write(os.urandom(size))
+
+
+def _write_wav(path: str, seconds: float, sample_rate: int = 16000):
+    """Write a wav file of noise."""
+    import wave
+
+    with wave.open(path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(os.urandom(int(seconds * sample_rate) * 2))
+
+
+def _setup_import(stage_dir: str, scale: int):
+    """Nothing to set up."""
+
+
+def _setup_clone(stage_dir: str, scale: int):
+    """A local git repository with text and audio folders."""
+    from git import Repo
+
+    remote = os.path.join(stage_dir, "remote")
+    if os.path.exists(remote):
+        return
+    _write_tree(os.path.join(remote, "text"), 100 * scale, 1 << 10)
+    _write_tree(os.path.join(remote, "audio"), 20 * scale, 64 << 10, ".mp3")
+    repo = Repo.init(remote)
+    repo.git.add(A=True)
+    identity = dict(
+        GIT_AUTHOR_NAME="bench",
+        GIT_AUTHOR_EMAIL="bench@localhost",
+        GIT_COMMITTER_NAME="bench",
+        GIT_COMMITTER_EMAIL="bench@localhost",
+    )
+    with repo.git.custom_environment(**identity):
+        repo.git.commit(m="Synthetic dataset")
+
+
+def _setup_download(stage_dir: str, scale: int):
+    """Files for the local http server."""
+    if not os.path.exists(os.path.join(stage_dir, "www")):
+        _write_tree(os.path.join(stage_dir, "www"), 16 * scale, 1 << 20, ".mp3")
+
+
+def _setup_convert(stage_dir: str, scale: int):
+    """Silent mp3 files of 30 seconds."""
+    folder = os.path.join(stage_dir, "mp3")
+    if os.path.exists(folder):
+        return
+    os.makedirs(folder)
+    for i in range(8 * scale):
+        with open(os.path.join(folder, f"{i:06d}.mp3"), "wb") as f:
+            f.write(_MP3_FRAME * 1150)
+
+
+def _setup_split(stage_dir: str, scale: int):
+    """A dataset with segments.csv files of 50 segments each."""
+    import pandas as pd
+
+    folder = os.path.join(stage_dir, "dataset", "alignments")
+    if os.path.exists(folder):
+        return
+    for i in range(100 * scale):
+        subfolder = os.path.join(folder, f"series{i % 7}", f"episode{i:06d}")
+        os.makedirs(subfolder)
+        pd.DataFrame(
+            {
+                "file": [f"{j}.wav" for j in range(50)],
+                "start": [j * 5.0 for j in range(50)],
+                "end": [j * 5.0 + 4.5 for j in range(50)],
+                "text": ["en to tre fire fem"] * 50,
+                "model_output": ["en to tre fire fem"] * 50,
+            }
+        ).to_csv(os.path.join(subfolder, "segments.csv"), index=False)
+
+
+def _setup_merge(stage_dir: str, scale: int):
+    """Two datasets with wav files and split manifests."""
+    import pandas as pd
+
+    for name in ["first", "second"]:
+        dataset = os.path.join(stage_dir, name)
+        if os.path.exists(dataset):
+            continue
+        os.makedirs(os.path.join(dataset, "audio"))
+        ids = []
+        for i in range(250 * scale):
+            _write_wav(os.path.join(dataset, "audio", f"{i:06d}.wav"), 1.0)
+            ids.append(f"{i:06d}")
+        for split in ["train", "valid", "test"]:
+            pd.DataFrame({"id": [f"audio/{i}.wav" for i in ids], "text": "hej"}).to_csv(
+                os.path.join(dataset, f"{split}.csv"), index=False
+            )
+        pd.DataFrame({"id": ids}).to_csv(os.path.join(dataset, "all.csv"), index=False)
+
+
+_SETUP = {
+    "import": _setup_import,
+    "clone": _setup_clone,
+    "download": _setup_download,
+    "convert": _setup_convert,
+    "split": _setup_split,
+    "merge": _setup_merge,
+}
+
+
+def _tree_size(folder: str, extension: str = ""):
+    """Number and total size of the files in a tree."""
+    files = size = 0
+    for dirpath, _, filenames in os.walk(folder):
+        for filename in filenames:
+            if filename.endswith(extension):
+                files += 1
+                size += os.path.getsize(os.path.join(dirpath, filename))
+    return files, size
+
+
+def _run_stage(stage: str, stage_dir: str) -> dict:
+    """
+    Run a stage in this process and measure it.
+
+    Parameters
+    ----------
+    stage: str
+        Name of the stage.
+    stage_dir: str
+        Folder of the synthetic data of the stage.
+
+    Returns
+    -------
+    dict
+        Wall time, files, bytes, rates and peak RSS.
+    """
+    import resource
+    import shutil
+    from time import perf_counter
+
+    output = os.path.join(stage_dir, "output")
+    shutil.rmtree(output, ignore_errors=True)
+    os.makedirs(output)
+
+    if stage == "import":
+        import subprocess
+
+        # This process has already imported the package, so time a fresh one.
+        code = (
+            "from time import perf_counter; start = perf_counter(); "
+            "import rifsdatasets; print(perf_counter() - start)"
+        )
+        process = subprocess.run(
+            [sys.executable, "-c", code], capture_output=True, text=True, check=True
+        )
+        seconds = float(process.stdout)
+        files = size = 0
+    elif stage == "clone":
+        from rifsdatasets.utils import clone_repository
+
+        files, size = _tree_size(os.path.join(stage_dir, "remote"))
+        start = perf_counter()
+        clone_repository(
+            "file://" + os.path.join(stage_dir, "remote"),
+            os.path.join(output, "clone"),
+            quiet=True,
+            shallow=True,
+        )
+        seconds = perf_counter() - start
+    elif stage == "download":
+        seconds, files, size = _run_download(stage_dir, output)
+    elif stage == "convert":
+        from rifsdatasets.utils import convert_mp3_files_to_wav
+
+        folder = os.path.join(stage_dir, "mp3")
+        files, size = _tree_size(folder)
+        start = perf_counter()
+        convert_mp3_files_to_wav(
+            [
+                (os.path.join(folder, name), os.path.join(output, name[:-4] + ".wav"))
+                for name in sorted(os.listdir(folder))
+            ],
+            quiet=True,
+            streaming=True,
+        )
+        seconds = perf_counter() - start
+    elif stage == "split":
+        from rifsdatasets.split_dataset import split_dataset
+
+        dataset = os.path.join(stage_dir, "dataset")
+        files, size = _tree_size(dataset, "segments.csv")
+        start = perf_counter()
+        split_dataset(dataset, split_method="duration", quiet=True)
+        seconds = perf_counter() - start
+    else:
+        from rifsdatasets.merge_rifsdatasets import merge_rifsdatasets
+
+        sources = [os.path.join(stage_dir, name) for name in ["first", "second"]]
+        files, size = map(sum, zip(*(_tree_size(source) for source in sources)))
+        start = perf_counter()
+        merge_rifsdatasets(sources, output, None, quiet=True, seed=0)
+        seconds = perf_counter() - start
+
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS.
+    unit = 1 if sys.platform == "darwin" else 1024
+    peak = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+    return dict(
+        seconds=seconds,
+        files=files,
+        bytes=size,
+        files_per_second=files / seconds if seconds else 0.0,
+        megabytes_per_second=size / 1e6 / seconds if seconds else 0.0,
+        peak_rss_mb=peak * unit / 2**20,
+    )
+
+
+def _run_download(stage_dir: str, output: str):
+    """Download the files of the stage from a local http server."""
+    from functools import partial
+    from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+    from threading import Thread
+    from time import perf_counter
+
+    from rifsdatasets.downloader import Downloader
+
+    www = os.path.join(stage_dir, "www")
+
+    class Handler(SimpleHTTPRequestHandler):
+        """Serve the stage files without logging every request."""
+
+        def log_message(self, *args):
+            """Log nothing."""
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), partial(Handler, directory=www))
+    Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    files, size = _tree_size(www)
+    try:
+        start = perf_counter()
+        with Downloader(quiet=True) as downloader:
+            for dirpath, _, filenames in os.walk(www):
+                os.makedirs(
+                    os.path.join(output, os.path.relpath(dirpath, www)), exist_ok=True
+                )
+                for filename in filenames:
+                    relpath = os.path.relpath(os.path.join(dirpath, filename), www)
+                    downloader.submit(
+                        f"{base}/{relpath}", os.path.join(output, relpath)
+                    )
+        seconds = perf_counter() - start
+    finally:
+        server.shutdown()
+    if downloader.errors:
+        raise RuntimeError(f"Downloads failed: {downloader.errors[:3]}")
+    return seconds, files, size
+
+
+if __name__ == "__main__":
+    print(json.dumps(_run_stage(sys.argv[1], sys.argv[2])))
@@ -0,0 +1,222 @@
+"""
+Local cache of cloned dataset repositories and converted audio.
+
+Entries are content addressed: cloned repositories are keyed by the url and
+commit, converted audio by the hash of the source file and the conversion
+parameters. Files are hardlinked or reflinked in and out of the cache when the
+filesystem allows it, so a dataset downloaded into a second folder costs
+neither a clone nor a conversion. The cache is bounded in size and the least
+recently used entries are evicted first.
+
+Note that hardlinked files share their content with the cache, so files in a
+dataset folder must not be modified in place.
+"""
+
+from typing import Iterable, Optional
+
+import hashlib
+import json
+import os
+import shutil
+import uuid
+
+from rifsdatasets.utils import link_or_copy, link_tree
+
+DEFAULT_CACHE_DIR = os.environ.get(
+    "RIFSDATASETS_CACHE",
+    os.path.join(os.path.expanduser("~"), ".cache", "rifsdatasets"),
+)
+
+#: Size of a cache before the least recently used entries are evicted.
+DEFAULT_MAX_BYTES = 100 * 2**30
+
+
+class DatasetCache:
+    """
+    Persistent, size-bounded cache of dataset repositories and audio.
+
+    Every entry is a folder ``<root>/<key[:2]>/<key>`` holding the cached
+    file or tree in ``data`` and its size in ``entry.json``. The modification
+    time of ``entry.json`` is updated on every hit and used for eviction.
+    """
+
+    def __init__(self, root: Optional[str] = None, max_bytes: Optional[int] = None):
+        """
+        Initialize the cache.
+
+        Parameters
+        ----------
+        root: str
+            Folder of the cache. Defaults to $RIFSDATASETS_CACHE or
+            ~/.cache/rifsdatasets.
+        max_bytes: int
+            Size of the cache before the least recently used entries are
+            evicted. Defaults to DEFAULT_MAX_BYTES, 100 GiB.
+        """
+        self.root = root or DEFAULT_CACHE_DIR
+        self.max_bytes = DEFAULT_MAX_BYTES if max_bytes is None else max_bytes
+        os.makedirs(self.root, exist_ok=True)
+
+    @staticmethod
+    def repo_key(url: str, commit: str, **options) -> str:
+        """
+        Get the key of a cloned repository.
+
+        Parameters
+        ----------
+        url: str
+            Url of the repository.
+        commit: str
+            The commit that was checked out.
+        options:
+            Clone options changing the checked out tree, e.g. sparse_paths.
+
+        Returns
+        -------
+        str
+            The key.
+        """
+        blob = json.dumps(["repo", url, commit, options], sort_keys=True)
+        return hashlib.sha256(blob.encode()).hexdigest()
+
+    @staticmethod
+    def audio_key(src: str, **options) -> str:
+        """
+        Get the key of a converted audio file.
+
+        Parameters
+        ----------
+        src: str
+            Path to the source audio file, its content is hashed.
+        options:
+            Conversion parameters, e.g. sample_rate and channels.
+
+        Returns
+        -------
+        str
+            The key.
+        """
+        sha256 = hashlib.sha256()
+        with open(src, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                sha256.update(chunk)
+        blob = json.dumps(["audio", sha256.hexdigest(), options], sort_keys=True)
+        return hashlib.sha256(blob.encode()).hexdigest()
+
+    def _entry(self, key: str) -> str:
+        """
+        Get the folder of an entry.
+
+        Parameters
+        ----------
+        key: str
+            Key of the entry.
+
+        Returns
+        -------
+        str
+            Path to the entry folder.
+        """
+        return os.path.join(self.root, key[:2], key)
+
+    def get(self, key: str, dst: str) -> bool:
+        """
+        Link a cached entry to dst.
+
+        Parameters
+        ----------
+        key: str
+            Key of the entry.
+        dst: str
+            Destination file, or folder for cached trees.
+
+        Returns
+        -------
+        bool
+            Whether the entry was in the cache.
+        """
+        entry = self._entry(key)
+        data = os.path.join(entry, "data")
+        try:
+            os.utime(os.path.join(entry, "entry.json"))
+        except FileNotFoundError:
+            return False
+        try:
+            if os.path.isdir(data):
+                link_tree(data, dst)
+            else:
+                if os.path.lexists(dst):
+                    os.remove(dst)
+                link_or_copy(data, dst)
+        except FileNotFoundError:
+            # Evicted by another process while linking.
+            return False
+        return True
+
+    def put(self, key: str, src: str, ignore: Iterable[str] = ()):
+        """
+        Add a file or tree to the cache.
+
+        Parameters
+        ----------
+        key: str
+            Key of the entry.
+        src: str
+            The file or folder to cache.
+        ignore: Iterable[str]
+            Names of top-level files or folders in src not to cache.
+
+        Returns
+        -------
+        None
+        """
+        entry = self._entry(key)
+        if os.path.exists(entry):
+            return
+        os.makedirs(os.path.dirname(entry), exist_ok=True)
+        tmp = os.path.join(self.root, f"tmp-{uuid.uuid4().hex}")
+        os.mkdir(tmp)
+        data = os.path.join(tmp, "data")
+        if os.path.isdir(src):
+            size = link_tree(src, data, ignore=ignore).bytes
+        else:
+            link_or_copy(src, data)
+            size = os.path.getsize(data)
+        with open(os.path.join(tmp, "entry.json"), "w") as f:
+            json.dump({"size": size}, f)
+        try:
+            os.rename(tmp, entry)
+        except OSError:
+            # Added by another process in the meantime.
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    def evict(self) -> int:
+        """
+        Remove the least recently used entries until the cache fits.
+
+        Returns
+        -------
+        int
+            Number of bytes evicted.
+        """
+        entries = []
+        for prefix in os.listdir(self.root):
+            if prefix.startswith("tmp-"):
+                continue
+            for key in os.listdir(os.path.join(self.root, prefix)):
+                meta = os.path.join(self.root, prefix, key, "entry.json")
+                try:
+                    with open(meta) as f:
+                        size = json.load(f)["size"]
+                    entries.append((os.path.getmtime(meta), size, key))
+                except (FileNotFoundError, ValueError):
+                    continue
+
+        total = sum(size for _, size, _ in entries)
+        evicted = 0
+        for _, size, key in sorted(entries):
+            if total - evicted <= self.max_bytes:
+                break
+            shutil.rmtree(self._entry(key), ignore_errors=True)
+            evicted += size
+        return evicted
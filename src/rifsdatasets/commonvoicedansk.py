@@ -4,14 +4,25 @@ This module contains the Danpass dataset.
 
 from rifsdatasets.base import Base
 
+from typing import Optional
+
 
 class CommonVoiceDansk(Base):
     """
     Dataset for the DanPASS dataset.
     """
 
+    repo_url = "git@github.com:rifs-is-free-speech/CommonVoiceDansk.git"
+
     @staticmethod
-    def download(target_folder: str, verbose: bool = False, quiet: bool = False):
+    def download(
+        target_folder: str,
+        verbose: bool = False,
+        quiet: bool = False,
+        shallow: bool = False,
+        cache_dir: Optional[str] = None,
+        cache_max_bytes: Optional[int] = None,
+    ):
         """
         Download the dataset to the specified destination.
 
@@ -23,6 +34,15 @@ class CommonVoiceDansk(Base):
             Whether to print the download progress with steps.
         quiet: bool
             Prints nothing.
+        shallow: bool
+            Clone only the latest commit of the default branch and check out
+            only the files the dataset uses.
+        cache_dir: str
+            Folder of a DatasetCache to reuse clones and conversions from
+            earlier downloads. Optional. Defaults to no cache.
+        cache_max_bytes: int
+            Size of the cache before the least recently used entries are
+            evicted. Optional. Defaults to 100 GiB.
 
         Returns
         -------
@@ -30,9 +50,9 @@ class CommonVoiceDansk(Base):
 
         """
         from tempfile import TemporaryDirectory
-        from rifsdatasets.utils import CloneProgress
-        from git import Repo
-        from shutil import move
+        from rifsdatasets.cache import DatasetCache
+        from rifsdatasets.utils import clone_repository
+        from rifsdatasets.utils import move
 
         import os
         from os.path import join
@@ -49,13 +69,18 @@ class CommonVoiceDansk(Base):
                 )
             return
 
-        with TemporaryDirectory() as tmpdirname:
+        cache = DatasetCache(cache_dir, cache_max_bytes) if cache_dir else None
+        os.makedirs(target_folder, exist_ok=True)
+        with TemporaryDirectory(dir=target_folder) as tmpdirname:
             if verbose and not quiet:
                 print("Created temporary directory", tmpdirname)
-            Repo.clone_from(
-                url="git@github.com:rifs-is-free-speech/CommonVoiceDansk.git",
-                to_path=tmpdirname,
-                progress=None if quiet else CloneProgress(),
+            clone_repository(
+                CommonVoiceDansk.repo_url,
+                tmpdirname,
+                quiet=quiet,
+                shallow=shallow,
+                cache=cache,
+                sparse_paths=["audio"],
             )
             if verbose and not quiet:
                 print("Download complete!")
@@ -44,17 +44,41 @@ year
 
 from rifsdatasets.base import Base
 
+from typing import Optional
+
 
 class Den2Radio(Base):
     """
     Dataset for Den2Radio dataset.
     """
 
+    repo_url = "git@github.com:rifs-is-free-speech/Den2Radio.git"
+
     @staticmethod
-    def download(target_folder: str, verbose: bool = False, quiet: bool = False):
+    def download(
+        target_folder: str,
+        verbose: bool = False,
+        quiet: bool = False,
+        sample_rate: Optional[int] = None,
+        channels: Optional[int] = None,
+        num_workers: Optional[int] = None,
+        max_connections: int = 8,
+        max_connections_per_host: int = 4,
+        verify: bool = False,
+        shallow: bool = False,
+        cache_dir: Optional[str] = None,
+        cache_max_bytes: Optional[int] = None,
+        incremental: bool = False,
+        prune: bool = False,
+    ):
         """
         Download the dataset to the specified destination.
 
+        Episodes are downloaded concurrently and handed to a pool of worker
+        processes for conversion as soon as they are on disk. Every download
+        is recorded in manifest.json, and interrupted mp3 downloads are kept
+        in downloads/ and resumed on the next call.
+
         Parameters
         ----------
         target_folder: str
@@ -63,25 +87,69 @@ class Den2Radio(Base):
             Whether to print the download progress with steps.
         quiet: bool
             Prints nothing.
+        sample_rate: int
+            Resample the wav files to this sample rate, e.g. 16000. Optional.
+        channels: int
+            Downmix the wav files to this number of channels. Optional.
+        num_workers: int
+            Number of processes converting mp3 to wav. Defaults to the number
+            of cpus.
+        max_connections: int
+            Number of concurrent downloads.
+        max_connections_per_host: int
+            Maximum number of concurrent connections to a single host.
+        verify: bool
+            Only check the downloaded files against manifest.json.
+        shallow: bool
+            Clone only the latest commit of the default branch and check out
+            only the files the dataset uses.
+        cache_dir: str
+            Folder of a DatasetCache to reuse clones and conversions from
+            earlier downloads. Optional. Defaults to no cache.
+        cache_max_bytes: int
+            Size of the cache before the least recently used entries are
+            evicted. Optional. Defaults to 100 GiB.
+        incremental: bool
+            Diff all.csv against manifest.json from the last run and only
+            download episode files that are not converted yet or whose row in
+            all.csv changed, instead of checking every wav on disk. The
+            metadata repository is only cloned if its HEAD moved since the
+            last run. The first run without a manifest checks the files.
+        prune: bool
+            With incremental, delete the files of episodes that are no longer
+            in all.csv.
 
         Returns
         -------
-        None
+        None or List[Tuple[str, str]]
+            With verify the urls and problems found.
 
         """
         import os
-        import pydub
-        import requests
         import pandas as pd
 
-        from rifsdatasets.utils import CloneProgress, convert_mp3_to_wav
+        from rifsdatasets.downloader import (
+            Downloader,
+            DownloadManifest,
+            verify_manifest,
+        )
+        from rifsdatasets.utils import (
+            ConversionPool,
+            clone_repository,
+            remote_head,
+            write_errors,
+        )
+        from functools import partial
         from tempfile import TemporaryDirectory
-        from git import Repo
-        from shutil import move
-        from urllib.parse import unquote
+        from rifsdatasets.cache import DatasetCache
+        from rifsdatasets.utils import move
         from os.path import join
 
         target = join(target_folder, "Den2Radio")
+        if verify:
+            return verify_manifest(
+                join(target, "manifest.json"), verbose=verbose, quiet=quiet
+            )
         if verbose and not quiet:
             print(f"Downloading Den2Radio to '{target_folder}'")
         if os.path.exists(target):
@@ -92,69 +160,183 @@ class Den2Radio(Base):
                     sep="\n",
                 )
         else:
-            os.mkdir(target)
-            os.mkdir(join(target, "audio"))
+            os.makedirs(join(target, "audio"))
 
-        with TemporaryDirectory() as tmpdirname:
+        cache = DatasetCache(cache_dir, cache_max_bytes) if cache_dir else None
+        manifest = DownloadManifest(join(target, "manifest.json"))
+        source = join(target, "downloads")
+        os.makedirs(source, exist_ok=True)
+
+        # all.csv is recorded under the repository url with the commit it
+        # came from, so an unchanged repository is not cloned again.
+        metadata = manifest.get(Den2Radio.repo_url)
+        head = remote_head(Den2Radio.repo_url) if incremental else None
+        if (
+            head is not None
+            and metadata.get("commit") == head
+            and os.path.exists(join(target, "all.csv"))
+        ):
             if verbose and not quiet:
-                print("Created temporary directory", tmpdirname)
-            Repo.clone_from(
-                url="git@github.com:rifs-is-free-speech/Den2Radio.git",
-                to_path=tmpdirname,
-                progress=None if quiet else CloneProgress(),
+                print(f"Metadata is up to date at {head[:8]}")
+            df = pd.read_csv(join(target, "all.csv"))
+        else:
+            os.makedirs(target_folder, exist_ok=True)
+            with TemporaryDirectory(dir=target_folder) as tmpdirname:
+                if verbose and not quiet:
+                    print("Created temporary directory", tmpdirname)
+                clone_repository(
+                    Den2Radio.repo_url,
+                    tmpdirname,
+                    quiet=quiet,
+                    shallow=shallow,
+                    cache=cache,
+                    sparse_paths=[],
+                )
+                df = pd.read_csv(join(tmpdirname, "all.csv"))
+                move(join(tmpdirname, "all.csv"), join(target, "all.csv"))
+            manifest.update(
+                Den2Radio.repo_url,
+                path="all.csv",
+                size=os.path.getsize(join(target, "all.csv")),
+                status="downloaded",
+                commit=head,
             )
-            source = join(tmpdirname, "audio")
-            os.mkdir(source)
-
-            df = pd.read_csv(join(tmpdirname, "all.csv"))
-            move(join(tmpdirname, "all.csv"), join(target, "all.csv"))
 
-            for i, row in df.iterrows():
-                if verbose and not quiet:
-                    print(f"\nProcessing episode {i+1}/{len(df)}")
-                elif not quiet:
-                    print(f"\rProcessing episode {i+1}/{len(df)}", end="")
-
-                if not os.path.exists(join(source, str(row.year))):
-                    os.mkdir(join(source, str(row.year)))
-                if not os.path.exists(join(target, "audio", str(row.year))):
-                    os.mkdir(join(target, "audio", str(row.year)))
-
-                for idx, link in enumerate(eval(row.download_links)):
-                    new_link = unquote(link)
-                    link = link.replace(
-                        "http://den2radio.dk/assets/download.php?file=", ""
-                    )
-                    filename = (
-                        new_link.split("/")[-1]
-                        .replace(" ", "_")
-                        .replace("_-", "")
-                        .replace("__", "_")
-                    )
-                    dist = join(
-                        target, "audio", str(row.year), filename.replace(".mp3", ".wav")
-                    )
-                    if os.path.exists(dist):
-                        if verbose and not quiet:
-                            print(f"Skipping {filename} because it already exists.")
-                        continue
+        def converted(url: str, mp3: str, dist: str, row: str, error: Optional[str]):
+            """Record a finished conversion and remove the mp3 if it succeeded."""
+            if error is None:
+                if os.path.exists(mp3):
+                    os.remove(mp3)
+                outputs = {manifest.relpath(dist): os.path.getsize(dist)}
+                manifest.update(url, status="converted", outputs=outputs, row=row)
+            else:
+                manifest.update(url, status="failed", error=error)
 
+        pool = ConversionPool(
+            num_workers,
+            verbose=verbose,
+            quiet=quiet,
+            streaming=True,
+            sample_rate=sample_rate,
+            channels=channels,
+            cache=cache,
+        )
+        downloader = Downloader(
+            max_workers=max_connections,
+            max_per_host=max_connections_per_host,
+            manifest=manifest,
+            verbose=verbose,
+            quiet=quiet,
+        )
+        files = _episode_files(df, target)
+        episodes = {
+            url: entry
+            for url, entry in manifest.entries.items()
+            if url != Den2Radio.repo_url
+        }
+        if incremental and episodes:
+            # Entries from before rows were recorded count as unchanged.
+            synced = {
+                url: entry.get("row")
+                for url, entry in episodes.items()
+                if entry.get("status") == "converted"
+            }
+            stored = files["url"].map(synced)
+            changed = stored.notna() & (stored != files["row"])
+            todo = files[~files["url"].isin(synced) | changed]
+            removed = set(episodes) - set(files["url"])
+            if not quiet:
+                print(
+                    f"Syncing {len(todo)} new or changed files,",
+                    f"{len(removed)} files removed from all.csv",
+                )
+            if prune:
+                for url in removed:
+                    entry = manifest.get(url)
+                    for path in [entry.get("path"), *entry.get("outputs", {})]:
+                        if path and os.path.exists(manifest.abspath(path)):
+                            os.remove(manifest.abspath(path))
+                    manifest.remove(url)
                     if verbose and not quiet:
-                        print(f"Downloading mp3: {filename}")
+                        print(f"Pruned {url}")
+        else:
+            todo = files[~files["wav"].map(os.path.exists)]
+            if verbose and not quiet:
+                print(f"Skipping {len(files) - len(todo)} files that already exist.")
 
-                    mp3 = requests.get(link)
-                    with open(join(source, str(row.year), filename), "wb") as f:
-                        f.write(mp3.content)
+        for year in todo["year"].unique():
+            os.makedirs(join(source, year), exist_ok=True)
+            os.makedirs(join(target, "audio", year), exist_ok=True)
 
-                    if verbose and not quiet:
-                        print(f"Converting mp3 to wav and moving to {dist}")
-                    try:
-                        convert_mp3_to_wav(
-                            join(source, str(row.year), filename),
-                            dist,
-                        )
-                    except pydub.exceptions.CouldntDecodeError:
-                        print(f"Could not decode {filename} at {link}")
-                        with open(join(target, "errors.txt"), "a+") as f:
-                            f.write(link + "\n")
-                        continue
+        with manifest, pool, downloader:
+            for url, mp3, dist, row in zip(
+                todo["url"], todo["mp3"], todo["wav"], todo["row"]
+            ):
+                convert = partial(
+                    pool.submit, mp3, dist, partial(converted, url, mp3, dist, row)
+                )
+                if os.path.exists(mp3):
+                    convert()
+                else:
+                    downloader.submit(url, mp3, convert)
+
+        if not quiet:
+            print(
+                f"Downloaded {downloader.files} files",
+                f"({downloader.bytes / 1e6:.1f} MB)",
+            )
+        # errors.txt lists the link of every failed episode, one per line.
+        links = dict(zip(todo["mp3"], todo["url"]))
+        failed = [(links.get(mp3, mp3), error) for mp3, error in pool.report.errors]
+        write_errors(target, downloader.errors + failed, messages=False)
+
+
+def _episode_files(df, target: str):
+    """
+    List the files to download for every episode in all.csv.
+
+    Parameters
+    ----------
+    df: pd.DataFrame
+        The all.csv of Den2Radio.
+    target: str
+        Path to the Den2Radio folder.
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per download link with the columns url, year, mp3, wav and
+        row, where mp3 and wav are the paths of the download and converted
+        file and row is a hash of the row of the episode in all.csv.
+    """
+    from ast import literal_eval
+    from os.path import join
+    from urllib.parse import unquote
+
+    import pandas as pd
+
+    links = df[["year", "download_links"]].copy()
+    links["row"] = pd.util.hash_pandas_object(df, index=False).astype(str)
+    links["year"] = links["year"].astype(str)
+    links["link"] = links["download_links"].map(literal_eval)
+    links = links.explode("link").dropna(subset=["link"])
+
+    filename = (
+        links["link"]
+        .map(unquote)
+        .str.split("/")
+        .str[-1]
+        .str.replace(" ", "_", regex=False)
+        .str.replace("_-", "", regex=False)
+        .str.replace("__", "_", regex=False)
+    )
+    url = links["link"].str.replace(
+        "http://den2radio.dk/assets/download.php?file=", "", regex=False
+    )
+    downloads = join(target, "downloads", "")
+    audio = join(target, "audio", "")
+    return links.assign(
+        url=url,
+        mp3=downloads + links["year"] + "/" + filename,
+        wav=audio + links["year"] + "/" + filename.str.replace(".mp3", ".wav"),
+    )[["url", "year", "mp3", "wav", "row"]].reset_index(drop=True)
@@ -0,0 +1,672 @@
+"""
+Concurrent HTTP downloads for the rifs datasets.
+
+The module contains:
+
+    - Downloader: Thread pool downloading files over a pooled session.
+    - DownloadManifest: Per-dataset record of downloaded urls.
+    - download_file: Stream a single url to disk, resuming partial files.
+    - fetch_spooled: Stream a single url into a spooled temporary file.
+    - verify_manifest: Check a downloaded tree against its manifest.
+
+"""
+
+from threading import BoundedSemaphore, Lock
+from time import monotonic
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+import hashlib
+import json
+import os
+
+from rifsdatasets.instrument import span
+from rifsdatasets.utils import connection_slot
+
+
+def download_file(
+    session,
+    url: str,
+    dst: str,
+    chunk_size: int = 1 << 20,
+    etag: Optional[str] = None,
+    last_modified: Optional[str] = None,
+    size: Optional[int] = None,
+    on_response: Optional[Callable[[dict], None]] = None,
+) -> dict:
+    """
+    Stream a url to disk in chunks.
+
+    The file is written to ``dst.part`` and renamed into place when complete.
+    If a ``dst.part`` is left from an interrupted download only the missing
+    bytes are requested with a HTTP Range header. With the etag or
+    last_modified of the earlier attempt the range is conditional, so a
+    changed file on the server is downloaded from scratch. Without them a
+    file whose size differs from size is downloaded from scratch as well.
+
+    Parameters
+    ----------
+    session: requests.Session
+        Session used for the request.
+    url: str
+        The url to download.
+    dst: str
+        Path to the destination file.
+    chunk_size: int
+        Number of bytes read and written at a time.
+    etag: str
+        ETag of the partial file from an earlier attempt. Optional.
+    last_modified: str
+        Last-Modified of the partial file from an earlier attempt. Optional.
+    size: int
+        Size of the whole file from an earlier attempt. Optional.
+    on_response: Callable[[dict], None]
+        Called with the size, etag and last_modified of the file as soon as
+        the response arrives, so they can be stored before the body is
+        downloaded. Optional.
+
+    Returns
+    -------
+    dict
+        size, etag, last_modified and sha256 of the downloaded file and the
+        number of bytes transferred in this call.
+
+    Raises
+    ------
+    IOError
+        If the downloaded file does not have the size the server announced.
+        The partial file is kept, so the download can be resumed.
+    """
+    with span("fetch", url=url) as event:
+        info = _download_file(
+            session, url, dst, chunk_size, etag, last_modified, size, on_response
+        )
+        event.files, event.bytes = 1, info["transferred"]
+    return info
+
+
+def _download_file(
+    session,
+    url: str,
+    dst: str,
+    chunk_size: int = 1 << 20,
+    etag: Optional[str] = None,
+    last_modified: Optional[str] = None,
+    size: Optional[int] = None,
+    on_response: Optional[Callable[[dict], None]] = None,
+) -> dict:
+    """
+    Stream a url to disk in chunks, see download_file.
+
+    Returns
+    -------
+    dict
+        size, etag, last_modified, sha256 and bytes transferred.
+    """
+    tmp = f"{dst}.part"
+    offset = os.path.getsize(tmp) if os.path.exists(tmp) else 0
+    # If-Range needs a strong validator.
+    validator = etag if etag and not etag.startswith("W/") else last_modified
+    headers = {}
+    if offset:
+        headers["Range"] = f"bytes={offset}-"
+        if validator:
+            headers["If-Range"] = validator
+
+    def restart():
+        """Remove the partial file and download the whole file."""
+        os.remove(tmp)
+        return _download_file(session, url, dst, chunk_size, on_response=on_response)
+
+    transferred = 0
+    with session.get(url, stream=True, timeout=60, headers=headers) as r:
+        if r.status_code == 416:
+            # The partial file already holds every byte of the resource.
+            total = r.headers.get("Content-Range", "").rpartition("/")[2]
+            if total != str(offset):
+                return restart()
+            expected = offset
+        else:
+            r.raise_for_status()
+            if r.status_code == 206:
+                total = r.headers.get("Content-Range", "").rpartition("/")[2]
+                if size is not None and total != str(size):
+                    return restart()
+                expected = int(total) if total.isdigit() else None
+            else:
+                offset = 0
+                length = r.headers.get("Content-Length")
+                expected = int(length) if length and length.isdigit() else None
+            etag = r.headers.get("ETag")
+            last_modified = r.headers.get("Last-Modified")
+            if r.headers.get("Content-Encoding", "identity") != "identity":
+                # The body is decoded, so the announced size does not apply.
+                expected = None
+            if on_response is not None:
+                on_response(dict(size=expected, etag=etag, last_modified=last_modified))
+
+        sha256 = hashlib.sha256()
+        if offset:
+            with open(tmp, "rb") as f:
+                for chunk in iter(lambda: f.read(chunk_size), b""):
+                    sha256.update(chunk)
+
+        if r.status_code != 416:
+            with open(tmp, "ab" if offset else "wb") as f:
+                for chunk in r.iter_content(chunk_size=chunk_size):
+                    f.write(chunk)
+                    sha256.update(chunk)
+                    transferred += len(chunk)
+
+    if expected is not None and os.path.getsize(tmp) != expected:
+        raise IOError(
+            f"Downloaded {os.path.getsize(tmp)} of {expected} bytes from {url}"
+        )
+    os.replace(tmp, dst)
+    return dict(
+        size=os.path.getsize(dst),
+        etag=etag,
+        last_modified=last_modified,
+        sha256=sha256.hexdigest(),
+        transferred=transferred,
+    )
+
+
+def fetch_spooled(
+    session,
+    url: str,
+    chunk_size: int = 1 << 20,
+    max_size: int = 1 << 28,
+):
+    """
+    Stream a url into a spooled temporary file.
+
+    The body is kept in memory up to max_size bytes and only spills to a
+    temporary file beyond that, so it is not written to the dataset and read
+    back again. Unlike download_file an interrupted fetch cannot be resumed.
+
+    Parameters
+    ----------
+    session: requests.Session
+        Session used for the request.
+    url: str
+        The url to download.
+    chunk_size: int
+        Number of bytes read and written at a time.
+    max_size: int
+        Number of bytes kept in memory before spilling to disk.
+
+    Returns
+    -------
+    Tuple[tempfile.SpooledTemporaryFile, dict]
+        The body, rewound to the start, and its size, etag, sha256 and the
+        number of bytes transferred. The caller closes the file.
+    """
+    from tempfile import SpooledTemporaryFile
+
+    with span("fetch", url=url) as event:
+        buffer = SpooledTemporaryFile(max_size=max_size)
+        sha256 = hashlib.sha256()
+        try:
+            with session.get(url, stream=True, timeout=60) as r:
+                r.raise_for_status()
+                etag = r.headers.get("ETag")
+                for chunk in r.iter_content(chunk_size=chunk_size):
+                    buffer.write(chunk)
+                    sha256.update(chunk)
+        except BaseException:
+            buffer.close()
+            raise
+        size = buffer.tell()
+        buffer.seek(0)
+        event.files, event.bytes = 1, size
+    return buffer, dict(
+        size=size, etag=etag, sha256=sha256.hexdigest(), transferred=size
+    )
+
+
+class DownloadManifest:
+    """
+    Record of the downloaded urls of a dataset, stored as json.
+
+    Every url maps to an entry with the local path, size, ETag, Last-Modified,
+    sha256 and a status: 'partial' while the file is downloaded,
+    'downloaded', 'converted', 'extracted' or 'failed'. The size and
+    validators are stored as soon as the server responds, so a failed
+    download can be resumed. Files produced from a download, e.g. the
+    converted wav, are listed in 'outputs' with their sizes. Paths are stored
+    relative to the manifest so the dataset folder can be moved.
+    """
+
+    def __init__(self, path: str, save_interval: float = 5.0):
+        """
+        Load the manifest at path if it exists.
+
+        Parameters
+        ----------
+        path: str
+            Path to the manifest json file.
+        save_interval: float
+            Minimum number of seconds between writes while updating.
+        """
+        self.path = path
+        self.root = os.path.dirname(os.path.abspath(path))
+        self.save_interval = save_interval
+        self.entries: Dict[str, dict] = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.entries = json.load(f)
+        self._lock = Lock()
+        self._saved = monotonic()
+
+    def __enter__(self):
+        """Use the manifest as a context manager saving on exit."""
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Save the manifest."""
+        self.save()
+
+    def relpath(self, path: str) -> str:
+        """
+        Get path relative to the manifest folder.
+
+        Parameters
+        ----------
+        path: str
+            Path to a file in the dataset.
+
+        Returns
+        -------
+        str
+            The relative path.
+        """
+        return os.path.relpath(os.path.abspath(path), self.root)
+
+    def abspath(self, path: str) -> str:
+        """
+        Get the absolute path of a path stored in the manifest.
+
+        Parameters
+        ----------
+        path: str
+            Path relative to the manifest folder.
+
+        Returns
+        -------
+        str
+            The absolute path.
+        """
+        return os.path.join(self.root, path)
+
+    def get(self, url: str) -> dict:
+        """
+        Get the entry of url.
+
+        Parameters
+        ----------
+        url: str
+            The downloaded url.
+
+        Returns
+        -------
+        dict
+            The entry, empty if the url is not in the manifest.
+        """
+        with self._lock:
+            return dict(self.entries.get(url, {}))
+
+    def update(self, url: str, **fields):
+        """
+        Update the entry of url and save periodically.
+
+        Parameters
+        ----------
+        url: str
+            The downloaded url.
+        fields:
+            Fields of the entry to set.
+
+        Returns
+        -------
+        None
+        """
+        with self._lock:
+            self.entries.setdefault(url, {}).update(fields)
+            if monotonic() - self._saved > self.save_interval:
+                self._save()
+
+    def remove(self, url: str):
+        """
+        Remove the entry of url.
+
+        Parameters
+        ----------
+        url: str
+            The downloaded url.
+
+        Returns
+        -------
+        None
+        """
+        with self._lock:
+            self.entries.pop(url, None)
+
+    def save(self):
+        """
+        Write the manifest atomically.
+
+        Returns
+        -------
+        None
+        """
+        with self._lock:
+            self._save()
+
+    def _save(self):
+        """
+        Write the manifest, the lock must be held.
+
+        Returns
+        -------
+        None
+        """
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.entries, f, indent=1, sort_keys=True)
+        os.replace(tmp, self.path)
+        self._saved = monotonic()
+
+
+def verify_manifest(
+    path: str,
+    check_hash: bool = False,
+    verbose: bool = False,
+    quiet: bool = False,
+) -> List[Tuple[str, str]]:
+    """
+    Check a downloaded tree against its manifest without downloading.
+
+    By default only existence and sizes are compared, which needs a single
+    stat per file. With check_hash the sha256 of downloaded files still on
+    disk is recomputed as well.
+
+    Parameters
+    ----------
+    path: str
+        Path to the manifest json file.
+    check_hash: bool
+        Also compare the sha256 of downloaded files.
+    verbose: bool
+        Print every problem found.
+    quiet: bool
+        Prints nothing.
+
+    Returns
+    -------
+    List[Tuple[str, str]]
+        Pairs of url and a description of the problem.
+    """
+    manifest = DownloadManifest(path)
+    problems = []
+    for url, entry in manifest.entries.items():
+        status = entry.get("status")
+        if status not in ("downloaded", "converted", "extracted"):
+            problems.append((url, f"status is {status}"))
+            continue
+        files = dict(entry.get("outputs", {}))
+        if status == "downloaded":
+            files[entry["path"]] = entry["size"]
+        for file, size in files.items():
+            file = manifest.abspath(file)
+            if not os.path.exists(file):
+                problems.append((url, f"{file} is missing"))
+            elif os.path.getsize(file) != size:
+                problems.append((url, f"{file} has the wrong size"))
+        if check_hash and status == "downloaded" and entry.get("sha256"):
+            file = manifest.abspath(entry["path"])
+            if os.path.exists(file) and _sha256(file) != entry["sha256"]:
+                problems.append((url, f"{file} has the wrong sha256"))
+
+    if verbose and not quiet:
+        for url, problem in problems:
+            print(f"{url}: {problem}")
+    if not quiet:
+        print(f"Verified {len(manifest.entries)} downloads, {len(problems)} problems")
+    return problems
+
+
+def _sha256(path: str, chunk_size: int = 1 << 20) -> str:
+    """
+    Compute the sha256 of a file.
+
+    Parameters
+    ----------
+    path: str
+        Path to the file.
+    chunk_size: int
+        Number of bytes read at a time.
+
+    Returns
+    -------
+    str
+        The hex digest.
+    """
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+class Downloader:
+    """
+    Download files concurrently over a pooled requests session.
+
+    Downloads run on a thread pool and each host gets at most max_per_host
+    open connections. A callback can be given per file, which is called from
+    the download thread when the file is on disk. This is used to hand files
+    to a ConversionPool so network and cpu are busy at the same time. Urls
+    the manifest records as downloaded are skipped while their file is on
+    disk with the recorded size.
+
+    Example
+    -------
+    >>> with ConversionPool() as pool, Downloader() as downloader:
+    ...     downloader.submit(url, "a.mp3", lambda: pool.submit("a.mp3", "a.wav"))
+    """
+
+    def __init__(
+        self,
+        max_workers: int = 8,
+        max_per_host: int = 4,
+        chunk_size: int = 1 << 20,
+        headers: Optional[Dict[str, str]] = None,
+        retries: int = 3,
+        manifest: Optional[DownloadManifest] = None,
+        verbose: bool = False,
+        quiet: bool = False,
+    ):
+        """
+        Initialize the downloader.
+
+        Parameters
+        ----------
+        max_workers: int
+            Number of concurrent downloads.
+        max_per_host: int
+            Maximum number of concurrent connections to a single host.
+        chunk_size: int
+            Number of bytes read and written at a time.
+        headers: Dict[str, str]
+            Headers sent with every request. Optional.
+        retries: int
+            Number of retries on connection errors and 5xx responses.
+        manifest: DownloadManifest
+            Manifest recording every download. Optional.
+        verbose: bool
+            Print every downloaded file.
+        quiet: bool
+            Prints nothing.
+        """
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        self.max_workers = max_workers
+        self.max_per_host = max_per_host
+        self.chunk_size = chunk_size
+        self.verbose = verbose
+        self.quiet = quiet
+        self.manifest = manifest
+        self.errors: List[Tuple[str, str]] = []
+        self.bytes = 0
+        self.files = 0
+        self.skipped = 0
+
+        self.session = requests.Session()
+        if headers:
+            self.session.headers.update(headers)
+        adapter = HTTPAdapter(
+            pool_connections=max_workers,
+            pool_maxsize=max_workers,
+            max_retries=Retry(
+                total=retries, backoff_factor=0.5, status_forcelist=[502, 503, 504]
+            ),
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._hosts: Dict[str, BoundedSemaphore] = {}
+        self._lock = Lock()
+        self._executor = None
+
+    def __enter__(self):
+        """Start the download threads."""
+        from concurrent.futures import ThreadPoolExecutor
+
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Wait for all downloads and close the session."""
+        self._executor.shutdown(wait=True)
+        self.session.close()
+
+    def _host_slot(self, url: str) -> BoundedSemaphore:
+        """
+        Get the semaphore limiting connections to the host of url.
+
+        Parameters
+        ----------
+        url: str
+            The url to download.
+
+        Returns
+        -------
+        BoundedSemaphore
+            Semaphore shared by all downloads from the same host.
+        """
+        host = urlparse(url).netloc
+        with self._lock:
+            if host not in self._hosts:
+                self._hosts[host] = BoundedSemaphore(self.max_per_host)
+            return self._hosts[host]
+
+    def submit(self, url: str, dst: str, callback: Optional[Callable] = None):
+        """
+        Schedule the download of url to dst.
+
+        Parameters
+        ----------
+        url: str
+            The url to download.
+        dst: str
+            Path to the destination file.
+        callback: Callable
+            Called without arguments when the file has been downloaded.
+            Optional.
+
+        Returns
+        -------
+        concurrent.futures.Future
+            Future of the download.
+        """
+        from contextvars import copy_context
+
+        if self._executor is None:
+            self.__enter__()
+        # The download thread reports events for the dataset submitting it.
+        return self._executor.submit(
+            copy_context().run, self._download, url, dst, callback
+        )
+
+    def _download(self, url: str, dst: str, callback: Optional[Callable]):
+        """
+        Download a single file and run its callback.
+
+        Parameters
+        ----------
+        url: str
+            The url to download.
+        dst: str
+            Path to the destination file.
+        callback: Callable
+            Called without arguments when the file has been downloaded.
+
+        Returns
+        -------
+        None
+        """
+        entry = self.manifest.get(url) if self.manifest else {}
+        if (
+            entry.get("status") == "downloaded"
+            and os.path.exists(dst)
+            and os.path.getsize(dst) == entry.get("size")
+        ):
+            with self._lock:
+                self.skipped += 1
+            if self.verbose and not self.quiet:
+                print(f"Skipping {url} because it is already downloaded")
+            if callback is not None:
+                callback()
+            return
+
+        def started(response: dict):
+            """Record the file before its body is downloaded, to resume it."""
+            self.manifest.update(
+                url, path=self.manifest.relpath(dst), status="partial", **response
+            )
+
+        try:
+            with self._host_slot(url), connection_slot():
+                info = download_file(
+                    self.session,
+                    url,
+                    dst,
+                    self.chunk_size,
+                    etag=entry.get("etag"),
+                    last_modified=entry.get("last_modified"),
+                    size=entry.get("size"),
+                    on_response=started if self.manifest is not None else None,
+                )
+        except Exception as e:
+            with self._lock:
+                self.errors.append((url, f"{type(e).__name__}: {e}"))
+            if self.manifest is not None:
+                self.manifest.update(url, status="failed", error=str(e))
+            if not self.quiet:
+                print(f"\nCould not download {url}: {e}")
+            return
+
+        with self._lock:
+            self.files += 1
+            self.bytes += info.pop("transferred")
+        if self.manifest is not None:
+            self.manifest.update(
+                url, path=self.manifest.relpath(dst), status="downloaded", **info
+            )
+        if self.verbose and not self.quiet:
+            print(f"Downloaded {url} to {dst}")
+        if callback is not None:
+            callback()
@@ -0,0 +1,385 @@
+"""
+Extract log-mel features from the segments of a split.
+
+The module contains the following:
+
+    - FeatureConfig: Parameters of the log-mel features.
+    - as_float_signal: Convert samples to a mono float32 signal.
+    - log_mel: Log-mel features of a signal, vectorized with NumPy.
+    - extract_features: Extract the features of a split on a process pool.
+    - load_features: Memory-map the extracted features of a split.
+
+Features are written to ``features/<key>/`` in the dataset, where key is a
+hash of the FeatureConfig, so changed parameters are extracted again instead
+of being mixed with old features. The features of all segments of a split are
+rows of one ``<split>.npy`` array and the ``<split>`` index manifest holds the
+first row and number of frames of every segment.
+"""
+
+from dataclasses import asdict, dataclass
+from typing import Optional
+
+import os
+
+
+@dataclass(frozen=True)
+class FeatureConfig:
+    """Parameters of the log-mel features."""
+
+    sample_rate: int = 16000
+    n_fft: int = 400
+    hop_length: int = 160
+    n_mels: int = 80
+    f_min: float = 0.0
+    f_max: Optional[float] = None
+    log_offset: float = 1e-6
+    dtype: str = "float32"
+
+    @property
+    def key(self) -> str:
+        """Hash of the parameters, naming the folder of the features."""
+        import hashlib
+        import json
+
+        blob = json.dumps(asdict(self), sort_keys=True)
+        return hashlib.sha256(blob.encode()).hexdigest()[:16]
+
+    def num_frames(self, num_samples: int) -> int:
+        """Number of feature frames of a signal of num_samples samples."""
+        if num_samples < self.n_fft:
+            return 0
+        return 1 + (num_samples - self.n_fft) // self.hop_length
+
+
+def mel_filterbank(config: FeatureConfig):
+    """
+    Triangular mel filters on the frequency bins of the fft.
+
+    Parameters
+    ----------
+    config: FeatureConfig
+        The feature parameters.
+
+    Returns
+    -------
+    np.ndarray
+        Filters shaped (n_fft // 2 + 1, n_mels).
+    """
+    import numpy as np
+
+    def to_mel(hz):
+        """Convert frequencies in Hz to mel."""
+        return 2595.0 * np.log10(1.0 + np.asarray(hz) / 700.0)
+
+    def to_hz(mel):
+        """Convert mel to frequencies in Hz."""
+        return 700.0 * (10.0 ** (np.asarray(mel) / 2595.0) - 1.0)
+
+    f_max = config.f_max or config.sample_rate / 2
+    edges = to_hz(np.linspace(to_mel(config.f_min), to_mel(f_max), config.n_mels + 2))
+    bins = np.linspace(0, config.sample_rate / 2, config.n_fft // 2 + 1)
+    lower, center, upper = edges[:-2], edges[1:-1], edges[2:]
+    rising = (bins[:, None] - lower) / (center - lower)
+    falling = (upper - bins[:, None]) / (upper - center)
+    return np.maximum(0.0, np.minimum(rising, falling))
+
+
+def as_float_signal(audio, sample_rate: int, target_rate: Optional[int] = None):
+    """
+    Convert samples to a mono float32 signal.
+
+    Integer samples are scaled to [-1, 1), channels are averaged and the
+    signal is resampled to target_rate with linear interpolation if needed.
+
+    Parameters
+    ----------
+    audio: np.ndarray
+        Samples shaped (frames,) or (frames, channels).
+    sample_rate: int
+        Sample rate of audio.
+    target_rate: int
+        Sample rate of the signal. Optional. Defaults to sample_rate.
+
+    Returns
+    -------
+    np.ndarray
+        The signal shaped (frames,).
+    """
+    import numpy as np
+
+    signal = np.asarray(audio)
+    if np.issubdtype(signal.dtype, np.integer):
+        info = np.iinfo(signal.dtype)
+        scale = 2.0 ** (info.bits - 1)
+        signal = (signal.astype(np.float32) - (info.min + scale)) / scale
+    signal = signal.astype(np.float32, copy=False)
+    if signal.ndim == 2:
+        signal = signal.mean(axis=1)
+    if target_rate and sample_rate != target_rate and len(signal):
+        length = int(round(len(signal) * target_rate / sample_rate))
+        positions = np.arange(length) * (sample_rate / target_rate)
+        signal = np.interp(positions, np.arange(len(signal)), signal)
+    return signal.astype(np.float32, copy=False)
+
+
+def log_mel(audio, sample_rate: int, config: FeatureConfig, filters=None):
+    """
+    Compute the log-mel features of a signal.
+
+    The signal is converted with as_float_signal. All frames are computed at
+    once with a strided view and a single real fft.
+
+    Parameters
+    ----------
+    audio: np.ndarray
+        Samples shaped (frames,) or (frames, channels).
+    sample_rate: int
+        Sample rate of audio.
+    config: FeatureConfig
+        The feature parameters.
+    filters: np.ndarray
+        Mel filters from mel_filterbank. Optional, computed if not given.
+
+    Returns
+    -------
+    np.ndarray
+        Features shaped (frames, n_mels).
+    """
+    import numpy as np
+
+    signal = as_float_signal(audio, sample_rate, config.sample_rate)
+    num_frames = config.num_frames(len(signal))
+    if num_frames == 0:
+        return np.zeros((0, config.n_mels), dtype=config.dtype)
+    if filters is None:
+        filters = mel_filterbank(config)
+    frames = np.lib.stride_tricks.sliding_window_view(signal, config.n_fft)
+    frames = frames[:: config.hop_length][:num_frames]
+    window = np.hanning(config.n_fft + 1)[:-1].astype(np.float32)
+    power = np.abs(np.fft.rfft(frames * window, axis=1)) ** 2
+    return np.log(power @ filters + config.log_offset).astype(config.dtype)
+
+
+def extract_features(
+    dataset_path: str,
+    split: str = "train",
+    config: Optional[FeatureConfig] = None,
+    path_column: str = "id",
+    num_workers: Optional[int] = None,
+    batch_size: int = 256,
+    output_format: str = "csv",
+    verbose: bool = False,
+    quiet: bool = False,
+) -> str:
+    """
+    Extract the log-mel features of the segments of a split.
+
+    Nothing is done if the features of the split with the same config exist
+    and are newer than the manifest. Segments are sliced by their 'start' and
+    'end' columns with segment_bounds, as in SegmentDataset, so the wav files
+    of a dataset split by split_dataset are used whole.
+
+    Parameters
+    ----------
+    dataset_path: str
+        Path to dataset.
+    split: str
+        Name of the manifest, e.g. 'train', 'all' or 'audio_index'.
+    config: FeatureConfig
+        The feature parameters. Optional. Defaults to FeatureConfig().
+    path_column: str
+        Column with the path of the wav files relative to dataset_path, e.g.
+        'file' for the audio index.
+    num_workers: int
+        Number of processes extracting features. Defaults to the number of
+        cpus.
+    batch_size: int
+        Number of segments per task of a process.
+    output_format: str
+        Format of the index, 'csv' or 'parquet'. Default is csv.
+    verbose: bool
+        Print the progress.
+    quiet: bool
+        Prints nothing.
+
+    Returns
+    -------
+    str
+        Folder of the features.
+    """
+    import json
+    from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+    import numpy as np
+    from rifsdatasets.manifest import manifest_path, read_manifest, write_manifest
+    from rifsdatasets.utils import read_wav_header
+
+    config = config or FeatureConfig()
+    output_dir = os.path.join(dataset_path, "features", config.key)
+    index_path = manifest_path(output_dir, split)
+    if os.path.exists(index_path) and os.path.getmtime(index_path) >= os.path.getmtime(
+        manifest_path(dataset_path, split)
+    ):
+        if verbose and not quiet:
+            print(f"Features of '{split}' are up to date in {output_dir}")
+        return output_dir
+    os.makedirs(output_dir, exist_ok=True)
+    with open(os.path.join(output_dir, "config.json"), "w") as f:
+        json.dump(asdict(config), f, indent=2)
+
+    manifest = read_manifest(dataset_path, split)
+    paths = manifest[path_column].astype(str)
+    unique = paths.unique()
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        headers = dict(
+            zip(
+                unique,
+                executor.map(
+                    lambda path: read_wav_header(os.path.join(dataset_path, path)),
+                    unique,
+                ),
+            )
+        )
+
+    # The number of frames of every segment is known from the headers, so the
+    # workers can write straight into their rows of a preallocated array.
+    bounds = [_bounds(row, headers[path]) for path, row in zip(paths, _times(manifest))]
+    counts = np.array(
+        [
+            config.num_frames(
+                int(round((end - start) * config.sample_rate / header.sample_rate))
+                if header.sample_rate != config.sample_rate
+                else end - start
+            )
+            for (start, end), header in zip(bounds, map(headers.get, paths))
+        ],
+        dtype=np.int64,
+    )
+    offsets = np.concatenate([[0], np.cumsum(counts)[:-1]]).astype(np.int64)
+    array_path = os.path.join(output_dir, f"{split}.npy")
+    features = np.lib.format.open_memmap(
+        array_path + ".part",
+        mode="w+",
+        dtype=config.dtype,
+        shape=(int(counts.sum()), config.n_mels),
+    )
+    del features
+    if verbose and not quiet:
+        print(
+            f"Extracting {int(counts.sum())} frames of {len(manifest)} segments "
+            f"to {output_dir}"
+        )
+
+    batches = [slice(i, i + batch_size) for i in range(0, len(manifest), batch_size)]
+    jobs = [
+        (
+            dataset_path,
+            array_path + ".part",
+            list(paths[batch]),
+            bounds[batch],
+            offsets[batch],
+            config,
+        )
+        for batch in batches
+    ]
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        list(executor.map(_extract_batch, *zip(*jobs)) if jobs else [])
+    os.replace(array_path + ".part", array_path)
+
+    index = manifest.copy()
+    index["offset"] = offsets
+    index["frames"] = counts
+    write_manifest(index, output_dir, split, output_format)
+    if not quiet:
+        print(f"Extracted features of {len(manifest)} segments to {output_dir}")
+    return output_dir
+
+
+def _times(manifest):
+    """Start and end in seconds of every row, NaN if missing."""
+    import numpy as np
+
+    nan = np.full(len(manifest), np.nan)
+    start = manifest["start"].to_numpy(float) if "start" in manifest.columns else nan
+    end = manifest["end"].to_numpy(float) if "end" in manifest.columns else nan
+    return zip(start, end)
+
+
+def _bounds(times, header):
+    """First and last sample of a segment, sliced like SegmentDataset."""
+    from rifsdatasets.loader import segment_bounds
+
+    start, end = times
+    return segment_bounds(start, end, header.sample_rate, header.frames)
+
+
+def _extract_batch(dataset_path, array_path, paths, bounds, offsets, config):
+    """
+    Extract the features of a batch of segments into their rows.
+
+    Parameters
+    ----------
+    dataset_path: str
+        Path to dataset.
+    array_path: str
+        Path to the preallocated feature array.
+    paths: List[str]
+        Paths of the wav files relative to dataset_path.
+    bounds: List[Tuple[int, int]]
+        First and last sample of every segment.
+    offsets: np.ndarray
+        First row of every segment in the array.
+    config: FeatureConfig
+        The feature parameters.
+
+    Returns
+    -------
+    None
+    """
+    import numpy as np
+    from rifsdatasets.loader import map_wav
+
+    features = np.load(array_path, mmap_mode="r+")
+    filters = mel_filterbank(config)
+    for path, (start, end), offset in zip(paths, bounds, offsets):
+        audio, sample_rate = map_wav(os.path.join(dataset_path, path))
+        values = log_mel(audio[start:end], sample_rate, config, filters)
+        stop = offset + len(values)
+        features[offset:stop] = values
+    features.flush()
+
+
+def load_features(
+    dataset_path: str, split: str = "train", config: Optional[FeatureConfig] = None
+):
+    """
+    Memory-map the extracted features of a split.
+
+    Parameters
+    ----------
+    dataset_path: str
+        Path to dataset.
+    split: str
+        Name of the manifest.
+    config: FeatureConfig
+        The feature parameters. Optional. Defaults to FeatureConfig().
+
+    Returns
+    -------
+    Tuple[np.memmap, pd.DataFrame]
+        The features of all segments and the index. The features of row i
+        of the index are ``features[offset:offset + frames]``.
+
+    Raises
+    ------
+    FileNotFoundError
+        If the features have not been extracted with this config.
+    """
+    import numpy as np
+    from rifsdatasets.manifest import read_manifest
+
+    config = config or FeatureConfig()
+    output_dir = os.path.join(dataset_path, "features", config.key)
+    index = read_manifest(output_dir, split)
+    features = np.load(os.path.join(output_dir, f"{split}.npy"), mmap_mode="r")
+    return features, index
@@ -2,13 +2,12 @@
 This module can download noisepacks from freesound.org.
 """
 
-from sklearn.model_selection import train_test_split
-
 from rifsdatasets.base import Base
+from rifsdatasets.instrument import traced
+
+from typing import List, Optional
 
-import requests as re
-import zipfile
-import os
+BASE_URL = "https://freesound.org"
 
 
 class FreeSoundOrg(Base):
@@ -23,6 +22,12 @@ class FreeSoundOrg(Base):
         name: str = "",
         verbose: bool = False,
         quiet: bool = False,
+        verify: bool = False,
+        chunk_size: int = 1 << 20,
+        resume: bool = False,
+        num_workers: Optional[int] = None,
+        sample_rate: Optional[int] = None,
+        channels: Optional[int] = None,
     ):
         """
         Download the dataset to the specified destination.
@@ -39,77 +44,512 @@ class FreeSoundOrg(Base):
             Whether to print the download progress with steps.
         quiet: bool
             Prints nothing.
+        verify: bool
+            Only check the extracted files against manifest.json.
+        chunk_size: int
+            Number of bytes read and written at a time.
+        resume: bool
+            Download the zip to disk so an interrupted download is resumed on
+            the next call, instead of into a spooled buffer.
+        num_workers: int
+            Number of processes converting sounds to wav. Defaults to the
+            number of cpus.
+        sample_rate: int
+            Sample rate of the sounds. Optional. Wav sounds with another rate
+            are converted too.
+        channels: int
+            Number of channels of the sounds. Optional. Wav sounds with
+            another number of channels are converted too.
 
         Returns
         -------
-        None
+        None or List[Tuple[str, str]]
+            With verify the urls and problems found.
 
         """
+        import os
 
-        # TODO: Get from environment variables or settings file
-        token = ""
-        oauth2_token = ""
+        import requests as re
 
-        base_url = "https://freesound.org"
-        headers = {"Authorization": f"Token {token}"}
-        headers_oauth2 = {"Authorization": f"Bearer {oauth2_token}"}
+        from rifsdatasets.downloader import verify_manifest
 
-        if not name:
-            if verbose and not quiet:
-                print("No name supplied, getting name of soundpack")
-            response = re.get(f"{base_url}/apiv2/packs/{pack_id}/", headers=headers)
-            assert response.status_code == 200, "Could not get pack name"
-            name = response.json()["name"]
-            name = "".join(
-                [c for c in name.lower() if c.isalnum() or c == " "]
-            ).rstrip()
+        if verify:
+            with re.Session() as session:
+                name = name or _pack_name(session, pack_id, verbose, quiet)
+            manifest_path = os.path.join(target_folder, name, "manifest.json")
+            return verify_manifest(manifest_path, verbose=verbose, quiet=quiet)
 
-        if verbose and not quiet:
-            print(f"Name of soundpack: {name}")
+        _download_packs(
+            target_folder,
+            [pack_id],
+            [name],
+            verbose=verbose,
+            quiet=quiet,
+            max_connections=1,
+            chunk_size=chunk_size,
+            resume=resume,
+            num_workers=num_workers,
+            sample_rate=sample_rate,
+            channels=channels,
+        )
 
-        os.makedirs(os.path.join(target_folder, name, "audio"), exist_ok=True)
+    @staticmethod
+    @traced("download", "FreeSoundOrg")
+    def download_packs(
+        target_folder: str,
+        pack_ids: List[int],
+        names: Optional[List[str]] = None,
+        verbose: bool = False,
+        quiet: bool = False,
+        max_connections: int = 4,
+        chunk_size: int = 1 << 20,
+        spool_size: int = 1 << 28,
+        resume: bool = False,
+        num_workers: Optional[int] = None,
+        sample_rate: Optional[int] = None,
+        channels: Optional[int] = None,
+    ) -> List[str]:
+        """
+        Download several noisepacks concurrently.
 
-        if verbose and not quiet:
-            print("Downloading sounds into zip")
-        pack_url = f"{base_url}/apiv2/packs/{pack_id}/download/"
-        filepath = os.path.join(target_folder, name, f"{name}.zip")
-        with re.get(pack_url, headers=headers_oauth2, stream=True) as r:
-            r.raise_for_status()
-            with open(filepath, "wb") as f:
-                for chunk in r.iter_content(chunk_size=8192):
-                    f.write(chunk)
+        Every pack is fetched into a spooled buffer, which stays in memory up
+        to spool_size bytes, and its members are extracted from the buffer, so
+        the zip is never written to the dataset folder. Sounds that are not
+        wav, or not in the sample_rate and channels, are converted to 16 bit
+        wav on a pool of worker processes while the other packs are still
+        downloading. Packs that failed are written
+        to errors.txt in target_folder.
 
-        if verbose and not quiet:
-            print("Unzipping")
-        with zipfile.ZipFile(filepath, "r") as zip_ref:
-            zip_ref.extractall(os.path.join(target_folder, name, "audio"))
+        Parameters
+        ----------
+        target_folder: str
+            The destination folder, every pack gets a folder in it.
+        pack_ids: List[int]
+            The ids of the noisepacks to download.
+        names: List[str]
+            The names of the noisepacks, in the order of pack_ids. Optional.
+            Defaults to the freesound pack names.
+        verbose: bool
+            Whether to print the download progress with steps.
+        quiet: bool
+            Prints nothing.
+        max_connections: int
+            Number of packs downloading at once.
+        chunk_size: int
+            Number of bytes read and written at a time.
+        spool_size: int
+            Number of bytes of a pack kept in memory before spilling to a
+            temporary file.
+        resume: bool
+            Download the zips to disk so interrupted downloads are resumed on
+            the next call, instead of into spooled buffers.
+        num_workers: int
+            Number of processes converting sounds to wav. Defaults to the
+            number of cpus.
+        sample_rate: int
+            Sample rate of the sounds. Optional. Wav sounds with another rate
+            are converted too.
+        channels: int
+            Number of channels of the sounds. Optional. Wav sounds with
+            another number of channels are converted too.
 
-        print("Removing zip")
-        os.remove(filepath)
+        Returns
+        -------
+        List[str]
+            Folders of the downloaded packs.
+        """
+        return _download_packs(
+            target_folder,
+            pack_ids,
+            names,
+            verbose=verbose,
+            quiet=quiet,
+            max_connections=max_connections,
+            chunk_size=chunk_size,
+            spool_size=spool_size,
+            resume=resume,
+            num_workers=num_workers,
+            sample_rate=sample_rate,
+            channels=channels,
+        )
+
+
+def _download_packs(
+    target_folder: str,
+    pack_ids: List[int],
+    names: Optional[List[str]] = None,
+    verbose: bool = False,
+    quiet: bool = False,
+    max_connections: int = 4,
+    chunk_size: int = 1 << 20,
+    spool_size: int = 1 << 28,
+    resume: bool = False,
+    num_workers: Optional[int] = None,
+    sample_rate: Optional[int] = None,
+    channels: Optional[int] = None,
+) -> List[str]:
+    """
+    Download noisepacks, see FreeSoundOrg.download_packs.
+
+    Returns
+    -------
+    List[str]
+        Folders of the downloaded packs.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from contextvars import copy_context
+
+    import requests as re
+    from requests.adapters import HTTPAdapter
+
+    from rifsdatasets.utils import ConversionPool, write_errors
+
+    # TODO: Get from environment variables or settings file
+    oauth2_token = ""
+
+    names = list(names or [])
+    names += [""] * (len(pack_ids) - len(names))
+    pool = ConversionPool(
+        num_workers,
+        verbose=verbose,
+        quiet=quiet,
+        streaming=True,
+        sample_rate=sample_rate,
+        channels=channels,
+    )
+    errors, packs = [], []
+    with re.Session() as session:
+        session.headers.update({"Authorization": f"Bearer {oauth2_token}"})
+        adapter = HTTPAdapter(pool_maxsize=max_connections)
+        session.mount("https://", adapter)
+        with pool, ThreadPoolExecutor(max_workers=max_connections) as executor:
+            futures = [
+                executor.submit(
+                    copy_context().run,
+                    _fetch_pack,
+                    session,
+                    pool,
+                    target_folder,
+                    pack_id,
+                    name,
+                    chunk_size,
+                    spool_size,
+                    resume,
+                    verbose,
+                    quiet,
+                )
+                for pack_id, name in zip(pack_ids, names)
+            ]
+            for pack_id, future in zip(pack_ids, futures):
+                try:
+                    packs.append(future.result())
+                except Exception as e:
+                    errors.append((str(pack_id), f"{type(e).__name__}: {e}"))
+                    if not quiet:
+                        print(f"\nCould not download pack {pack_id}: {e}")
+
+    # The sounds of a pack are complete once all conversions have finished.
+    for folder, manifest, pack_url, sounds in packs:
+        if sounds is not None:
+            _record_pack(manifest, pack_url, sounds)
+        manifest.save()
+        _split_pack(folder, verbose, quiet, overwrite=sounds is not None)
+    write_errors(target_folder, errors + pool.report.errors)
+    return [folder for folder, *_ in packs]
+
+
+def _pack_name(session, pack_id: int, verbose: bool, quiet: bool) -> str:
+    """
+    Get the name of a noisepack from the freesound api.
+
+    Parameters
+    ----------
+    session: requests.Session
+        Session used for the request.
+    pack_id: int
+        The id of the noisepack.
+    verbose: bool
+        Whether to print the download progress with steps.
+    quiet: bool
+        Prints nothing.
+
+    Returns
+    -------
+    str
+        The name in lower case with only letters, digits and spaces.
+    """
+    # TODO: Get from environment variables or settings file
+    token = ""
+
+    if verbose and not quiet:
+        print("No name supplied, getting name of soundpack")
+    response = session.get(
+        f"{BASE_URL}/apiv2/packs/{pack_id}/",
+        headers={"Authorization": f"Token {token}"},
+    )
+    assert response.status_code == 200, "Could not get pack name"
+    name = response.json()["name"]
+    return "".join([c for c in name.lower() if c.isalnum() or c == " "]).rstrip()
+
+
+def _fetch_pack(
+    session,
+    pool,
+    target_folder: str,
+    pack_id: int,
+    name: str,
+    chunk_size: int,
+    spool_size: int,
+    resume: bool,
+    verbose: bool,
+    quiet: bool,
+):
+    """
+    Download and extract a noisepack and submit its sounds to pool.
+
+    Sounds that are not wav, or wav sounds with another sample rate or
+    number of channels than the pool converts to, are converted.
 
+    Parameters
+    ----------
+    session: requests.Session
+        Session used for the requests.
+    pool: rifsdatasets.utils.ConversionPool
+        Pool converting the sounds.
+    target_folder: str
+        The destination folder.
+    pack_id: int
+        The id of the noisepack.
+    name: str
+        The name of the noisepack, empty to get it from freesound.
+    chunk_size: int
+        Number of bytes read and written at a time.
+    spool_size: int
+        Number of bytes kept in memory before spilling to disk.
+    resume: bool
+        Download the zip to disk instead of into a spooled buffer.
+    verbose: bool
+        Whether to print the download progress with steps.
+    quiet: bool
+        Prints nothing.
+
+    Returns
+    -------
+    Tuple[str, DownloadManifest, str, Optional[List[str]]]
+        Folder of the pack, its manifest, the url of the pack and the paths
+        of its wav sounds, or None if the pack was already extracted.
+    """
+    import os
+    import zipfile
+
+    from rifsdatasets.downloader import DownloadManifest, download_file, fetch_spooled
+    from rifsdatasets.utils import connection_slot
+
+    name = name or _pack_name(session, pack_id, verbose, quiet)
+    if verbose and not quiet:
+        print(f"Name of soundpack: {name}")
+    folder = os.path.join(target_folder, name)
+    audio = os.path.join(folder, "audio")
+    os.makedirs(audio, exist_ok=True)
+
+    manifest = DownloadManifest(os.path.join(folder, "manifest.json"))
+    pack_url = f"{BASE_URL}/apiv2/packs/{pack_id}/download/"
+    entry = manifest.get(pack_url)
+    if entry.get("status") == "extracted":
         if verbose and not quiet:
-            print("Getting sounds and splitting dataset")
-        sounds = [
-            s
-            for s in os.listdir(os.path.join(target_folder, name, "audio"))
-            if s.endswith(".wav")
-        ]
-
-        # Split dataset
-        train, rest = train_test_split(sounds, train_size=0.7)
-        dev, test = train_test_split(rest, train_size=0.5)
-
-        # Write splits to txt
+            print(f"Skipping {name} because the pack is already extracted")
+        return folder, manifest, pack_url, None
+
+    filepath = os.path.join(folder, f"{name}.zip")
+    if resume and entry.get("status") == "downloaded" and os.path.exists(filepath):
         if verbose and not quiet:
-            print("Writing splits to txt")
-        for txtname, dataset in [
-            ("train.txt", train),
-            ("dev.txt", dev),
-            ("test.txt", test),
-        ]:
-            with open(os.path.join(target_folder, name, txtname), "w") as f:
-                for line in dataset:
-                    f.write(f"{line}\n")
+            print(f"Skipping download of {name} because the zip is complete")
+        source = filepath
+    elif resume:
+        if verbose and not quiet:
+            print(f"Downloading {name} into zip")
+
+        def started(response: dict):
+            """Record the zip before its body is downloaded, to resume it."""
+            manifest.update(
+                pack_url, path=manifest.relpath(filepath), status="partial", **response
+            )
+            manifest.save()
 
+        with connection_slot():
+            info = download_file(
+                session,
+                pack_url,
+                filepath,
+                chunk_size,
+                etag=entry.get("etag"),
+                last_modified=entry.get("last_modified"),
+                size=entry.get("size"),
+                on_response=started,
+            )
+        info.pop("transferred")
+        manifest.update(
+            pack_url, path=manifest.relpath(filepath), status="downloaded", **info
+        )
+        source = filepath
+    else:
         if verbose and not quiet:
-            print("Done")
+            print(f"Downloading {name} into memory")
+        with connection_slot():
+            source, info = fetch_spooled(session, pack_url, chunk_size, spool_size)
+        info.pop("transferred")
+        manifest.update(pack_url, **info)
+
+    if verbose and not quiet:
+        print(f"Unzipping {name}")
+    sounds = []
+    on_disk = isinstance(source, str)
+    try:
+        with zipfile.ZipFile(source, "r") as zip_ref:
+            for member in zip_ref.infolist():
+                if member.is_dir():
+                    continue
+                path = zip_ref.extract(member, audio)
+                stem, extension = os.path.splitext(path)
+                sounds.append(f"{stem}.wav")
+                if extension.lower() != ".wav":
+                    pool.submit(path, f"{stem}.wav", _remover(path))
+                elif _needs_conversion(path, pool.options):
+                    # Keep the extension, decoders are chosen by it.
+                    original = f"{stem}.source{extension}"
+                    os.replace(path, original)
+                    pool.submit(original, f"{stem}.wav", _remover(original))
+    finally:
+        if not on_disk:
+            source.close()
+    # The zip is kept if the extraction failed, so it is extracted again when
+    # the download is resumed.
+    if on_disk:
+        if not quiet:
+            print("Removing zip")
+        os.remove(filepath)
+    return folder, manifest, pack_url, sounds
+
+
+def _needs_conversion(path: str, options: dict) -> bool:
+    """
+    Check whether a wav sound differs from the format of the conversions.
+
+    Parameters
+    ----------
+    path: str
+        Path to the wav sound.
+    options: dict
+        Options of the ConversionPool with the sample_rate and channels.
+
+    Returns
+    -------
+    bool
+        True if the sample rate or channels differ from the options, or the
+        header cannot be read.
+    """
+    from rifsdatasets.utils import read_wav_header
+
+    try:
+        header = read_wav_header(path)
+    except ValueError:
+        return True
+    return options.get("sample_rate") not in (None, header.sample_rate) or options.get(
+        "channels"
+    ) not in (None, header.channels)
+
+
+def _remover(path: str):
+    """Callback of a conversion removing its source."""
+    import os
+
+    def remove(error):
+        """Remove the source, whether or not the conversion failed."""
+        if os.path.exists(path):
+            os.remove(path)
+
+    return remove
+
+
+def _record_pack(manifest, pack_url: str, sounds: List[str]):
+    """
+    Record the sounds of an extracted pack in its manifest.
+
+    Parameters
+    ----------
+    manifest: DownloadManifest
+        Manifest of the pack.
+    pack_url: str
+        The url of the pack.
+    sounds: List[str]
+        Paths of the wav sounds of the pack.
+
+    Returns
+    -------
+    None
+    """
+    import os
+
+    missing = [sound for sound in sounds if not os.path.exists(sound)]
+    if missing:
+        manifest.update(
+            pack_url, status="failed", error=f"{len(missing)} sounds not converted"
+        )
+        return
+    outputs = {manifest.relpath(sound): os.path.getsize(sound) for sound in sounds}
+    manifest.update(pack_url, status="extracted", outputs=outputs)
+
+
+def _split_pack(
+    folder: str, verbose: bool, quiet: bool, overwrite: bool = True, seed: int = 0
+):
+    """
+    Split the wav sounds of a pack into train.txt, dev.txt and test.txt.
+
+    The split is seeded, so a pack is always split the same way.
+
+    Parameters
+    ----------
+    folder: str
+        Folder of the pack.
+    verbose: bool
+        Whether to print the download progress with steps.
+    quiet: bool
+        Prints nothing.
+    overwrite: bool
+        Whether to split the pack again if it is already split. Default is True.
+    seed: int
+        Seed of the split. Default is 0.
+
+    Returns
+    -------
+    None
+    """
+    import os
+
+    splits = ["train.txt", "dev.txt", "test.txt"]
+    if not overwrite and all(os.path.exists(os.path.join(folder, s)) for s in splits):
+        return
+
+    from sklearn.model_selection import train_test_split
+
+    if verbose and not quiet:
+        print("Getting sounds and splitting dataset")
+    sounds = sorted(
+        s for s in os.listdir(os.path.join(folder, "audio")) if s.endswith(".wav")
+    )
+
+    # Split dataset
+    train, rest = train_test_split(sounds, train_size=0.7, random_state=seed)
+    dev, test = train_test_split(rest, train_size=0.5, random_state=seed)
+
+    # Write splits to txt
+    if verbose and not quiet:
+        print("Writing splits to txt")
+    for txtname, dataset in zip(splits, [train, dev, test]):
+        with open(os.path.join(folder, txtname), "w") as f:
+            for line in dataset:
+                f.write(f"{line}\n")
+
+    if verbose and not quiet:
+        print("Done")
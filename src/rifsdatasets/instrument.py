@@ -0,0 +1,244 @@
+"""
+Structured instrumentation of downloads, conversions, splits and merges.
+
+Phases of the pipeline report an Event with their duration, file and byte
+counts and errors to every registered sink. A sink is any callable taking an
+Event, e.g. a JsonLinesSink or a function. Without sinks nothing is recorded
+besides the timing of the phases.
+
+Phases reported:
+
+    - download: Base.download of a dataset class, with the dataset name.
+    - clone: clone_repository, restored from the cache or cloned.
+    - fetch: download_file of a single url.
+    - convert: A ConversionPool, all of its conversions.
+    - convert_file: A single conversion of a ConversionPool.
+    - move: utils.move of a file or folder into a dataset.
+    - link: link_tree of a folder into a merged dataset.
+    - read: Reading the segments or manifests of a dataset.
+    - write: Writing a manifest.
+    - split: split_dataset.
+    - merge: merge_rifsdatasets.
+    - augment: augment_split.
+
+Example
+-------
+    with instrumented(JsonLinesSink("events.jsonl")):
+        Den2Radio.download("data")
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+from functools import wraps
+from threading import Lock
+from time import perf_counter, time
+from typing import Any, Callable, Dict, List, Optional
+
+#: Name of the dataset whose download is running in this context.
+current_dataset: ContextVar[Optional[str]] = ContextVar("current_dataset", default=None)
+
+_sinks: List[Callable] = []
+_lock = Lock()
+
+
+@dataclass
+class Event:
+    """A finished phase of the pipeline."""
+
+    phase: str
+    dataset: Optional[str] = field(default_factory=lambda: current_dataset.get())
+    start: float = field(default_factory=time)
+    seconds: float = 0.0
+    files: int = 0
+    bytes: int = 0
+    errors: int = 0
+    error: Optional[str] = None
+    details: Dict[str, Any] = field(default_factory=dict)
+
+
+class JsonLinesSink:
+    """Append every event as a line of JSON to a file."""
+
+    def __init__(self, path: str):
+        """
+        Initialize the sink.
+
+        Parameters
+        ----------
+        path: str
+            Path to the file, appended to if it exists.
+        """
+        self.path = path
+        self._lock = Lock()
+
+    def __call__(self, event: Event):
+        """
+        Append an event to the file.
+
+        Parameters
+        ----------
+        event: Event
+            The event to write.
+        """
+        import json
+
+        line = json.dumps(asdict(event), default=str)
+        with self._lock, open(self.path, "a") as f:
+            f.write(line + "\n")
+
+
+def add_sink(sink: Callable):
+    """
+    Send all following events to sink.
+
+    Parameters
+    ----------
+    sink: Callable
+        Called with every Event.
+
+    Returns
+    -------
+    None
+    """
+    with _lock:
+        _sinks.append(sink)
+
+
+def remove_sink(sink: Callable):
+    """
+    Stop sending events to sink.
+
+    Parameters
+    ----------
+    sink: Callable
+        A sink added with add_sink.
+
+    Returns
+    -------
+    None
+    """
+    with _lock:
+        if sink in _sinks:
+            _sinks.remove(sink)
+
+
+def enabled() -> bool:
+    """Whether any sink is registered, to skip measurements nobody reads."""
+    return bool(_sinks)
+
+
+@contextmanager
+def instrumented(*sinks: Callable):
+    """
+    Send the events of a block of code to sinks.
+
+    Parameters
+    ----------
+    sinks: Callable
+        Called with every Event.
+
+    Yields
+    ------
+    None
+    """
+    for sink in sinks:
+        add_sink(sink)
+    try:
+        yield
+    finally:
+        for sink in sinks:
+            remove_sink(sink)
+
+
+def emit(event: Event):
+    """
+    Send an event to every sink. Errors in sinks are not raised.
+
+    Parameters
+    ----------
+    event: Event
+        The event.
+
+    Returns
+    -------
+    None
+    """
+    with _lock:
+        sinks = list(_sinks)
+    for sink in sinks:
+        try:
+            sink(event)
+        except Exception:
+            pass
+
+
+@contextmanager
+def span(phase: str, **details):
+    """
+    Time a phase and emit its Event when it ends.
+
+    The Event is yielded so the phase can fill in its counts. If the phase
+    raises, the error is recorded and the exception is raised again.
+
+    Parameters
+    ----------
+    phase: str
+        Name of the phase, e.g. 'clone'.
+    details:
+        Extra fields of the event, e.g. the url.
+
+    Yields
+    ------
+    Event
+        The event of the phase.
+    """
+    event = Event(phase=phase, details=details)
+    start = perf_counter()
+    try:
+        yield event
+    except BaseException as e:
+        event.errors += 1
+        event.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        event.seconds = perf_counter() - start
+        if _sinks:
+            emit(event)
+
+
+def traced(phase: str, dataset: Optional[str] = None):
+    """
+    Decorate a function to run in a span.
+
+    Parameters
+    ----------
+    phase: str
+        Name of the phase.
+    dataset: str
+        Name of the dataset, set as current_dataset while the function runs.
+        Optional.
+
+    Returns
+    -------
+    Callable
+        The decorator.
+    """
+
+    def decorator(function: Callable) -> Callable:
+        """Wrap a function to run in the span."""
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            """Call the function in the span, with the dataset set."""
+            token = current_dataset.set(dataset) if dataset else None
+            try:
+                with span(phase):
+                    return function(*args, **kwargs)
+            finally:
+                if token is not None:
+                    current_dataset.reset(token)
+
+        return wrapper
+
+    return decorator
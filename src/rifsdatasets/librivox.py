@@ -4,14 +4,28 @@ This module contains the LibriVoxDansk dataset.
 
 from rifsdatasets.base import Base
 
+from typing import Optional
+
 
 class LibriVoxDansk(Base):
     """
     Dataset for the LibriVoxDansk dataset.
     """
 
+    repo_url = "git@github.com:rifs-is-free-speech/LibriVoxDansk.git"
+
     @staticmethod
-    def download(target_folder: str, verbose: bool = False, quiet: bool = False):
+    def download(
+        target_folder: str,
+        verbose: bool = False,
+        quiet: bool = False,
+        num_workers: Optional[int] = None,
+        sample_rate: Optional[int] = None,
+        channels: Optional[int] = None,
+        shallow: bool = False,
+        cache_dir: Optional[str] = None,
+        cache_max_bytes: Optional[int] = None,
+    ):
         """
         Download the dataset to the specified destination.
 
@@ -23,6 +37,22 @@ class LibriVoxDansk(Base):
             Whether to print the download progress with steps.
         quiet: bool
             Prints nothing.
+        num_workers: int
+            Number of processes converting mp3 to wav. Defaults to the number
+            of cpus.
+        sample_rate: int
+            Resample the wav files to this sample rate, e.g. 16000. Optional.
+        channels: int
+            Downmix the wav files to this number of channels. Optional.
+        shallow: bool
+            Clone only the latest commit of the default branch and check out
+            only the files the dataset uses.
+        cache_dir: str
+            Folder of a DatasetCache to reuse clones and conversions from
+            earlier downloads. Optional. Defaults to no cache.
+        cache_max_bytes: int
+            Size of the cache before the least recently used entries are
+            evicted. Optional. Defaults to 100 GiB.
 
         Returns
         -------
@@ -34,11 +64,15 @@ class LibriVoxDansk(Base):
 
         import pandas as pd
 
-        from rifsdatasets.utils import CloneProgress, convert_mp3_to_wav
+        from rifsdatasets.utils import (
+            clone_repository,
+            convert_mp3_files_to_wav,
+            write_errors,
+        )
 
-        from git import Repo
-        from shutil import move
+        from rifsdatasets.utils import move
         from tempfile import TemporaryDirectory
+        from rifsdatasets.cache import DatasetCache
 
         target = join(target_folder, "LibriVoxDansk")
         if verbose and not quiet:
@@ -52,13 +86,18 @@ class LibriVoxDansk(Base):
                 )
             return
 
-        with TemporaryDirectory() as tmpdirname:
+        cache = DatasetCache(cache_dir, cache_max_bytes) if cache_dir else None
+        os.makedirs(target_folder, exist_ok=True)
+        with TemporaryDirectory(dir=target_folder) as tmpdirname:
             if verbose and not quiet:
                 print("Created temporary directory", tmpdirname)
-            Repo.clone_from(
-                url="git@github.com:rifs-is-free-speech/LibriVoxDansk.git",
-                to_path=tmpdirname,
-                progress=None if quiet else CloneProgress(),
+            clone_repository(
+                LibriVoxDansk.repo_url,
+                tmpdirname,
+                quiet=quiet,
+                shallow=shallow,
+                cache=cache,
+                sparse_paths=["text", "audio"],
             )
             if verbose and not quiet:
                 print("Download complete!")
@@ -67,17 +106,27 @@ class LibriVoxDansk(Base):
             # Convert mp3 files to wav
             os.mkdir(join(tmpdirname, "audio_wav"))
             all_csv = pd.read_csv(join(tmpdirname, "all.csv"))
-            for i, row in all_csv.iterrows():
-                if verbose and not quiet:
-                    print(f"Converting {row['id']}")
-                convert_mp3_to_wav(
-                    src=join(tmpdirname, "audio", f"{row['id']}.mp3"),
-                    dst=join(tmpdirname, "audio_wav", f"{row['id']}.wav"),
-                )
+            report = convert_mp3_files_to_wav(
+                [
+                    (
+                        join(tmpdirname, "audio", f"{file_id}.mp3"),
+                        join(tmpdirname, "audio_wav", f"{file_id}.wav"),
+                    )
+                    for file_id in all_csv["id"]
+                ],
+                num_workers=num_workers,
+                verbose=verbose,
+                quiet=quiet,
+                streaming=True,
+                sample_rate=sample_rate,
+                channels=channels,
+                cache=cache,
+            )
 
             os.makedirs(target, exist_ok=True)
             if verbose and not quiet:
                 print(f"Created folder '{target}'")
+            write_errors(target, report.errors)
             move(join(tmpdirname, "all.csv"), f"{target}/all.csv")
             if verbose and not quiet:
                 print(f"Moved all.csv to '{target}'")
@@ -0,0 +1,254 @@
+"""
+Load the segments of a split dataset.
+
+The module contains the class SegmentDataset, which reads a split manifest
+written by split_dataset or merge_rifsdatasets, e.g. ``train.csv``, and
+memory-maps the wav files it refers to. Segments are returned as NumPy views
+into the mapped files, so nothing is read or copied until the samples are
+used. It follows the map-style dataset protocol of PyTorch (``__len__`` and
+``__getitem__``) and can be passed to a ``torch.utils.data.DataLoader``
+directly.
+
+Example
+-------
+    dataset = SegmentDataset("data/merged", "train")
+    segment = dataset[0]
+    segment.audio, segment.sample_rate, segment.row["text"]
+"""
+
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, NamedTuple, Optional, Tuple
+
+import os
+
+
+class Segment(NamedTuple):
+    """A segment of audio and its row in the manifest."""
+
+    #: Samples, shaped (frames,) for mono and (frames, channels) otherwise.
+    audio: Any
+    sample_rate: int
+    row: Dict[str, Any]
+
+
+class SegmentDataset:
+    """
+    Random access to the segments of a split manifest.
+
+    The path of a segment is its 'id' relative to the dataset. If the
+    manifest has 'start' and 'end' columns, in seconds, and the file is the
+    source recording, only that part of the file is returned. Files of the
+    segment alone, as written for split_dataset, are returned whole, see
+    segment_bounds. Wav files are opened lazily and the most recently used
+    ones are kept mapped.
+    """
+
+    def __init__(
+        self,
+        dataset_path: str,
+        split: str = "train",
+        path_column: str = "id",
+        start_column: Optional[str] = "start",
+        end_column: Optional[str] = "end",
+        max_open_files: int = 128,
+    ):
+        """
+        Initialize the dataset.
+
+        Parameters
+        ----------
+        dataset_path: str
+            Path to dataset.
+        split: str
+            Name of the manifest, e.g. 'train', 'valid', 'test' or 'all'.
+        path_column: str
+            Column with the path of the wav files relative to dataset_path.
+        start_column: str
+            Column with the start of the segments in seconds. Segments start
+            at the beginning of the file if None or missing.
+        end_column: str
+            Column with the end of the segments in seconds. Segments end at
+            the end of the file if None or missing.
+        max_open_files: int
+            Number of wav files kept memory-mapped.
+        """
+        import numpy as np
+        from rifsdatasets.manifest import read_manifest
+
+        self.dataset_path = dataset_path
+        self.split = split
+        self.max_open_files = max_open_files
+        self.manifest = read_manifest(dataset_path, split)
+        self._paths = self.manifest[path_column].astype(str).to_numpy()
+        self._starts = self._column(start_column, np.nan)
+        self._ends = self._column(end_column, np.nan)
+        self._open: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def _column(self, column: Optional[str], default: float):
+        """Get a column as a float array, or default if it is missing."""
+        import numpy as np
+
+        if column is None or column not in self.manifest.columns:
+            return np.full(len(self.manifest), default)
+        return self.manifest[column].to_numpy(dtype=float, na_value=default)
+
+    def __len__(self) -> int:
+        """Number of segments in the manifest."""
+        return len(self.manifest)
+
+    def __getitem__(self, index: int) -> Segment:
+        """
+        Get a segment.
+
+        Parameters
+        ----------
+        index: int
+            Row of the segment in the manifest. Negative indices count from
+            the end.
+
+        Returns
+        -------
+        Segment
+            A view of the samples, the sample rate and the manifest row.
+        """
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(f"Segment {index} is out of range.")
+
+        audio, sample_rate = self._map(self._paths[index])
+        start, end = segment_bounds(
+            self._starts[index], self._ends[index], sample_rate, len(audio)
+        )
+        return Segment(
+            audio=audio[start:end],
+            sample_rate=sample_rate,
+            row=self.manifest.iloc[index].to_dict(),
+        )
+
+    def __iter__(self) -> Iterator[Segment]:
+        """Iterate over the segments in the order of the manifest."""
+        for index in range(len(self)):
+            yield self[index]
+
+    def _map(self, path: str):
+        """
+        Memory-map a wav file, reusing it if it is already mapped.
+
+        Parameters
+        ----------
+        path: str
+            Path of the wav file relative to the dataset.
+
+        Returns
+        -------
+        Tuple[np.memmap, int]
+            The samples and the sample rate.
+        """
+        if path in self._open:
+            self._open.move_to_end(path)
+            return self._open[path]
+        mapped = map_wav(os.path.join(self.dataset_path, path))
+        self._open[path] = mapped
+        if len(self._open) > self.max_open_files:
+            self._open.popitem(last=False)
+        return mapped
+
+    def __getstate__(self):
+        """Pickle the dataset without its mapped files for worker processes."""
+        state = self.__dict__.copy()
+        state["_open"] = OrderedDict()
+        return state
+
+
+def segment_bounds(
+    start: float, end: float, sample_rate: int, frames: int
+) -> Tuple[int, int]:
+    """
+    Get the first and last sample of a segment in a wav file.
+
+    The 'start' and 'end' of a row are offsets in the source recording, but
+    the row can point at the source recording or at a file of the segment
+    alone, as the rows written by split_dataset do. Such a file is about as
+    long as the segment, so it is returned whole when it is closer in length
+    to the segment than to the end of the segment. Otherwise the segment is
+    cut out of the file.
+
+    Parameters
+    ----------
+    start: float
+        Start of the segment in seconds, NaN for the start of the file.
+    end: float
+        End of the segment in seconds, NaN for the end of the file.
+    sample_rate: int
+        Sample rate of the file.
+    frames: int
+        Number of frames in the file.
+
+    Returns
+    -------
+    Tuple[int, int]
+        The first sample and the sample after the last one.
+    """
+    import numpy as np
+
+    first = 0 if np.isnan(start) else int(round(start * sample_rate))
+    last = frames if np.isnan(end) else int(round(end * sample_rate))
+    if frames < last - first / 2:
+        return 0, frames
+    last = min(max(last, 0), frames)
+    return min(max(first, 0), last), last
+
+
+def map_wav(path: str):
+    """
+    Memory-map the samples of a wav file.
+
+    Parameters
+    ----------
+    path: str
+        Path to the wav file.
+
+    Returns
+    -------
+    Tuple[np.memmap, int]
+        Read-only samples, shaped (frames,) for mono and (frames, channels)
+        otherwise, and the sample rate.
+
+    Raises
+    ------
+    ValueError
+        If the samples are not 8, 16 or 32 bit integers or 32 or 64 bit
+        floats.
+    """
+    import numpy as np
+    from rifsdatasets.utils import read_wav_header
+
+    header = read_wav_header(path)
+    float_format = header.format_tag == 3
+    dtypes = {
+        (False, 1): np.uint8,
+        (False, 2): np.int16,
+        (False, 4): np.int32,
+        (True, 4): np.float32,
+        (True, 8): np.float64,
+    }
+    dtype = dtypes.get((float_format, header.sample_width))
+    if dtype is None:
+        raise ValueError(
+            f"{path} has {header.sample_width * 8} bit samples, "
+            "which cannot be memory-mapped."
+        )
+    if header.frames == 0:
+        audio = np.zeros((0, header.channels), dtype=dtype)
+    else:
+        audio = np.memmap(
+            path,
+            dtype=np.dtype(dtype).newbyteorder("<"),
+            mode="r",
+            offset=header.data_offset,
+            shape=(header.frames, header.channels),
+        )
+    if header.channels == 1:
+        audio = audio[:, 0]
+    return audio, header.sample_rate
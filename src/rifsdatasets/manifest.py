@@ -0,0 +1,342 @@
+"""
+Read and write the manifests of a dataset.
+
+Manifests are the tables listing the files of a dataset, e.g. ``all``,
+``train``, ``valid`` and ``test``. They are written as csv by default or as
+compressed Parquet, which keeps the column types and can be memory-mapped and
+read column by column. Writing a manifest removes the manifest of the same
+name in the other format, so a stale copy is never read instead.
+
+The module contains the following functions:
+
+    - manifest_path: Path of a manifest in a dataset.
+    - read_manifest: Read a manifest in either format.
+    - write_manifest: Write a manifest in the given format.
+    - iter_manifest: Read a manifest in chunks.
+    - ManifestWriter: Write a manifest chunk by chunk.
+
+"""
+
+from typing import Iterator, List, Optional
+
+import os
+
+from time import perf_counter
+
+from rifsdatasets.instrument import Event, emit, span
+
+MANIFEST_FORMATS = {"csv": ".csv", "parquet": ".parquet"}
+
+
+def manifest_path(
+    dataset_path: str, name: str, output_format: Optional[str] = None
+) -> str:
+    """
+    Get the path of a manifest.
+
+    Parameters
+    ----------
+    dataset_path: str
+        Path to dataset.
+    name: str
+        Name of the manifest without extension, e.g. 'train'.
+    output_format: str
+        'csv' or 'parquet'. Optional. Defaults to the most recently written
+        existing manifest, or csv if there is none.
+
+    Returns
+    -------
+    str
+        Path to the manifest file.
+    """
+    if output_format is not None:
+        assert (
+            output_format in MANIFEST_FORMATS
+        ), f"Manifest format must be one of {', '.join(MANIFEST_FORMATS)}."
+        return os.path.join(dataset_path, name + MANIFEST_FORMATS[output_format])
+
+    paths = [
+        os.path.join(dataset_path, name + extension)
+        for extension in MANIFEST_FORMATS.values()
+    ]
+    existing = [path for path in paths if os.path.exists(path)]
+    if not existing:
+        return paths[0]
+    return max(existing, key=os.path.getmtime)
+
+
+def read_manifest(
+    dataset_path: str,
+    name: str,
+    columns: Optional[List[str]] = None,
+    memory_map: bool = True,
+):
+    """
+    Read a manifest written as csv or Parquet.
+
+    Parameters
+    ----------
+    dataset_path: str
+        Path to dataset.
+    name: str
+        Name of the manifest without extension, e.g. 'train'.
+    columns: List[str]
+        Only read these columns. Optional. Defaults to all.
+    memory_map: bool
+        Memory-map Parquet files instead of reading them into memory.
+
+    Returns
+    -------
+    pd.DataFrame
+        The manifest.
+
+    Raises
+    ------
+    FileNotFoundError
+        If the dataset has no manifest with that name.
+    """
+    import pandas as pd
+
+    path = manifest_path(dataset_path, name)
+    if not os.path.exists(path):
+        # Missing manifests are expected, e.g. an optional audio index.
+        raise FileNotFoundError(f"No manifest '{name}' in {dataset_path}")
+    with span("read", path=path) as event:
+        if path.endswith(".parquet"):
+            df = pd.read_parquet(path, columns=columns, memory_map=memory_map)
+        else:
+            df = pd.read_csv(path, usecols=columns)
+        event.files, event.bytes = 1, os.path.getsize(path)
+        event.details["rows"] = len(df)
+    return df
+
+
+def write_manifest(
+    df,
+    dataset_path: str,
+    name: str,
+    output_format: str = "csv",
+    compression: str = "zstd",
+) -> str:
+    """
+    Write a manifest.
+
+    Parameters
+    ----------
+    df: pd.DataFrame
+        The manifest.
+    dataset_path: str
+        Path to dataset.
+    name: str
+        Name of the manifest without extension, e.g. 'train'.
+    output_format: str
+        'csv' or 'parquet'. Default is csv.
+    compression: str
+        Compression of Parquet files. Default is zstd.
+
+    Returns
+    -------
+    str
+        Path to the written file.
+    """
+    path = manifest_path(dataset_path, name, output_format)
+    with span("write", path=path, rows=len(df)) as event:
+        if output_format == "parquet":
+            df.to_parquet(path, index=False, compression=compression)
+        else:
+            df.to_csv(path, index=False)
+        event.files, event.bytes = 1, os.path.getsize(path)
+    _remove_other_formats(path)
+    return path
+
+
+def _remove_other_formats(path: str):
+    """
+    Remove the manifests with the name of path in the other formats.
+
+    Parameters
+    ----------
+    path: str
+        Path to a written manifest.
+
+    Returns
+    -------
+    None
+    """
+    stem = os.path.splitext(path)[0]
+    for extension in MANIFEST_FORMATS.values():
+        if stem + extension != path and os.path.exists(stem + extension):
+            os.remove(stem + extension)
+
+
+def iter_manifest(
+    dataset_path: str,
+    name: str,
+    chunk_size: int = 100_000,
+    columns: Optional[List[str]] = None,
+) -> Iterator:
+    """
+    Read a manifest written as csv or Parquet in chunks.
+
+    Parameters
+    ----------
+    dataset_path: str
+        Path to dataset.
+    name: str
+        Name of the manifest without extension, e.g. 'train'.
+    chunk_size: int
+        Number of rows in each chunk.
+    columns: List[str]
+        Only read these columns. Optional. Defaults to all.
+
+    Yields
+    ------
+    pd.DataFrame
+        The next chunk of the manifest.
+
+    Raises
+    ------
+    FileNotFoundError
+        If the dataset has no manifest with that name.
+    """
+    import pandas as pd
+
+    path = manifest_path(dataset_path, name)
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+
+        parquet = pq.ParquetFile(path, memory_map=True)
+        for batch in parquet.iter_batches(batch_size=chunk_size, columns=columns):
+            yield batch.to_pandas()
+        return
+    with pd.read_csv(path, usecols=columns, chunksize=chunk_size) as reader:
+        yield from reader
+
+
+class ManifestWriter:
+    """
+    Write a manifest chunk by chunk, so it never has to be in memory at once.
+
+    The manifest is written to a temporary file which replaces the manifest
+    when the writer is closed, so readers never see a partial manifest and
+    the manifest being replaced can be read while writing.
+    """
+
+    def __init__(
+        self,
+        dataset_path: str,
+        name: str,
+        columns: List[str],
+        output_format: str = "csv",
+        schema=None,
+        compression: str = "zstd",
+    ):
+        """
+        Initialize the writer.
+
+        Parameters
+        ----------
+        dataset_path: str
+            Path to dataset.
+        name: str
+            Name of the manifest without extension, e.g. 'train'.
+        columns: List[str]
+            Columns of the manifest. Missing columns in a chunk are left empty.
+        output_format: str
+            'csv' or 'parquet'. Default is csv.
+        schema: pa.Schema
+            Schema of Parquet manifests. Optional. Defaults to the schema of
+            the first chunk.
+        compression: str
+            Compression of Parquet files. Default is zstd.
+        """
+        self.path = manifest_path(dataset_path, name, output_format)
+        self.tmp_path = self.path + ".tmp"
+        self.columns = list(columns)
+        self.output_format = output_format
+        self.schema = schema
+        self.compression = compression
+        self.rows = 0
+        self._writer = None
+        self._start = perf_counter()
+
+    def write(self, df):
+        """
+        Append a chunk to the manifest.
+
+        Parameters
+        ----------
+        df: pd.DataFrame
+            The chunk.
+
+        Returns
+        -------
+        None
+        """
+        df = df.reindex(columns=self.columns)
+        if self.output_format == "parquet":
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            table = pa.Table.from_pandas(df, schema=self.schema, preserve_index=False)
+            if self._writer is None:
+                self._writer = pq.ParquetWriter(
+                    self.tmp_path, table.schema, compression=self.compression
+                )
+            self._writer.write_table(table)
+        else:
+            df.to_csv(
+                self.tmp_path,
+                mode="w" if self.rows == 0 else "a",
+                header=self.rows == 0,
+                index=False,
+            )
+        self.rows += len(df)
+
+    def close(self) -> str:
+        """
+        Finish the manifest and move it in place.
+
+        Returns
+        -------
+        str
+            Path to the written file.
+        """
+        if not os.path.exists(self.tmp_path):
+            # Nothing was written, so write the header or schema alone.
+            self.write(self._empty())
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        os.replace(self.tmp_path, self.path)
+        _remove_other_formats(self.path)
+        emit(
+            Event(
+                phase="write",
+                seconds=perf_counter() - self._start,
+                files=1,
+                bytes=os.path.getsize(self.path),
+                details=dict(path=self.path, rows=self.rows),
+            )
+        )
+        return self.path
+
+    def _empty(self):
+        """An empty chunk with the columns of the manifest."""
+        import pandas as pd
+
+        return pd.DataFrame(columns=self.columns)
+
+    def __enter__(self):
+        """Use the writer as a context manager closing it on exit."""
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Close the writer, or remove the partial manifest on an error."""
+        if exc_type is None:
+            self.close()
+            return
+        if self._writer is not None:
+            self._writer.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
@@ -1,16 +1,30 @@
 """
 This module contains the function to merge two datasets.
+
+Every merge records the merged sources and the format of the manifests in
+``merge_state.json`` in the merged dataset, so datasets can later be added
+incrementally.
 """
 
-from typing import List
+from typing import Iterable, List, Optional
+
+from rifsdatasets.instrument import traced
 
 
+@traced("merge")
 def merge_rifsdatasets(
     src_dataset: List[str],
     trg_dataset: str,
     specify_dirs: List[str],
     verbose: bool = False,
     quiet: bool = False,
+    output_format: str = "csv",
+    link_mode: str = "auto",
+    num_workers: int = 8,
+    seed: Optional[int] = None,
+    chunk_size: int = 100_000,
+    shuffle_buckets: int = 64,
+    incremental: bool = False,
 ):
     """
     Merge two or more datasets.
@@ -27,89 +41,493 @@ def merge_rifsdatasets(
         Whether to print the download progress with steps.
     quiet: bool
         Prints nothing.
+    output_format: str
+        Format of the merged manifests, 'csv' or 'parquet'. Default is csv.
+        The source manifests are read in either format.
+    link_mode: str
+        How files are put in the merged dataset: 'auto' hardlinks, reflinks
+        or copies, whichever the filesystem allows first. 'hardlink',
+        'reflink', 'symlink' or 'copy' force one method. Default is auto.
+    num_workers: int
+        Number of threads linking or copying files.
+    seed: int
+        Seed of the shuffle of the merged manifests. Optional. The merge is
+        reproducible when set.
+    chunk_size: int
+        Number of manifest rows read at a time.
+    shuffle_buckets: int
+        Number of temporary buckets the rows are shuffled into. Only one
+        bucket is held in memory at a time, so memory is bounded by the size
+        of the merged manifest divided by this number.
+    incremental: bool
+        Add src_dataset to the existing merged dataset in trg_dataset instead
+        of replacing it. Datasets that were merged before and have not changed
+        since, judged by their commit, manifests and file counts, are skipped.
+        New or changed datasets are linked and their rows replace any
+        previous rows in the merged manifests, which are shuffled again. The
+        manifests are also written again when output_format changed, and the
+        manifests in the old format are removed.
 
     Returns
     -------
     None
     """
 
-    import subprocess as sp
-    import pandas as pd
     import os
-    from collections import defaultdict
+    import shutil
+    from rifsdatasets.utils import LinkReport, link_tree
 
     if not specify_dirs:
         specify_dirs = ["audio", "text", "alignments"]
 
     os.makedirs(trg_dataset, exist_ok=True)
-    csvdict = defaultdict(list)
+    state_path = os.path.join(trg_dataset, "merge_state.json")
+    state = _load_state(state_path) if incremental else {"sources": {}}
+    changed = []
+    total = LinkReport()
     for dataset in src_dataset:
         dataset_name = os.path.basename(os.path.normpath(dataset))
+        source = _source_state(dataset, specify_dirs)
+        previous = state["sources"].get(dataset_name)
+        if incremental and previous == source:
+            if verbose and not quiet:
+                print(f"'{dataset}' is already merged into '{trg_dataset}'")
+            continue
+        changed.append(dataset)
 
         if verbose and not quiet:
             print(f"Merging {dataset} into {trg_dataset}")
 
-        for split in ["train.csv", "valid.csv", "test.csv"]:
-            try:
-                csv = pd.read_csv(os.path.join(dataset, split))
-            except FileNotFoundError:
-                if verbose and not quiet:
-                    print(f"Dataset {dataset} has no '{split}' split.")
-                continue
-
-            if "id" in csv.columns:
-                csv["id"] = csv["id"].apply(
-                    lambda x: os.path.join(
-                        str(x).split("/")[0],
-                        dataset_name,
-                        "/".join(str(x).split("/")[1:]),
-                    )
-                )
-            else:
-                if verbose and not quiet:
-                    print(
-                        f"Dataset {dataset} has no 'id' column. Will only merge files but not csv."
-                    )
-                continue
-
-            csvdict[split].append(csv)
-        skip_all = False
-        try:
-            allcsv = pd.read_csv(os.path.join(dataset, "all.csv"))
-            allcsv["id"] = allcsv["id"].apply(
-                lambda x: os.path.join(dataset_name, str(x))
-            )
-            csvdict["all.csv"].append(allcsv)
-        except FileNotFoundError:
-            skip_all = True
-            pass
-
         for dir in specify_dirs:
             dir_target = os.path.join(trg_dataset, dir, dataset_name)
+            if incremental and previous is not None:
+                shutil.rmtree(dir_target, ignore_errors=True)
             if not os.path.exists(os.path.join(dataset, dir)):
                 continue
             os.makedirs(dir_target, exist_ok=True)
             if verbose and not quiet:
-                print(f"Copying {dir} from '{dataset}' to '{trg_dataset}'")
-            sp.run(
-                f"cp -R {os.path.join(dataset, dir)}/* {dir_target}",
-                shell=True,
-                check=True,
+                print(f"Linking {dir} from '{dataset}' to '{trg_dataset}'")
+            report = link_tree(
+                os.path.join(dataset, dir),
+                dir_target,
+                mode=link_mode,
+                num_workers=num_workers,
             )
+            total.files += report.files
+            total.bytes += report.bytes
+            total.bytes_copied += report.bytes_copied
+            if verbose and not quiet:
+                print(report)
 
+        state["sources"][dataset_name] = source
         if not quiet:
             print(f"Finished merging '{dataset}' into '{trg_dataset}'\n")
 
+    reformat = state.get("output_format", "csv") != output_format
+    if not changed and not reformat:
+        if not quiet:
+            print(f"'{trg_dataset}' is up to date.")
+        return
+
     if not quiet:
+        print(total)
         print("Merging csv files...")
-    for split in ["train.csv", "valid.csv", "test.csv"]:
-        csv = pd.concat(csvdict[split])
-        csv = csv.sample(frac=1).reset_index(drop=True)
-        csv.to_csv(os.path.join(trg_dataset, split), index=False)
+    _merge_manifests(
+        changed,
+        trg_dataset,
+        output_format=output_format,
+        seed=seed,
+        chunk_size=chunk_size,
+        shuffle_buckets=shuffle_buckets,
+        verbose=verbose,
+        quiet=quiet,
+        keep_existing=incremental,
+    )
+    state["output_format"] = output_format
+    _save_state(state_path, state)
 
-    if not quiet:
-        print("creating all.csv")
-    if not skip_all:
-        allcsv = pd.concat(csvdict["all.csv"])
-        allcsv = allcsv.sample(frac=1).reset_index(drop=True)
-        allcsv.to_csv(os.path.join(trg_dataset, "all.csv"), index=False)
+
+def _source_state(dataset: str, specify_dirs: List[str]) -> dict:
+    """
+    Describe a source dataset, to tell whether it changed since it was merged.
+
+    Parameters
+    ----------
+    dataset: str
+        Path to the dataset.
+    specify_dirs: List[str]
+        Merged directories, their files are counted.
+
+    Returns
+    -------
+    dict
+        Path, commit if the dataset is a git repository, hash of the
+        manifests and number of files in every merged directory.
+    """
+    import hashlib
+    import os
+    from rifsdatasets.manifest import MANIFEST_FORMATS
+
+    commit = None
+    if os.path.isdir(os.path.join(dataset, ".git")):
+        from git import Repo
+
+        commit = Repo(dataset).head.commit.hexsha
+
+    sha256 = hashlib.sha256()
+    for split in ["train", "valid", "test", "all"]:
+        for extension in MANIFEST_FORMATS.values():
+            path = os.path.join(dataset, split + extension)
+            if not os.path.exists(path):
+                continue
+            sha256.update(os.path.basename(path).encode())
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    sha256.update(chunk)
+
+    files = {}
+    for dir in specify_dirs:
+        path = os.path.join(dataset, dir)
+        if os.path.exists(path):
+            files[dir] = sum(
+                len(filenames) for _, _, filenames in os.walk(path, followlinks=True)
+            )
+    return dict(
+        path=os.path.abspath(dataset),
+        commit=commit,
+        manifest_hash=sha256.hexdigest(),
+        files=files,
+    )
+
+
+def _load_state(path: str) -> dict:
+    """
+    Read the merge state of a merged dataset.
+
+    Parameters
+    ----------
+    path: str
+        Path to merge_state.json.
+
+    Returns
+    -------
+    dict
+        The state, with no sources if the dataset has not been merged yet.
+    """
+    import json
+
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"sources": {}}
+
+
+def _save_state(path: str, state: dict):
+    """
+    Atomically write the merge state of a merged dataset.
+
+    Parameters
+    ----------
+    path: str
+        Path to merge_state.json.
+    state: dict
+        The state.
+
+    Returns
+    -------
+    None
+    """
+    import json
+    import os
+
+    with open(path + ".tmp", "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def _merge_manifests(
+    src_dataset: List[str],
+    trg_dataset: str,
+    output_format: str = "csv",
+    seed: Optional[int] = None,
+    chunk_size: int = 100_000,
+    shuffle_buckets: int = 64,
+    verbose: bool = False,
+    quiet: bool = False,
+    keep_existing: bool = False,
+):
+    """
+    Merge and shuffle the manifests of datasets with bounded memory.
+
+    Parameters
+    ----------
+    src_dataset: List[str]
+        Datasets whose manifests are merged.
+    trg_dataset: str
+        Path to the merged dataset.
+    output_format: str
+        Format of the merged manifests, 'csv' or 'parquet'.
+    seed: int
+        Seed of the shuffle. Optional.
+    chunk_size: int
+        Number of manifest rows read at a time.
+    shuffle_buckets: int
+        Number of temporary buckets the rows are shuffled into.
+    verbose: bool
+        Print the datasets missing a manifest.
+    quiet: bool
+        Prints nothing.
+    keep_existing: bool
+        Keep the rows of the existing merged manifests, except those of the
+        datasets in src_dataset, and shuffle them with the new rows.
+
+    Returns
+    -------
+    None
+    """
+    from itertools import chain
+
+    import numpy as np
+    from rifsdatasets.audio_index import INDEX_NAME
+
+    rng = np.random.default_rng(seed)
+    # The audio index is merged like a manifest, when the datasets have one.
+    for split in ["train", "valid", "test", "all", INDEX_NAME]:
+        chunks = _prefixed_chunks(src_dataset, split, chunk_size, verbose and not quiet)
+        if keep_existing:
+            chunks = chain(
+                _existing_chunks(trg_dataset, src_dataset, split, chunk_size),
+                chunks,
+            )
+        if split == "all" and not quiet:
+            print("creating all.csv")
+        _shuffle_manifest(
+            chunks, trg_dataset, split, output_format, rng, shuffle_buckets
+        )
+
+
+def _prefixed_chunks(
+    src_dataset: List[str], split: str, chunk_size: int, verbose: bool = False
+) -> Iterable:
+    """
+    Read a manifest of every dataset in chunks and prefix the ids.
+
+    Ids of the splits start with the folder, e.g. 'audio/x.wav' becomes
+    'audio/<dataset>/x.wav'. Ids in 'all' and the audio index are relative to
+    the folders and become '<dataset>/x.wav'. The 'file' column of the audio
+    index is prefixed like the ids of the splits.
+
+    Parameters
+    ----------
+    src_dataset: List[str]
+        Datasets to read.
+    split: str
+        Name of the manifest, e.g. 'train' or 'all'.
+    chunk_size: int
+        Number of rows in each chunk.
+    verbose: bool
+        Print the datasets missing the manifest or its id column.
+
+    Yields
+    ------
+    pd.DataFrame
+        The next chunk with prefixed ids.
+    """
+    import os
+    from rifsdatasets.audio_index import INDEX_NAME
+    from rifsdatasets.manifest import iter_manifest
+
+    for dataset in src_dataset:
+        dataset_name = os.path.basename(os.path.normpath(dataset))
+        try:
+            for csv in iter_manifest(dataset, split, chunk_size=chunk_size):
+                if "id" not in csv.columns:
+                    if verbose:
+                        print(
+                            f"Dataset {dataset} has no 'id' column. Will only merge files but not csv."
+                        )
+                    break
+                if csv.empty:
+                    continue
+                csv["id"] = _prefix_ids(csv["id"], dataset_name, split)
+                if split == INDEX_NAME:
+                    csv["file"] = _prefix_ids(csv["file"], dataset_name, "file")
+                yield csv
+        except FileNotFoundError:
+            if verbose and split != INDEX_NAME:
+                print(f"Dataset {dataset} has no '{split}' split.")
+
+
+def _existing_chunks(
+    trg_dataset: str, src_dataset: List[str], split: str, chunk_size: int
+) -> Iterable:
+    """
+    Read a merged manifest in chunks without the rows of some datasets.
+
+    Parameters
+    ----------
+    trg_dataset: str
+        Path to the merged dataset.
+    src_dataset: List[str]
+        Datasets whose rows are left out.
+    split: str
+        Name of the manifest, e.g. 'train' or 'all'.
+    chunk_size: int
+        Number of rows in each chunk.
+
+    Yields
+    ------
+    pd.DataFrame
+        The next chunk.
+    """
+    import os
+    from rifsdatasets.audio_index import INDEX_NAME
+    from rifsdatasets.manifest import iter_manifest
+
+    names = [os.path.basename(os.path.normpath(dataset)) for dataset in src_dataset]
+    try:
+        for csv in iter_manifest(trg_dataset, split, chunk_size=chunk_size):
+            if csv.empty:
+                continue
+            parts = csv["id"].astype(str).str.split("/", n=2, expand=True)
+            dataset_names = parts[0] if split in ("all", INDEX_NAME) else parts[1]
+            yield csv[~dataset_names.isin(names)]
+    except FileNotFoundError:
+        return
+
+
+def _prefix_ids(ids, dataset_name: str, split: str):
+    """
+    Insert the dataset name in ids with vectorized string operations.
+
+    Parameters
+    ----------
+    ids: pd.Series
+        The ids.
+    dataset_name: str
+        Name of the dataset.
+    split: str
+        Name of the manifest, ids of 'all' and the audio index are prefixed
+        with the name.
+
+    Returns
+    -------
+    pd.Series
+        The prefixed ids.
+    """
+    from rifsdatasets.audio_index import INDEX_NAME
+
+    ids = ids.astype(str)
+    if split in ("all", INDEX_NAME):
+        return dataset_name + "/" + ids
+    parts = ids.str.split("/", n=1, expand=True)
+    rest = parts[1].fillna("") if parts.shape[1] > 1 else ""
+    return parts[0] + "/" + dataset_name + "/" + rest
+
+
+def _shuffle_manifest(
+    chunks: Iterable,
+    trg_dataset: str,
+    name: str,
+    output_format: str,
+    rng,
+    shuffle_buckets: int = 64,
+) -> int:
+    """
+    Shuffle chunks of a manifest to disk with a two-pass external shuffle.
+
+    Every row is first sent to a random bucket on disk, then every bucket is
+    loaded, shuffled and appended to the manifest. The result is a uniform
+    shuffle of all rows while only one chunk or bucket is held in memory.
+    Columns missing in some chunks are left empty. Nothing is written if
+    there are no chunks.
+
+    Parameters
+    ----------
+    chunks: Iterable[pd.DataFrame]
+        The rows of the manifest.
+    trg_dataset: str
+        Path to the dataset the manifest is written to.
+    name: str
+        Name of the manifest, e.g. 'train'.
+    output_format: str
+        'csv' or 'parquet'.
+    rng: np.random.Generator
+        Random generator of the shuffle.
+    shuffle_buckets: int
+        Number of buckets.
+
+    Returns
+    -------
+    int
+        Number of rows written.
+    """
+    import os
+    import pickle
+    import tempfile
+
+    import pandas as pd
+    from rifsdatasets.manifest import ManifestWriter
+
+    columns: List[str] = []
+    schema = None
+    with tempfile.TemporaryDirectory(dir=trg_dataset) as tmpdirname:
+        files = {}
+        try:
+            for chunk in chunks:
+                columns.extend(c for c in chunk.columns if c not in columns)
+                if output_format == "parquet":
+                    schema = _unify_schema(schema, chunk)
+                buckets = rng.integers(shuffle_buckets, size=len(chunk))
+                for bucket, part in chunk.groupby(buckets):
+                    if bucket not in files:
+                        files[bucket] = open(
+                            os.path.join(tmpdirname, f"{bucket}.pkl"), "wb"
+                        )
+                    pickle.dump(part, files[bucket], pickle.HIGHEST_PROTOCOL)
+        finally:
+            for f in files.values():
+                f.close()
+        if not files:
+            return 0
+
+        with ManifestWriter(
+            trg_dataset, name, columns, output_format, schema=schema
+        ) as writer:
+            for bucket in sorted(files):
+                frames = []
+                with open(os.path.join(tmpdirname, f"{bucket}.pkl"), "rb") as f:
+                    while True:
+                        try:
+                            frames.append(pickle.load(f))
+                        except EOFError:
+                            break
+                df = pd.concat(frames)
+                writer.write(df.sample(frac=1, random_state=rng))
+        return writer.rows
+
+
+def _unify_schema(schema, chunk):
+    """
+    Widen a Parquet schema so it also fits a chunk.
+
+    Parameters
+    ----------
+    schema: pa.Schema
+        The schema so far, or None.
+    chunk: pd.DataFrame
+        The chunk.
+
+    Returns
+    -------
+    pa.Schema
+        The unified schema.
+    """
+    import pyarrow as pa
+
+    chunk_schema = pa.Schema.from_pandas(chunk, preserve_index=False)
+    chunk_schema = chunk_schema.remove_metadata()
+    if schema is None:
+        return chunk_schema
+    return pa.unify_schemas([schema, chunk_schema], promote_options="permissive")
@@ -0,0 +1,214 @@
+"""
+Download several datasets at once.
+
+The module contains one function, download_datasets, which runs the download
+of every requested dataset in all_datasets concurrently. Clones, http fetches
+and conversions of all datasets share one limit on network connections and one
+pool of cpu workers, so a full rebuild takes as long as the slowest dataset
+instead of the sum of all of them. While they run, the files and bytes
+fetched and converted by all datasets are added up from their instrumentation
+events and printed as one progress line. Used by ``python -m rifsdatasets``.
+"""
+
+from threading import Lock
+from time import monotonic
+from typing import Dict, List, Optional
+
+#: Counts of every dataset in the progress and the summary.
+_COUNTS = ["fetched", "fetched_bytes", "converted", "converted_bytes"]
+
+
+class _Progress:
+    """Sink adding up the fetched and converted files of every dataset."""
+
+    def __init__(self, names: List[str], interval: float, quiet: bool):
+        """
+        Initialize the progress.
+
+        Parameters
+        ----------
+        names: List[str]
+            Names of the datasets downloading.
+        interval: float
+            Minimum number of seconds between printed progress lines.
+        quiet: bool
+            Prints nothing.
+        """
+        self.totals = {name: dict.fromkeys(_COUNTS, 0) for name in names}
+        self.finished = 0
+        self.interval = interval
+        self.quiet = quiet
+        self._lock = Lock()
+        self._printed = monotonic()
+
+    def __call__(self, event):
+        """
+        Add the files of a fetch or conversion to its dataset.
+
+        Parameters
+        ----------
+        event: Event
+            An event of the pipeline.
+
+        Returns
+        -------
+        None
+        """
+        phases = {"fetch": "fetched", "convert_file": "converted"}
+        if event.phase not in phases or event.dataset not in self.totals:
+            return
+        with self._lock:
+            totals = self.totals[event.dataset]
+            totals[phases[event.phase]] += event.files
+            totals[f"{phases[event.phase]}_bytes"] += event.bytes
+            if monotonic() - self._printed >= self.interval:
+                self._printed = monotonic()
+                if not self.quiet:
+                    print(self.line())
+
+    def finish(self, name: str) -> dict:
+        """
+        Count a dataset as finished.
+
+        Parameters
+        ----------
+        name: str
+            Name of the dataset.
+
+        Returns
+        -------
+        dict
+            The files and bytes fetched and converted by the dataset.
+        """
+        with self._lock:
+            self.finished += 1
+            return dict(self.totals[name])
+
+    def line(self) -> str:
+        """One line with the sums over all datasets."""
+        sums = {
+            key: sum(totals[key] for totals in self.totals.values()) for key in _COUNTS
+        }
+        return (
+            f"[progress] {self.finished}/{len(self.totals)} datasets finished, "
+            f"{sums['fetched']} files fetched ({sums['fetched_bytes'] / 1e6:.1f} MB), "
+            f"{sums['converted']} files converted "
+            f"({sums['converted_bytes'] / 1e6:.1f} MB)"
+        )
+
+
+def download_datasets(
+    names: List[str],
+    target_folder: str,
+    max_parallel: Optional[int] = None,
+    max_connections: int = 16,
+    num_workers: Optional[int] = None,
+    verbose: bool = False,
+    quiet: bool = False,
+    progress_interval: float = 10.0,
+    **download_kwargs,
+) -> Dict[str, dict]:
+    """
+    Download datasets concurrently.
+
+    Parameters
+    ----------
+    names: List[str]
+        Names of datasets in all_datasets.
+    target_folder: str
+        The destination folder to download the datasets to.
+    max_parallel: int
+        Number of datasets downloading at the same time. Defaults to all.
+    max_connections: int
+        Maximum number of open network connections across all datasets.
+    num_workers: int
+        Number of processes converting audio for all datasets. Defaults to the
+        number of cpus.
+    verbose: bool
+        Print the progress of every dataset. Otherwise only the start, end and
+        summary of each dataset is printed.
+    quiet: bool
+        Prints nothing.
+    progress_interval: float
+        Minimum number of seconds between lines with the combined progress
+        of all datasets. Default is 10.
+    download_kwargs:
+        Passed on to the download of every dataset that accepts them, e.g.
+        shallow, cache_dir, cache_max_bytes or sample_rate.
+
+    Returns
+    -------
+    Dict[str, dict]
+        For every dataset its status ('done' or 'failed'), wall time in
+        seconds, the number of files and bytes fetched and converted, and the
+        error message if it failed.
+    """
+    import inspect
+    from concurrent.futures import ThreadPoolExecutor
+    from time import perf_counter
+
+    from rifsdatasets import all_datasets
+    from rifsdatasets.instrument import instrumented
+    from rifsdatasets.utils import shared_resources
+
+    unknown = [name for name in names if name not in all_datasets]
+    if unknown:
+        raise ValueError(
+            f"Unknown datasets: {', '.join(unknown)}. "
+            f"Options are: {', '.join(all_datasets)}"
+        )
+
+    summary: Dict[str, dict] = {}
+    progress = _Progress(names, progress_interval, quiet)
+
+    def run(name: str):
+        """Download a single dataset and record it in the summary."""
+        download = all_datasets[name].download
+        accepted = inspect.signature(download).parameters
+        kwargs = {k: v for k, v in download_kwargs.items() if k in accepted}
+        if not quiet:
+            print(f"[{name}] started")
+        start = perf_counter()
+        try:
+            download(
+                target_folder,
+                verbose=verbose and not quiet,
+                quiet=quiet or not verbose,
+                **kwargs,
+            )
+        except Exception as e:
+            summary[name] = dict(
+                status="failed",
+                seconds=perf_counter() - start,
+                error=f"{type(e).__name__}: {e}",
+                **progress.finish(name),
+            )
+            if not quiet:
+                print(f"[{name}] failed: {e}")
+            return
+        summary[name] = dict(
+            status="done", seconds=perf_counter() - start, **progress.finish(name)
+        )
+        if not quiet:
+            print(f"[{name}] done in {summary[name]['seconds']:.1f}s")
+
+    start = perf_counter()
+    with shared_resources(
+        max_connections=max_connections, num_workers=num_workers
+    ), instrumented(progress):
+        with ThreadPoolExecutor(max_workers=max_parallel or len(names) or 1) as pool:
+            list(pool.map(run, names))
+
+    if not quiet:
+        print(f"\nDownloaded {len(names)} datasets in {perf_counter() - start:.1f}s")
+        width = max((len(name) for name in names), default=0)
+        for name in names:
+            result = summary[name]
+            line = (
+                f"{name:<{width}}  {result['status']:<6}  {result['seconds']:8.1f}s"
+                f"  {result['fetched']:6d} fetched  {result['converted']:6d} converted"
+            )
+            if "error" in result:
+                line += f"  {result['error'].splitlines()[0]}"
+            print(line)
+    return summary
@@ -0,0 +1,207 @@
+"""
+Batch the segments of a split by duration.
+
+The module contains the class DurationBucketSampler, which groups segments of
+similar duration into batches under a budget of padded seconds, so batches of
+short segments hold many of them and little time is spent on padding. It
+follows the batch sampler protocol of PyTorch and can be passed as
+``batch_sampler`` to a ``torch.utils.data.DataLoader`` over a SegmentDataset.
+
+Example
+-------
+    dataset = SegmentDataset("data/merged", "train")
+    sampler = DurationBucketSampler.from_manifest(
+        "data/merged", "train", max_duration=600, rank=rank, world_size=world
+    )
+    for epoch in range(epochs):
+        sampler.set_epoch(epoch)
+        for batch in sampler:
+            segments = [dataset[i] for i in batch]
+"""
+
+from typing import Iterator, List, Optional, Sequence
+
+
+class DurationBucketSampler:
+    """
+    Length-bucketed batches with a maximum duration per batch.
+
+    Segments are sorted by duration and divided into buckets of equal size.
+    Every epoch the segments within each bucket are shuffled and cut into
+    batches whose padded duration, the number of segments times the longest
+    segment, stays within max_duration. The batches of all buckets are then
+    shuffled and dealt out to the ranks. The batches depend only on the seed
+    and the epoch, so every rank builds the same ones and takes its share.
+    """
+
+    def __init__(
+        self,
+        durations: Sequence[float],
+        max_duration: float,
+        num_buckets: int = 20,
+        shuffle: bool = True,
+        seed: int = 0,
+        rank: int = 0,
+        world_size: int = 1,
+        drop_last: bool = False,
+    ):
+        """
+        Initialize the sampler.
+
+        Parameters
+        ----------
+        durations: Sequence[float]
+            Duration in seconds of every segment, in the order of the dataset.
+        max_duration: float
+            Maximum padded duration of a batch in seconds. Segments longer
+            than this are batched alone.
+        num_buckets: int
+            Number of duration buckets.
+        shuffle: bool
+            Shuffle the segments in the buckets and the order of the batches.
+        seed: int
+            Seed of the shuffles.
+        rank: int
+            Rank of this process among world_size processes.
+        world_size: int
+            Number of processes sharing the batches.
+        drop_last: bool
+            Drop the batches that do not divide evenly over the ranks instead
+            of repeating batches to fill up the last round.
+        """
+        import numpy as np
+
+        assert max_duration > 0, "Max duration must be positive."
+        assert 0 <= rank < world_size, "Rank must be between 0 and world_size."
+        self.durations = np.asarray(durations, dtype=float)
+        self.max_duration = max_duration
+        self.num_buckets = max(1, num_buckets)
+        self.shuffle = shuffle
+        self.seed = seed
+        self.rank = rank
+        self.world_size = world_size
+        self.drop_last = drop_last
+        self.epoch = 0
+        self._batches: Optional[List[List[int]]] = None
+
+        order = np.argsort(self.durations, kind="stable")
+        self.buckets = [
+            bucket for bucket in np.array_split(order, self.num_buckets) if len(bucket)
+        ]
+
+    @classmethod
+    def from_manifest(cls, dataset_path: str, split: str = "train", **kwargs):
+        """
+        Create a sampler for a split manifest.
+
+        Durations are taken from the 'start' and 'end' columns, otherwise
+        from the audio index of the dataset, see build_audio_index, and
+        otherwise from the wav headers. A missing end is the end of the file.
+
+        Parameters
+        ----------
+        dataset_path: str
+            Path to dataset.
+        split: str
+            Name of the manifest, e.g. 'train'.
+        kwargs:
+            Passed on to DurationBucketSampler, e.g. max_duration and seed.
+
+        Returns
+        -------
+        DurationBucketSampler
+            The sampler, in the order of the rows of the manifest.
+        """
+        import os
+
+        import numpy as np
+        from rifsdatasets.audio_index import read_durations
+        from rifsdatasets.manifest import read_manifest
+        from rifsdatasets.utils import read_wav_header
+
+        manifest = read_manifest(dataset_path, split)
+        durations = np.full(len(manifest), np.nan)
+        if "start" in manifest.columns and "end" in manifest.columns:
+            durations = np.array(manifest["end"] - manifest["start"], dtype=float)
+        missing = np.flatnonzero(np.isnan(durations))
+        if len(missing):
+            index = read_durations(dataset_path)
+            paths = manifest["id"].astype(str).to_numpy()
+            start = (
+                manifest["start"].fillna(0).to_numpy(dtype=float)
+                if "start" in manifest.columns
+                else np.zeros(len(manifest))
+            )
+            for i in missing:
+                path = paths[i]
+                if path in index:
+                    duration = index[path]
+                else:
+                    duration = read_wav_header(
+                        os.path.join(dataset_path, path)
+                    ).duration
+                durations[i] = duration - start[i]
+        return cls(durations, **kwargs)
+
+    def set_epoch(self, epoch: int):
+        """
+        Set the epoch, which changes the shuffle of the next iteration.
+
+        Parameters
+        ----------
+        epoch: int
+            The epoch.
+
+        Returns
+        -------
+        None
+        """
+        if epoch != self.epoch:
+            self.epoch = epoch
+            self._batches = None
+
+    def _build(self) -> List[List[int]]:
+        """Build the batches of this rank in the current epoch."""
+        from itertools import islice
+
+        import numpy as np
+
+        if self._batches is not None:
+            return self._batches
+
+        rng = np.random.default_rng([self.seed, self.epoch])
+        batches = []
+        for bucket in self.buckets:
+            if self.shuffle:
+                bucket = rng.permutation(bucket)
+            batch: List[int] = []
+            longest = 0.0
+            for index in bucket:
+                duration = self.durations[index]
+                longest_after = max(longest, duration)
+                if batch and longest_after * (len(batch) + 1) > self.max_duration:
+                    batches.append(batch)
+                    batch, longest_after = [], duration
+                batch.append(int(index))
+                longest = longest_after
+            if batch:
+                batches.append(batch)
+        if self.shuffle:
+            batches = [batches[i] for i in rng.permutation(len(batches))]
+
+        remainder = len(batches) % self.world_size
+        if remainder and self.drop_last:
+            batches = batches[: len(batches) - remainder]
+        elif remainder:
+            padding = self.world_size - remainder
+            batches += (batches * padding)[:padding]
+        self._batches = list(islice(batches, self.rank, None, self.world_size))
+        return self._batches
+
+    def __iter__(self) -> Iterator[List[int]]:
+        """Iterate over the batches of this rank in the current epoch."""
+        return iter(self._build())
+
+    def __len__(self) -> int:
+        """Number of batches of this rank in the current epoch."""
+        return len(self._build())
@@ -0,0 +1,318 @@
+"""
+Pack a split dataset into large shards for sequential reads.
+
+A shard is a flat blob of raw PCM samples, ``<split>-<n>.pcm``, and an index
+manifest, ``<split>-<n>.csv`` or ``.parquet``, with the byte offset, frames,
+channels, sample rate and sample type of every segment next to the columns
+of the split manifest. Reading a shard is a single sequential read instead
+of one small read per segment.
+
+The module contains the following:
+
+    - pack_shards: Pack a split into shards in parallel.
+    - ShardReader: Stream the segments of packed shards with a shuffle buffer.
+
+"""
+
+from typing import Iterator, List, Optional
+
+import os
+
+
+def pack_shards(
+    dataset_path: str,
+    split: str = "train",
+    output_dir: Optional[str] = None,
+    shard_size: int = 1 << 30,
+    num_workers: Optional[int] = None,
+    output_format: str = "csv",
+    verbose: bool = False,
+    quiet: bool = False,
+) -> List[str]:
+    """
+    Pack the segments of a split into shards.
+
+    Parameters
+    ----------
+    dataset_path: str
+        Path to dataset.
+    split: str
+        Name of the manifest, e.g. 'train', 'valid', 'test' or 'all'.
+    output_dir: str
+        Folder of the shards. Defaults to 'shards' in the dataset.
+    shard_size: int
+        Approximate size of each shard in bytes. Default is 1 GiB.
+    num_workers: int
+        Number of processes writing shards. Defaults to the number of cpus.
+    output_format: str
+        Format of the shard indices, 'csv' or 'parquet'. Default is csv.
+    verbose: bool
+        Print the progress.
+    quiet: bool
+        Prints nothing.
+
+    Returns
+    -------
+    List[str]
+        Paths to the written shards.
+    """
+    from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+    import numpy as np
+    from rifsdatasets.manifest import read_manifest
+    from rifsdatasets.utils import read_wav_header
+
+    output_dir = output_dir or os.path.join(dataset_path, "shards")
+    os.makedirs(output_dir, exist_ok=True)
+    for stale in _shard_files(output_dir, split):
+        os.remove(stale)
+    manifest = read_manifest(dataset_path, split)
+    if verbose and not quiet:
+        print(f"Packing {len(manifest)} segments of '{split}' into {output_dir}")
+
+    paths = manifest["id"].astype(str)
+    unique = paths.unique()
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        headers = dict(
+            zip(
+                unique,
+                executor.map(
+                    lambda path: read_wav_header(os.path.join(dataset_path, path)),
+                    unique,
+                ),
+            )
+        )
+
+    # Plan shards by the size of the segments so they can be written in parallel.
+    frame_bytes = paths.map(lambda p: headers[p].channels * headers[p].sample_width)
+    rates = paths.map(lambda p: headers[p].sample_rate).to_numpy(dtype=float)
+    frames = paths.map(lambda p: headers[p].frames).to_numpy(dtype=float)
+    if "start" in manifest.columns and "end" in manifest.columns:
+        start = manifest["start"].to_numpy(dtype=float, na_value=0.0)
+        end = manifest["end"].to_numpy(dtype=float, na_value=np.nan)
+        frames = np.where(np.isnan(end), frames, end * rates) - start * rates
+    sizes = np.maximum(frames, 0) * frame_bytes.to_numpy()
+    shard_ids = (np.cumsum(sizes) - sizes) // max(1, shard_size)
+
+    names = [
+        f"{split}-{i:05d}" for i in range(int(shard_ids.max()) + 1 if len(sizes) else 0)
+    ]
+    jobs = [
+        (dataset_path, manifest[shard_ids == i], output_dir, name, output_format)
+        for i, name in enumerate(names)
+    ]
+    jobs = [job for job in jobs if len(job[1])]
+    written = []
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        for path in executor.map(_pack_shard, *zip(*jobs)) if jobs else []:
+            written.append(path)
+            if verbose and not quiet:
+                print(f"Wrote {path}")
+    if not quiet:
+        print(f"Packed {len(manifest)} segments into {len(written)} shards")
+    return written
+
+
+def _pack_shard(
+    dataset_path: str, rows, output_dir: str, name: str, output_format: str
+) -> str:
+    """
+    Write a single shard.
+
+    Parameters
+    ----------
+    dataset_path: str
+        Path to dataset.
+    rows: pd.DataFrame
+        The rows of the split manifest in the shard.
+    output_dir: str
+        Folder of the shards.
+    name: str
+        Name of the shard without extension.
+    output_format: str
+        Format of the index, 'csv' or 'parquet'.
+
+    Returns
+    -------
+    str
+        Path to the blob of the shard.
+    """
+    import numpy as np
+    from rifsdatasets.loader import map_wav, segment_bounds
+    from rifsdatasets.manifest import write_manifest
+
+    has_times = "start" in rows.columns and "end" in rows.columns
+    blob = os.path.join(output_dir, name + ".pcm")
+    index = {
+        "offset": [],
+        "frames": [],
+        "channels": [],
+        "sample_rate": [],
+        "dtype": [],
+    }
+    offset = 0
+    with open(blob + ".part", "wb") as f:
+        for _, row in rows.iterrows():
+            audio, sample_rate = map_wav(os.path.join(dataset_path, str(row["id"])))
+            if has_times:
+                start, end = segment_bounds(
+                    float(row["start"]), float(row["end"]), sample_rate, len(audio)
+                )
+                audio = audio[start:end]
+            data = np.ascontiguousarray(audio)
+            f.write(data.tobytes())
+            index["offset"].append(offset)
+            index["frames"].append(len(data))
+            index["channels"].append(1 if data.ndim == 1 else data.shape[1])
+            index["sample_rate"].append(sample_rate)
+            index["dtype"].append(data.dtype.str)
+            offset += data.nbytes
+    os.replace(blob + ".part", blob)
+
+    rows = rows.reset_index(drop=True)
+    for column, values in index.items():
+        rows[column] = values
+    write_manifest(rows, output_dir, name, output_format)
+    return blob
+
+
+def _shard_files(
+    shard_dir: str, split: str, extensions=(".pcm", ".csv", ".parquet")
+) -> List[str]:
+    """
+    Find the files of the shards of a split.
+
+    Parameters
+    ----------
+    shard_dir: str
+        Folder of the shards.
+    split: str
+        Name of the packed split.
+    extensions: Tuple[str]
+        Extensions of the files to find.
+
+    Returns
+    -------
+    List[str]
+        Sorted paths to the files.
+    """
+    import re
+
+    pattern = re.compile(
+        re.escape(split) + r"-\d{5}(" + "|".join(map(re.escape, extensions)) + ")"
+    )
+    return sorted(
+        os.path.join(shard_dir, name)
+        for name in os.listdir(shard_dir)
+        if pattern.fullmatch(name)
+    )
+
+
+class ShardReader:
+    """
+    Stream the segments of packed shards.
+
+    Shards are read one at a time from start to end. Segments pass through a
+    shuffle buffer, so the order is random within a window of shuffle_buffer
+    segments while the reads stay sequential.
+    """
+
+    def __init__(
+        self,
+        shard_dir: str,
+        split: str = "train",
+        shuffle_buffer: int = 0,
+        shuffle_shards: bool = True,
+        seed: Optional[int] = None,
+        read_size: int = 16 << 20,
+    ):
+        """
+        Initialize the reader.
+
+        Parameters
+        ----------
+        shard_dir: str
+            Folder of the shards.
+        split: str
+            Name of the packed split.
+        shuffle_buffer: int
+            Number of segments in the shuffle buffer. 0 reads the segments
+            in order.
+        shuffle_shards: bool
+            Read the shards in a random order.
+        seed: int
+            Seed of the shuffles. Optional. Every iteration continues the
+            same random generator, so epochs differ but are reproducible.
+        read_size: int
+            Size of the reads from the shards in bytes.
+        """
+        import numpy as np
+
+        self.shards = _shard_files(shard_dir, split, extensions=(".pcm",))
+        self.shuffle_buffer = shuffle_buffer
+        self.shuffle_shards = shuffle_shards
+        self.read_size = read_size
+        self.rng = np.random.default_rng(seed)
+
+    def __iter__(self) -> Iterator:
+        """
+        Iterate over the segments of all shards.
+
+        Yields
+        ------
+        Segment
+            The samples, sample rate and manifest row of the next segment.
+        """
+        shards = list(self.shards)
+        if self.shuffle_shards:
+            self.rng.shuffle(shards)
+        segments = (segment for shard in shards for segment in self._read(shard))
+        if self.shuffle_buffer <= 1:
+            yield from segments
+            return
+
+        buffer = []
+        for segment in segments:
+            if len(buffer) < self.shuffle_buffer:
+                buffer.append(segment)
+                continue
+            i = self.rng.integers(len(buffer))
+            buffer[i], segment = segment, buffer[i]
+            yield segment
+        self.rng.shuffle(buffer)
+        yield from buffer
+
+    def _read(self, blob: str) -> Iterator:
+        """
+        Read the segments of a shard in order.
+
+        Parameters
+        ----------
+        blob: str
+            Path to the blob of the shard.
+
+        Yields
+        ------
+        Segment
+            The next segment.
+        """
+        import numpy as np
+        from rifsdatasets.loader import Segment
+        from rifsdatasets.manifest import read_manifest
+
+        index = read_manifest(os.path.dirname(blob), os.path.basename(blob)[:-4])
+        index_columns = {"offset", "frames", "channels", "sample_rate", "dtype"}
+        columns = [c for c in index.columns if c not in index_columns]
+        with open(blob, "rb", buffering=self.read_size) as f:
+            for row in index.to_dict("records"):
+                dtype = np.dtype(row["dtype"])
+                frames, channels = int(row["frames"]), int(row["channels"])
+                data = f.read(frames * channels * dtype.itemsize)
+                audio = np.frombuffer(data, dtype=dtype)
+                if channels > 1:
+                    audio = audio.reshape(frames, channels)
+                yield Segment(
+                    audio=audio,
+                    sample_rate=int(row["sample_rate"]),
+                    row={column: row[column] for column in columns},
+                )
@@ -11,7 +11,12 @@ The module contains the following function:
 
 """
 
+from typing import Dict, List, Optional, Tuple
 
+from rifsdatasets.instrument import enabled, span, traced
+
+
+@traced("split")
 def split_dataset(
     dataset_path: str,
     split_method: str = "random",
@@ -21,6 +26,10 @@ def split_dataset(
     verbose: bool = False,
     quiet: bool = False,
     seed: int = 0,
+    num_workers: Optional[int] = None,
+    alignment_cache: bool = True,
+    group_column: Optional[str] = None,
+    output_format: str = "csv",
 ):
     """Split dataset into train, validation and test sets.
 
@@ -29,9 +38,14 @@ def split_dataset(
     dataset_path : str
         Path to dataset.
     split_method : str
-        Method to split dataset. Options are at the moment only: 'random'.
-        Will not overlap between original long audio files.
+        Method to split dataset. Options are: 'random', 'duration' and
+        'stratified'. Will not overlap between original long audio files.
         So either a wav file is in train, validation or test set.
+        'random' splits by the number of files. 'duration' splits by the
+        total audio duration of the files, taken from the 'start' and 'end'
+        columns of the segments, otherwise from the audio index of the
+        dataset if it has one, see build_audio_index, or from the wav headers.
+        'stratified' splits by duration within every group of group_column.
     split_ratio : float
         Ratio to split dataset into train and validation / test sets.
     split_test_ratio : float
@@ -44,21 +58,41 @@ def split_dataset(
         disables output.
     seed: int
         Seed for random number generator.
+    num_workers: int
+        Number of threads reading segments.csv files, or processes when
+        checking for bad alignments. Defaults to the executor default.
+    alignment_cache: bool
+        Cache the result of the bad alignment check per segments.csv in
+        '.alignment_cache' of the dataset, keyed by the hash of the file, so
+        a new split does not check the same files again. Default is True.
+    group_column : str
+        Column of segments.csv to stratify by, e.g. series or speaker. The
+        first value of each file is used. If the column is missing the
+        folder above the file's folder is the group. Optional.
+    output_format : str
+        Format of the split manifests, 'csv' or 'parquet'. Default is csv.
 
     Returns
     -------
     None
     """
 
-    import math
+    import os
     import random
     import pandas as pd
 
+    from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+    from functools import partial
     from glob import glob
-    from os.path import join, relpath, dirname
-    from rifsalignment import check_for_good_alignment
+    from os.path import join
+    from rifsdatasets.audio_index import read_durations
+    from rifsdatasets.manifest import write_manifest
 
-    assert split_method == "random", "Only random split method implemented."
+    assert split_method in (
+        "random",
+        "duration",
+        "stratified",
+    ), "Split method must be 'random', 'duration' or 'stratified'."
     if verbose and not quiet:
         print(f"Splitting with split method: {split_method}")
 
@@ -103,6 +137,136 @@ def split_dataset(
     random.seed(seed)
     random.shuffle(csv_files)
 
+    cache_dir = None
+    if check_for_bad_alignments and alignment_cache:
+        cache_dir = join(dataset_path, ".alignment_cache")
+        os.makedirs(cache_dir, exist_ok=True)
+    read = partial(
+        _read_segments,
+        dataset_path=dataset_path,
+        engine=_csv_engine(),
+        check_alignments=check_for_bad_alignments,
+        cache_dir=cache_dir,
+    )
+    workers = num_workers or os.cpu_count() or 1
+    # Checking alignments is cpu bound, so it runs batched on processes.
+    Executor = ProcessPoolExecutor if check_for_bad_alignments else ThreadPoolExecutor
+
+    def read_all(files):
+        """Read the segments of files in parallel."""
+        if verbose and not quiet:
+            print(f"Reading segments from {len(files)} files")
+            if check_for_bad_alignments:
+                print("Checking for bad alignments and removing them.")
+        chunksize = max(1, len(files) // (4 * workers))
+        with span("read", path=dataset_path) as event, Executor(
+            max_workers=num_workers
+        ) as executor:
+            result = dict(zip(files, executor.map(read, files, chunksize=chunksize)))
+            event.files = len(files)
+            if enabled():
+                event.bytes = sum(os.path.getsize(file) for file in files)
+        return result
+
+    frames = {}
+    if split_method == "random":
+        train, test, valid = _split_by_count(csv_files, split_ratio, split_test_ratio)
+    else:
+        frames = read_all(csv_files)
+        index = read_durations(dataset_path)
+        durations = {
+            csv_file: _duration(csv_file, df, dataset_path, index)
+            for csv_file, df in frames.items()
+        }
+        groups = {None: csv_files}
+        if split_method == "stratified":
+            groups = {}
+            for csv_file in csv_files:
+                group = _group(csv_file, frames[csv_file], group_column)
+                groups.setdefault(group, []).append(csv_file)
+            if verbose and not quiet:
+                print(f"Stratifying over {len(groups)} groups.")
+
+        ratios = [
+            split_ratio,
+            (1 - split_ratio) * split_test_ratio,
+            (1 - split_ratio) * (1 - split_test_ratio),
+        ]
+        train, test, valid = [], [], []
+        balance = [0.0 for _ in ratios]
+        # Groups are visited in random order, so no group is always first.
+        order = sorted(groups, key=str)
+        for group in random.sample(order, len(order)):
+            assigned = _split_by_duration(groups[group], durations, ratios, balance)
+            train += assigned[0]
+            test += assigned[1]
+            valid += assigned[2]
+
+        total = sum(durations.values()) or 1
+        for name, files in [("train", train), ("test", test), ("valid", valid)]:
+            hours = sum(durations[f] for f in files) / 3600
+            if verbose and not quiet:
+                print(f"{name}: {hours:.2f} hours, ratio: {hours * 3600 / total}")
+
+    splits = []
+
+    if train:
+        splits.append(("train", train))
+        if verbose and not quiet:
+            print(f"train: {len(train)}, ratio: {len(train)/len(csv_files)}")
+    if test:
+        splits.append(("test", test))
+        if verbose and not quiet:
+            print(f"test: {len(test)}, ratio: {len(test)/(len(csv_files)-len(train))}")
+    if valid:
+        splits.append(("valid", valid))
+        if verbose and not quiet:
+            print(
+                f"valid: {len(valid)}",
+                f"ratio: {len(valid)/(len(csv_files)-len(train))}",
+            )
+
+    for split in splits:
+        split_name, csv_files = split
+        if not frames:
+            split_frames = read_all(csv_files)
+        else:
+            split_frames = frames
+
+        all_segments = []
+        for csv_file in csv_files:
+            df = split_frames[csv_file]
+            if df is None:
+                if verbose and not quiet:
+                    print(f"Empty csv file: {csv_file}")
+                continue
+            all_segments.append(df)
+        all_segments = pd.concat(all_segments, ignore_index=True)
+        write_manifest(all_segments, dataset_path, split_name, output_format)
+
+
+def _split_by_count(
+    csv_files: List[str], split_ratio: float, split_test_ratio: float
+) -> Tuple[List[str], List[str], List[str]]:
+    """
+    Split shuffled files into train, test and validation by their number.
+
+    Parameters
+    ----------
+    csv_files : List[str]
+        Shuffled segments.csv files.
+    split_ratio : float
+        Ratio to split dataset into train and validation / test sets.
+    split_test_ratio : float
+        Ratio to split between validation and test set.
+
+    Returns
+    -------
+    Tuple[List[str], List[str], List[str]]
+        The train, test and validation files.
+    """
+    import math
+
     if split_ratio == 1.0:
         train = csv_files
         test = []
@@ -135,53 +299,244 @@ def split_dataset(
         test = csv_files[split_index:test_split_index]
         valid = csv_files[test_split_index:]
 
-    splits = []
+    return train, test, valid
 
-    if train:
-        splits.append(("train", train))
-        if verbose and not quiet:
-            print(f"train: {len(train)}, ratio: {len(train)/len(csv_files)}")
-    if test:
-        splits.append(("test", test))
-        if verbose and not quiet:
-            print(f"test: {len(test)}, ratio: {len(test)/(len(csv_files)-len(train))}")
-    if valid:
-        splits.append(("valid", valid))
-        if verbose and not quiet:
-            print(
-                f"valid: {len(valid)}",
-                f"ratio: {len(valid)/(len(csv_files)-len(train))}",
-            )
 
-    for split in splits:
-        split_name, csv_files = split
-        all_segments = []
-        for csv_file in csv_files:
-            if verbose and not quiet:
-                print(f"Reading segments from '{csv_file}'")
-            try:
-                df = pd.read_csv(csv_file)
-            except pd.errors.EmptyDataError:
-                if verbose and not quiet:
-                    print(f"Empty csv file: {csv_file}")
-                continue
-            df["id"] = df["file"].apply(
-                lambda x: join(dirname(relpath(csv_file, dataset_path)), x)
-            )
-            if check_for_bad_alignments:
-                if verbose and not quiet:
-                    print("Checking for bad alignments and removing them.")
-                assert (
-                    "model_output" in df.columns and "text" in df.columns
-                ), "'model_output' or 'text' column not found in csv file."
-                df = df[
-                    df.apply(
-                        lambda x: check_for_good_alignment(
-                            x["text"], x["model_output"]
-                        ),
-                        axis=1,
-                    )
-                ]
-            all_segments.append(df)
-        all_segments = pd.concat(all_segments)
-        all_segments.to_csv(join(dataset_path, f"{split_name}.csv"), index=False)
+def _split_by_duration(
+    csv_files: List[str],
+    durations: Dict[str, float],
+    ratios: List[float],
+    balance: Optional[List[float]] = None,
+) -> List[List[str]]:
+    """
+    Split shuffled files so each split gets its ratio of the total duration.
+
+    Files are taken in their shuffled order and each goes to the split
+    furthest below its target duration, so the result stays random but is
+    off by at most about one file's duration. When groups are split one at
+    a time, balance carries the shortfall of every split from one group to
+    the next, so groups too small to reach every split still add up to the
+    ratios overall.
+
+    Parameters
+    ----------
+    csv_files : List[str]
+        Shuffled segments.csv files.
+    durations : Dict[str, float]
+        Duration in seconds of each file.
+    ratios : List[float]
+        Share of the total duration of each split.
+    balance : List[float]
+        Seconds each split is below its target from earlier groups, updated
+        in place. Optional.
+
+    Returns
+    -------
+    List[List[str]]
+        The files of each split.
+    """
+    total = sum(durations[csv_file] for csv_file in csv_files)
+    if balance is None:
+        balance = [0.0 for _ in ratios]
+    targets = [ratio * total + carried for ratio, carried in zip(ratios, balance)]
+    assigned = [0.0 for _ in ratios]
+    splits: List[List[str]] = [[] for _ in ratios]
+    candidates = [i for i, ratio in enumerate(ratios) if ratio > 0]
+    for csv_file in csv_files:
+        i = max(candidates, key=lambda i: targets[i] - assigned[i])
+        splits[i].append(csv_file)
+        assigned[i] += durations[csv_file]
+    balance[:] = [target - done for target, done in zip(targets, assigned)]
+    return splits
+
+
+def _duration(
+    csv_file: str,
+    df,
+    dataset_path: Optional[str] = None,
+    index: Optional[Dict[str, float]] = None,
+) -> float:
+    """
+    Get the total audio duration of the segments in a file.
+
+    Parameters
+    ----------
+    csv_file : str
+        Path to the segments.csv file.
+    df : pd.DataFrame or None
+        The segments of the file.
+    dataset_path : str
+        Path to dataset, the index is keyed by paths relative to it.
+    index : Dict[str, float]
+        Durations from the audio index of the dataset. Optional.
+
+    Returns
+    -------
+    float
+        Duration in seconds, from the 'start' and 'end' columns if present
+        and otherwise from the index or the headers of the segment wav files.
+    """
+    from os.path import dirname, join, relpath
+    from rifsdatasets.utils import read_wav_header
+
+    if df is None or len(df) == 0:
+        return 0.0
+    if "start" in df.columns and "end" in df.columns:
+        return float((df["end"] - df["start"]).sum())
+    total = 0.0
+    for file in df["file"]:
+        path = join(dirname(csv_file), str(file))
+        if index and dataset_path and relpath(path, dataset_path) in index:
+            total += index[relpath(path, dataset_path)]
+        else:
+            total += read_wav_header(path).duration
+    return total
+
+
+def _group(csv_file: str, df, group_column: Optional[str]) -> str:
+    """
+    Get the group of a file to stratify by.
+
+    Parameters
+    ----------
+    csv_file : str
+        Path to the segments.csv file.
+    df : pd.DataFrame or None
+        The segments of the file.
+    group_column : str
+        Column holding the group. Optional.
+
+    Returns
+    -------
+    str
+        The first value of group_column, or the name of the folder above the
+        folder of the file.
+    """
+    from os.path import basename, dirname
+
+    if group_column and df is not None and group_column in df.columns and len(df):
+        return str(df[group_column].iloc[0])
+    return basename(dirname(dirname(csv_file)))
+
+
+def _csv_engine() -> Optional[str]:
+    """
+    Get the fastest available pandas csv engine.
+
+    Returns
+    -------
+    str or None
+        'pyarrow' if pyarrow is installed, otherwise None for the default.
+    """
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return None
+    return "pyarrow"
+
+
+def _read_segments(
+    csv_file: str,
+    dataset_path: str,
+    engine: Optional[str] = None,
+    check_alignments: bool = False,
+    cache_dir: Optional[str] = None,
+):
+    """
+    Read a segments.csv file and add the id column.
+
+    Parameters
+    ----------
+    csv_file : str
+        Path to the segments.csv file.
+    dataset_path : str
+        Path to dataset.
+    engine : str
+        pandas csv engine. Optional.
+    check_alignments : bool
+        Remove the segments that fail rifsalignment.check_for_good_alignment.
+    cache_dir : str
+        Folder with cached alignment checks keyed by file hash. Optional.
+
+    Returns
+    -------
+    pd.DataFrame or None
+        The segments, None if the file is empty.
+    """
+    import hashlib
+    import io
+    import pandas as pd
+    from os.path import dirname, join, relpath
+
+    with open(csv_file, "rb") as f:
+        data = f.read()
+    if not data:
+        return None
+    try:
+        df = pd.read_csv(io.BytesIO(data), engine=engine)
+    except pd.errors.EmptyDataError:
+        return None
+    prefix = join(dirname(relpath(csv_file, dataset_path)), "")
+    df["id"] = prefix + df["file"].astype(str)
+
+    if check_alignments:
+        assert (
+            "model_output" in df.columns and "text" in df.columns
+        ), "'model_output' or 'text' column not found in csv file."
+        cache_file = None
+        if cache_dir is not None:
+            key = hashlib.sha256(data + _alignment_version().encode()).hexdigest()
+            cache_file = join(cache_dir, f"{key}.mask")
+        df = df[_good_alignments(df, cache_file)]
+    return df
+
+
+def _alignment_version() -> str:
+    """
+    Get the version of rifsalignment, part of the alignment cache key.
+
+    Returns
+    -------
+    str
+        The version, empty if rifsalignment does not define one.
+    """
+    import rifsalignment
+
+    return str(getattr(rifsalignment, "__version__", ""))
+
+
+def _good_alignments(df, cache_file: Optional[str] = None):
+    """
+    Check every segment for a good alignment, with an optional cache file.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Segments with 'text' and 'model_output' columns.
+    cache_file : str
+        File holding the result as a string of 0 and 1. Optional.
+
+    Returns
+    -------
+    List[bool]
+        Whether each segment is a good alignment.
+    """
+    import os
+    from rifsalignment import check_for_good_alignment
+
+    if cache_file is not None and os.path.exists(cache_file):
+        with open(cache_file) as f:
+            mask = [c == "1" for c in f.read()]
+        if len(mask) == len(df):
+            return mask
+
+    mask = [
+        bool(check_for_good_alignment(text, model_output))
+        for text, model_output in zip(df["text"], df["model_output"])
+    ]
+    if cache_file is not None:
+        tmp = f"{cache_file}.{os.getpid()}"
+        with open(tmp, "w") as f:
+            f.write("".join("1" if good else "0" for good in mask))
+        os.replace(tmp, cache_file)
+    return mask
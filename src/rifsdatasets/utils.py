@@ -1,75 +1,509 @@
 """utils for rifsdatasets"""
 
-from git import RemoteProgress
-from awesome_progress_bar import ProgressBar
-from time import sleep
+from dataclasses import dataclass, field
+from functools import lru_cache, partial
+from contextlib import contextmanager
+from threading import BoundedSemaphore, Condition, Lock
+from time import sleep, perf_counter
+from typing import Callable, Iterable, List, NamedTuple, Optional, Tuple
 
+import os
+import shutil
 
-class CloneProgress(RemoteProgress):
-    """Progress bar for cloning a git repository."""
+from rifsdatasets.instrument import Event, current_dataset, emit, enabled, span
 
-    def __init__(self):
-        """Initialize progress bar.
 
-        Parameters
-        ----------
-        None
+@lru_cache(maxsize=None)
+def _clone_progress():
+    """
+    Define CloneProgress on first use, so importing utils does not import git.
 
-        Returns
-        -------
-        None
-        """
-        super().__init__()
-        self.pbar = ProgressBar(
-            1,
-            prefix="Downloading",
-            suffix="of files",
-            use_eta=True,
-            spinner_type="db",
+    Returns
+    -------
+    type
+        The CloneProgress class.
+    """
+    from git import RemoteProgress
+    from awesome_progress_bar import ProgressBar
+
+    class CloneProgress(RemoteProgress):
+        """Progress bar for cloning a git repository."""
+
+        def __init__(self):
+            """Initialize progress bar.
+
+            Parameters
+            ----------
+            None
+
+            Returns
+            -------
+            None
+            """
+            super().__init__()
+            self.pbar = ProgressBar(
+                1,
+                prefix="Downloading",
+                suffix="of files",
+                use_eta=True,
+                spinner_type="db",
+            )
+
+        def update(self, op_code, cur_count, max_count=None, message=""):
+            """
+            Update the progress bar.
+
+            Parameters
+            ----------
+            op_code : int
+                Operation code.
+            cur_count : int
+                Current count.
+            max_count : int
+                Maximum count.
+            message : str
+                Message.
+            """
+            if not max_count:
+                return
+            if self.pbar.total == 1:
+                self.pbar.total = int(max_count)
+            if cur_count == max_count:
+                self.pbar._iteration = int(max_count)
+                sleep(0.125)
+                self.pbar.stop()
+                self.pbar.wait()
+            else:
+                if message:
+                    self.pbar.prefix = f"{message} "
+                self.pbar.iter()
+
+    return CloneProgress
+
+
+def __getattr__(name: str):
+    """Import CloneProgress lazily."""
+    if name == "CloneProgress":
+        return _clone_progress()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+class SharedResources:
+    """
+    Limits shared by every download running in this process.
+
+    Set with the shared_resources context manager, e.g. by the orchestrator
+    running several datasets at once. When unset, every Downloader and
+    ConversionPool uses its own limits.
+    """
+
+    #: Semaphore bounding the open network connections (clones and http).
+    connections: Optional[BoundedSemaphore] = None
+    #: Process pool used by every ConversionPool.
+    executor = None
+
+
+@contextmanager
+def shared_resources(
+    max_connections: Optional[int] = None, num_workers: Optional[int] = None
+):
+    """
+    Share connection and cpu worker limits between concurrent downloads.
+
+    Parameters
+    ----------
+    max_connections: int
+        Maximum number of open network connections. Optional. Defaults to no
+        global limit.
+    num_workers: int
+        Number of processes converting audio for all datasets. Defaults to
+        the number of cpus.
+
+    Returns
+    -------
+    None
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    if max_connections:
+        SharedResources.connections = BoundedSemaphore(max_connections)
+    SharedResources.executor = ProcessPoolExecutor(
+        max_workers=num_workers or os.cpu_count() or 1
+    )
+    try:
+        yield SharedResources
+    finally:
+        SharedResources.executor.shutdown(wait=True)
+        SharedResources.executor = None
+        SharedResources.connections = None
+
+
+def connection_slot():
+    """
+    Get a context manager holding one of the shared network connections.
+
+    Returns
+    -------
+    ContextManager
+        The shared connection semaphore or a no-op context.
+    """
+    from contextlib import nullcontext
+
+    return SharedResources.connections or nullcontext()
+
+
+LINK_MODES = ("auto", "hardlink", "reflink", "symlink", "copy")
+
+
+def link_or_copy(src: str, dst: str, mode: str = "auto") -> str:
+    """
+    Hardlink src to dst, or reflink or copy it if hardlinks are not possible.
+
+    Parameters
+    ----------
+    src: str
+        Path to the source file.
+    dst: str
+        Path to the destination file, must not exist.
+    mode: str
+        'auto' tries a hardlink, then a reflink and copies as a last resort.
+        'hardlink', 'reflink', 'symlink' and 'copy' only try that method and
+        raise an OSError if the filesystem does not support it.
+
+    Returns
+    -------
+    str
+        The method used: 'hardlink', 'reflink', 'symlink' or 'copy'.
+    """
+    assert mode in LINK_MODES, f"Link mode must be one of {', '.join(LINK_MODES)}."
+    if mode in ("auto", "hardlink"):
+        try:
+            os.link(src, dst)
+            return "hardlink"
+        except OSError:
+            if mode == "hardlink":
+                raise
+    if mode in ("auto", "reflink"):
+        try:
+            _reflink(src, dst)
+            return "reflink"
+        except OSError:
+            if mode == "reflink":
+                raise
+    if mode == "symlink":
+        os.symlink(os.path.abspath(src), dst)
+        return "symlink"
+    shutil.copy2(src, dst)
+    return "copy"
+
+
+def _reflink(src: str, dst: str):
+    """
+    Make dst a copy-on-write clone of src with the FICLONE ioctl.
+
+    Parameters
+    ----------
+    src: str
+        Path to the source file.
+    dst: str
+        Path to the destination file.
+
+    Returns
+    -------
+    None
+
+    Raises
+    ------
+    OSError
+        If the platform or filesystem does not support reflinks.
+    """
+    try:
+        import fcntl
+    except ImportError:
+        raise OSError("Reflinks are not supported on this platform.")
+
+    ficlone = 0x40049409
+    try:
+        with open(src, "rb") as s, open(dst, "wb") as d:
+            fcntl.ioctl(d.fileno(), ficlone, s.fileno())
+    except OSError:
+        if os.path.exists(dst):
+            os.remove(dst)
+        raise
+
+
+@dataclass
+class LinkReport:
+    """Summary of the files linked by link_tree."""
+
+    files: int = 0
+    bytes: int = 0
+    bytes_copied: int = 0
+
+    @property
+    def bytes_saved(self) -> int:
+        """Bytes that were linked instead of copied."""
+        return self.bytes - self.bytes_copied
+
+    def __str__(self) -> str:
+        """Human readable summary with the saved bytes."""
+        return (
+            f"Linked {self.files} files ({self.bytes / 1e9:.2f} GB), "
+            f"saved {self.bytes_saved / 1e9:.2f} GB by not copying"
         )
 
-    def update(self, op_code, cur_count, max_count=None, message=""):
-        """
-        Update the progress bar.
 
-        Parameters
-        ----------
-        op_code : int
-            Operation code.
-        cur_count : int
-            Current count.
-        max_count : int
-            Maximum count.
-        message : str
-            Message.
-        """
-        if self.pbar.total == 1:
-            self.pbar.total = int(max_count)
-        if cur_count == max_count:
-            self.pbar._iteration = int(max_count)
-            sleep(0.125)
-            self.pbar.stop()
-            self.pbar.wait()
+def link_tree(
+    src: str,
+    dst: str,
+    ignore: Iterable[str] = (),
+    mode: str = "auto",
+    num_workers: int = 1,
+) -> LinkReport:
+    """
+    Recreate the tree src at dst with link_or_copy for every file.
+
+    No shell is involved, so there is no argument-list limit and any file
+    name works.
+
+    Parameters
+    ----------
+    src: str
+        Path to the source folder.
+    dst: str
+        Path to the destination folder. Existing files are replaced.
+    ignore: Iterable[str]
+        Names of top-level files or folders in src to skip.
+    mode: str
+        How to link the files, see link_or_copy. Default is 'auto'.
+    num_workers: int
+        Number of threads linking or copying files.
+
+    Returns
+    -------
+    LinkReport
+        Number of files, total bytes and bytes that had to be copied.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    ignore = set(ignore)
+    report = LinkReport()
+    lock = Lock()
+
+    def link(source: str, target: str):
+        """Link a single file and count it."""
+        if os.path.lexists(target):
+            os.remove(target)
+        method = link_or_copy(source, target, mode)
+        size = os.path.getsize(source)
+        with lock:
+            report.files += 1
+            report.bytes += size
+            if method == "copy":
+                report.bytes_copied += size
+
+    with span("link", src=src, dst=dst, mode=mode) as event:
+        with ThreadPoolExecutor(max_workers=max(1, num_workers)) as executor:
+            futures = []
+            for dirpath, dirnames, filenames in os.walk(src, followlinks=True):
+                if dirpath == src:
+                    dirnames[:] = [d for d in dirnames if d not in ignore]
+                    filenames = [f for f in filenames if f not in ignore]
+                target = os.path.join(dst, os.path.relpath(dirpath, src))
+                os.makedirs(target, exist_ok=True)
+                for filename in filenames:
+                    source, target_file = (
+                        os.path.join(dirpath, filename),
+                        os.path.join(target, filename),
+                    )
+                    if num_workers > 1:
+                        futures.append(executor.submit(link, source, target_file))
+                    else:
+                        link(source, target_file)
+            for future in futures:
+                future.result()
+        event.files, event.bytes = report.files, report.bytes
+    return report
+
+
+def move(src: str, dst: str) -> str:
+    """
+    Move a file or folder like shutil.move and report it as a 'move' event.
+
+    Parameters
+    ----------
+    src: str
+        Path to the file or folder.
+    dst: str
+        Destination path.
+
+    Returns
+    -------
+    str
+        The destination path.
+    """
+    with span("move", src=src, dst=dst) as event:
+        if enabled():
+            if os.path.isdir(src):
+                for dirpath, _, filenames in os.walk(src):
+                    event.files += len(filenames)
+                    event.bytes += sum(
+                        os.path.getsize(os.path.join(dirpath, name))
+                        for name in filenames
+                    )
+            else:
+                event.files, event.bytes = 1, os.path.getsize(src)
+        return shutil.move(src, dst)
+
+
+def remote_head(url: str) -> str:
+    """
+    Look up the commit of the HEAD of a remote repository without cloning.
+
+    Parameters
+    ----------
+    url: str
+        Url of the repository.
+
+    Returns
+    -------
+    str
+        The commit hash.
+    """
+    from git import Git
+
+    with connection_slot():
+        return Git().ls_remote(url, "HEAD").split()[0]
+
+
+def clone_repository(
+    url: str,
+    to_path: str,
+    quiet: bool = False,
+    shallow: bool = False,
+    sparse_paths: Optional[List[str]] = None,
+    cache=None,
+):
+    """
+    Clone a dataset repository with a CloneProgress bar.
+
+    A shallow clone fetches only the latest commit of the default branch and
+    no blobs up front (``--depth 1 --single-branch --filter=blob:none``). With
+    sparse_paths only the files in the root and in the given directories are
+    checked out, so only their blobs are downloaded.
+
+    With a cache the remote HEAD is looked up first, and a checkout of the
+    same commit is linked from the cache instead of cloned. The working tree
+    is then restored without the .git folder.
+
+    Parameters
+    ----------
+    url: str
+        Url of the repository.
+    to_path: str
+        Path to clone the repository to.
+    quiet: bool
+        Disables the progress bar.
+    shallow: bool
+        Make a shallow, single-branch and blob-filtered clone.
+    sparse_paths: List[str]
+        Directories to check out in a shallow clone. Optional. Defaults to
+        the whole tree.
+    cache: rifsdatasets.cache.DatasetCache
+        Cache of checked out repositories. Optional.
+
+    Returns
+    -------
+    git.Repo or None
+        The cloned repository, None if it was restored from the cache.
+    """
+    with span("clone", url=url, shallow=shallow) as event:
+        if cache is not None:
+            commit = remote_head(url)
+            key = cache.repo_key(
+                url, commit, sparse_paths=sparse_paths if shallow else None
+            )
+            if cache.get(key, to_path):
+                event.details["cached"] = True
+                if not quiet:
+                    print(f"Restored {url} at {commit[:8]} from the cache")
+                return None
+        event.details["cached"] = False
+        repo = _clone(url, to_path, quiet, shallow, sparse_paths)
+
+    if cache is not None:
+        cache.put(key, to_path, ignore=[".git"])
+        cache.evict()
+    return repo
+
+
+def _clone(
+    url: str,
+    to_path: str,
+    quiet: bool,
+    shallow: bool,
+    sparse_paths: Optional[List[str]],
+):
+    """
+    Clone a repository, see clone_repository.
+
+    Returns
+    -------
+    git.Repo
+        The cloned repository.
+    """
+    from git import Repo
+
+    progress = None if quiet else _clone_progress()()
+    with connection_slot():
+        if not shallow:
+            repo = Repo.clone_from(url=url, to_path=to_path, progress=progress)
         else:
-            if message:
-                self.pbar.prefix = f"{message} "
-            self.pbar.iter()
+            repo = Repo.clone_from(
+                url=url,
+                to_path=to_path,
+                progress=progress,
+                depth=1,
+                single_branch=True,
+                filter="blob:none",
+                sparse=sparse_paths is not None,
+            )
+            if sparse_paths:
+                repo.git.sparse_checkout("set", *sparse_paths)
+    return repo
 
 
 def convert_mp3_to_wav(
     src: str,
     dst: str,
+    streaming: bool = False,
+    sample_rate: Optional[int] = None,
+    channels: Optional[int] = None,
+    chunk_frames: int = 65536,
 ):
     """
     Convert mp3 to wav.
 
+    By default the file is decoded into memory with pydub. With streaming the
+    audio is decoded and written in chunks of chunk_frames frames, so memory
+    stays bounded for multi-hour files. Streaming decodes in-process with
+    miniaudio when it is installed and otherwise uses a single ffmpeg process
+    writing directly to dst.
+
     Parameters
     ----------
     src: str
         Path to source mp3 file with extension
     dst: str
         Path to destination wav file with extension
-
+    streaming: bool
+        Decode and write in fixed-size chunks instead of loading the file.
+    sample_rate: int
+        Resample to this sample rate. Optional. Defaults to the source rate.
+    channels: int
+        Downmix to this number of channels. Optional. Defaults to the source.
+    chunk_frames: int
+        Number of frames decoded per chunk when streaming with miniaudio.
 
     Returns
     -------
@@ -77,5 +511,551 @@ def convert_mp3_to_wav(
     """
     import pydub
 
+    if streaming:
+        try:
+            import miniaudio
+        except ImportError:
+            _stream_ffmpeg(src, dst, sample_rate, channels)
+        else:
+            _stream_miniaudio(miniaudio, src, dst, sample_rate, channels, chunk_frames)
+        return
+
     sound = pydub.AudioSegment.from_mp3(src)
+    if sample_rate:
+        sound = sound.set_frame_rate(sample_rate)
+    if channels:
+        sound = sound.set_channels(channels)
     sound.export(dst, format="wav")
+
+
+def _stream_miniaudio(
+    miniaudio,
+    src: str,
+    dst: str,
+    sample_rate: Optional[int],
+    channels: Optional[int],
+    chunk_frames: int,
+):
+    """
+    Decode src in chunks with miniaudio and write them as 16 bit wav.
+
+    Parameters
+    ----------
+    miniaudio: module
+        The imported miniaudio module.
+    src: str
+        Path to source audio file with extension
+    dst: str
+        Path to destination wav file with extension
+    sample_rate: int
+        Target sample rate or None to keep the source rate.
+    channels: int
+        Target number of channels or None to keep the source channels.
+    chunk_frames: int
+        Number of frames decoded per chunk.
+
+    Returns
+    -------
+    None
+    """
+    import wave
+    from pydub.exceptions import CouldntDecodeError
+
+    try:
+        info = miniaudio.get_file_info(src)
+        sample_rate = sample_rate or info.sample_rate
+        channels = channels or info.nchannels
+        stream = miniaudio.stream_file(
+            src,
+            output_format=miniaudio.SampleFormat.SIGNED16,
+            nchannels=channels,
+            sample_rate=sample_rate,
+            frames_to_read=chunk_frames,
+        )
+        with wave.open(dst, "wb") as wav:
+            wav.setnchannels(channels)
+            wav.setsampwidth(2)
+            wav.setframerate(sample_rate)
+            for chunk in stream:
+                wav.writeframesraw(chunk.tobytes())
+    except miniaudio.MiniaudioError as e:
+        raise CouldntDecodeError(f"Decoding failed for {src}: {e}") from e
+
+
+def _stream_ffmpeg(
+    src: str,
+    dst: str,
+    sample_rate: Optional[int],
+    channels: Optional[int],
+):
+    """
+    Decode src with a single ffmpeg process writing 16 bit wav to dst.
+
+    Parameters
+    ----------
+    src: str
+        Path to source audio file with extension
+    dst: str
+        Path to destination wav file with extension
+    sample_rate: int
+        Target sample rate or None to keep the source rate.
+    channels: int
+        Target number of channels or None to keep the source channels.
+
+    Returns
+    -------
+    None
+    """
+    import subprocess as sp
+    from pydub.exceptions import CouldntDecodeError
+    from pydub.utils import get_encoder_name
+
+    command = [get_encoder_name(), "-nostdin", "-v", "error", "-y", "-i", src]
+    if sample_rate:
+        command += ["-ar", str(sample_rate)]
+    if channels:
+        command += ["-ac", str(channels)]
+    command += ["-vn", "-acodec", "pcm_s16le", "-f", "wav", dst]
+    result = sp.run(command, stdout=sp.DEVNULL, stderr=sp.PIPE)
+    if result.returncode != 0:
+        raise CouldntDecodeError(
+            f"Decoding failed for {src}: {result.stderr.decode(errors='replace')}"
+        )
+
+
+def _convert_job(
+    src: str, dst: str, options: dict, cache=None
+) -> Tuple[str, str, int, Optional[str]]:
+    """
+    Convert a single file for the ConversionPool.
+
+    The wav is written next to the destination and renamed into place, so an
+    interrupted conversion never leaves a truncated file at ``dst``. With a
+    cache a conversion of the same source with the same parameters is linked
+    from the cache instead.
+
+    Parameters
+    ----------
+    src: str
+        Path to source mp3 file with extension
+    dst: str
+        Path to destination wav file with extension
+    options: dict
+        Keyword arguments for convert_mp3_to_wav.
+    cache: rifsdatasets.cache.DatasetCache
+        Cache of converted audio. Optional.
+
+    Returns
+    -------
+    Tuple[str, str, int, Optional[str]]
+        Source, destination, size of the source in bytes and an error message
+        or None if the conversion succeeded.
+    """
+    tmp = f"{dst}.part"
+    try:
+        os.makedirs(os.path.dirname(dst) or ".", exist_ok=True)
+        if cache is not None:
+            key = cache.audio_key(
+                src,
+                sample_rate=options.get("sample_rate"),
+                channels=options.get("channels"),
+            )
+            if cache.get(key, dst):
+                return src, dst, os.path.getsize(src), None
+        convert_mp3_to_wav(src, tmp, **options)
+        os.replace(tmp, dst)
+        if cache is not None:
+            cache.put(key, dst)
+        return src, dst, os.path.getsize(src), None
+    except Exception as e:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        return src, dst, 0, f"{type(e).__name__}: {e}"
+
+
+@dataclass
+class ConversionReport:
+    """Summary of the conversions done by a ConversionPool."""
+
+    files: int = 0
+    bytes: int = 0
+    seconds: float = 0.0
+    errors: List[Tuple[str, str]] = field(default_factory=list)
+
+    @property
+    def files_per_second(self) -> float:
+        """Number of converted files per second of wall time."""
+        return self.files / self.seconds if self.seconds else 0.0
+
+    @property
+    def megabytes_per_second(self) -> float:
+        """Megabytes of source audio converted per second of wall time."""
+        return self.bytes / 1e6 / self.seconds if self.seconds else 0.0
+
+    def __str__(self) -> str:
+        """Human readable summary with the aggregate throughput."""
+        return (
+            f"Converted {self.files} files ({self.bytes / 1e6:.1f} MB) "
+            f"in {self.seconds:.1f}s: {self.files_per_second:.2f} files/s, "
+            f"{self.megabytes_per_second:.2f} MB/s, {len(self.errors)} errors"
+        )
+
+
+class ConversionPool:
+    """
+    Convert mp3 files to wav on a pool of worker processes.
+
+    Files are submitted one at a time with ``submit`` and the pool collects
+    per-file errors instead of raising, so one broken file does not abort a
+    whole dataset. Use it as a context manager or call ``wait`` to get the
+    ConversionReport.
+
+    Example
+    -------
+    >>> with ConversionPool(num_workers=8) as pool:
+    ...     pool.submit("audio/a.mp3", "audio_wav/a.wav")
+    >>> pool.report.errors
+    []
+    """
+
+    def __init__(
+        self,
+        num_workers: Optional[int] = None,
+        verbose: bool = False,
+        quiet: bool = False,
+        streaming: bool = False,
+        sample_rate: Optional[int] = None,
+        channels: Optional[int] = None,
+        cache=None,
+    ):
+        """
+        Initialize the pool.
+
+        Parameters
+        ----------
+        num_workers: int
+            Number of worker processes. Defaults to the number of cpus. With 1
+            the conversions run in the calling process.
+        streaming: bool
+            Decode in fixed-size chunks, see convert_mp3_to_wav.
+        sample_rate: int
+            Resample to this sample rate. Optional.
+        channels: int
+            Downmix to this number of channels. Optional.
+        verbose: bool
+            Print every converted file.
+        quiet: bool
+            Prints nothing.
+        cache: rifsdatasets.cache.DatasetCache
+            Cache of converted audio. Conversions found in it are linked
+            instead of decoded, new ones are added, and the cache is evicted
+            down to its size when the pool has finished. Optional.
+        """
+        self.num_workers = num_workers or os.cpu_count() or 1
+        self.verbose = verbose
+        self.quiet = quiet
+        self.options = dict(
+            streaming=streaming, sample_rate=sample_rate, channels=channels
+        )
+        self.cache = cache
+        self.report = ConversionReport()
+        # Conversions finish on other threads, which do not know the dataset.
+        self._dataset = current_dataset.get()
+        self._submitted = 0
+        self._collected = 0
+        self._lock = Lock()
+        self._finished = Condition(self._lock)
+        self._executor = None
+        self._own_executor = False
+        self._start = None
+
+    def __enter__(self):
+        """Start the worker processes, or join the shared ones."""
+        self._start = perf_counter()
+        if SharedResources.executor is not None:
+            self._executor = SharedResources.executor
+        elif self.num_workers > 1:
+            from concurrent.futures import ProcessPoolExecutor
+
+            self._executor = ProcessPoolExecutor(max_workers=self.num_workers)
+            self._own_executor = True
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Wait for all submitted conversions to finish."""
+        self.wait()
+
+    def submit(self, src: str, dst: str, callback: Optional[Callable] = None):
+        """
+        Schedule the conversion of src to dst.
+
+        Parameters
+        ----------
+        src: str
+            Path to source mp3 file with extension
+        dst: str
+            Path to destination wav file with extension
+        callback: Callable
+            Called with the error message, or None on success, when the
+            conversion has finished. Optional.
+
+        Returns
+        -------
+        None
+        """
+        with self._lock:
+            if self._start is None:
+                self.__enter__()
+            self._submitted += 1
+        if self._executor is None:
+            self._collect(_convert_job(src, dst, self.options, self.cache), callback)
+        else:
+            future = self._executor.submit(
+                _convert_job, src, dst, self.options, self.cache
+            )
+            future.add_done_callback(partial(self._done, src, dst, callback))
+
+    def _done(self, src: str, dst: str, callback: Optional[Callable], future):
+        """
+        Collect a finished future, also if the worker process itself failed.
+
+        Parameters
+        ----------
+        src: str
+            Path to source mp3 file with extension
+        dst: str
+            Path to destination wav file with extension
+        callback: Callable
+            Callback given to submit.
+        future: concurrent.futures.Future
+            The finished conversion.
+
+        Returns
+        -------
+        None
+        """
+        exc = future.exception()
+        if exc is not None:
+            self._collect((src, dst, 0, f"{type(exc).__name__}: {exc}"), callback)
+        else:
+            self._collect(future.result(), callback)
+
+    def _collect(
+        self,
+        result: Tuple[str, str, int, Optional[str]],
+        callback: Optional[Callable] = None,
+    ):
+        """
+        Record the result of a single conversion.
+
+        Parameters
+        ----------
+        result: Tuple[str, str, int, Optional[str]]
+            Return value of _convert_job.
+        callback: Callable
+            Callback given to submit.
+
+        Returns
+        -------
+        None
+        """
+        src, dst, size, error = result
+        with self._lock:
+            if error is None:
+                self.report.files += 1
+                self.report.bytes += size
+            else:
+                self.report.errors.append((src, error))
+            done = self.report.files + len(self.report.errors)
+            if error is not None and not self.quiet:
+                print(f"\nCould not convert {src}: {error}")
+            elif self.verbose and not self.quiet:
+                print(f"Converted {src} to {dst}")
+            elif not self.quiet:
+                print(f"\rConverted {done}/{self._submitted} files", end="")
+        if enabled():
+            emit(
+                Event(
+                    phase="convert_file",
+                    dataset=self._dataset,
+                    files=int(error is None),
+                    bytes=size,
+                    errors=int(error is not None),
+                    error=error,
+                )
+            )
+        if callback is not None:
+            callback(error)
+        with self._lock:
+            self._collected += 1
+            self._finished.notify_all()
+
+    def wait(self) -> ConversionReport:
+        """
+        Wait for all submitted conversions and return the report.
+
+        Returns
+        -------
+        ConversionReport
+            Files and bytes converted, wall time and per-file errors.
+        """
+        with self._lock:
+            self._finished.wait_for(lambda: self._collected == self._submitted)
+        if self._own_executor:
+            self._executor.shutdown(wait=True)
+            self._own_executor = False
+        self._executor = None
+        if self.cache is not None:
+            self.cache.evict()
+        if self._start is not None:
+            self.report.seconds = perf_counter() - self._start
+            self._start = None
+            emit(
+                Event(
+                    phase="convert",
+                    seconds=self.report.seconds,
+                    files=self.report.files,
+                    bytes=self.report.bytes,
+                    errors=len(self.report.errors),
+                )
+            )
+            if not self.quiet:
+                print(f"\n{self.report}")
+        return self.report
+
+
+def convert_mp3_files_to_wav(
+    files: List[Tuple[str, str]],
+    num_workers: Optional[int] = None,
+    verbose: bool = False,
+    quiet: bool = False,
+    **options,
+) -> ConversionReport:
+    """
+    Convert many mp3 files to wav in parallel.
+
+    Parameters
+    ----------
+    files: List[Tuple[str, str]]
+        Pairs of source mp3 and destination wav paths.
+    num_workers: int
+        Number of worker processes. Defaults to the number of cpus.
+    verbose: bool
+        Print every converted file.
+    quiet: bool
+        Prints nothing.
+    options:
+        streaming, sample_rate, channels and cache, see ConversionPool.
+
+    Returns
+    -------
+    ConversionReport
+        Files and bytes converted, wall time and per-file errors.
+    """
+    with ConversionPool(num_workers, verbose=verbose, quiet=quiet, **options) as pool:
+        for src, dst in files:
+            pool.submit(src, dst)
+    return pool.report
+
+
+class WavHeader(NamedTuple):
+    """Format and location of the samples of a wav file."""
+
+    sample_rate: int
+    channels: int
+    sample_width: int
+    frames: int
+    data_offset: int
+    format_tag: int
+
+    @property
+    def duration(self) -> float:
+        """Duration of the audio in seconds."""
+        return self.frames / self.sample_rate if self.sample_rate else 0.0
+
+
+def read_wav_header(path: str) -> WavHeader:
+    """
+    Read the header of a wav file without reading the samples.
+
+    Parameters
+    ----------
+    path: str
+        Path to the wav file.
+
+    Returns
+    -------
+    WavHeader
+        Sample rate, channels, bytes per sample, number of frames, byte
+        offset of the first sample and the format tag (1 is integer PCM, 3 is
+        float, 65534 is extensible).
+
+    Raises
+    ------
+    ValueError
+        If the file is not a wav file.
+    """
+    import struct
+
+    file_size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        riff = f.read(12)
+        if riff[:4] not in (b"RIFF", b"RF64") or riff[8:12] != b"WAVE":
+            raise ValueError(f"{path} is not a wav file.")
+        fmt = None
+        while True:
+            chunk = f.read(8)
+            if len(chunk) < 8:
+                raise ValueError(f"{path} has no data chunk.")
+            chunk_id, size = chunk[:4], struct.unpack("<I", chunk[4:])[0]
+            if chunk_id == b"fmt ":
+                fmt = struct.unpack("<HHIIHH", f.read(16))
+                f.seek(size - 16 + (size & 1), 1)
+            elif chunk_id == b"data":
+                offset = f.tell()
+                # Streamed wav files may not have the final size in the header.
+                if size == 0xFFFFFFFF or offset + size > file_size:
+                    size = file_size - offset
+                break
+            else:
+                f.seek(size + (size & 1), 1)
+    if fmt is None:
+        raise ValueError(f"{path} has no fmt chunk.")
+
+    format_tag, channels, sample_rate, _, block_align, bits = fmt
+    sample_width = bits // 8
+    return WavHeader(
+        sample_rate=sample_rate,
+        channels=channels,
+        sample_width=sample_width,
+        frames=size // (block_align or channels * sample_width or 1),
+        data_offset=offset,
+        format_tag=format_tag,
+    )
+
+
+def write_errors(target: str, errors: List[Tuple[str, str]], messages: bool = True):
+    """
+    Append failed files to errors.txt in the dataset folder.
+
+    Every line is the failed file and the error message separated by a tab,
+    or only the failed file without messages.
+
+    Parameters
+    ----------
+    target: str
+        Path to the dataset folder.
+    errors: List[Tuple[str, str]]
+        Pairs of failed file and error message.
+    messages: bool
+        Write the error messages. Default is True.
+
+    Returns
+    -------
+    None
+    """
+    if not errors:
+        return
+    with open(os.path.join(target, "errors.txt"), "a+") as f:
+        for path, error in errors:
+            f.write(f"{path}\t{error}\n" if messages else f"{path}\n")
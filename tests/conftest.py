@@ -0,0 +1,82 @@
+"""Datasets shared by the tests of the loaders of split datasets."""
+
+import os
+import wave
+
+import numpy as np
+import pandas as pd
+import pytest
+
+#: Sample rate of the wav files of the datasets.
+SAMPLE_RATE = 16000
+
+#: Start and end in seconds of the segments of every episode.
+SEGMENTS = [(j * 1.0, j * 1.0 + 0.9) for j in range(5)]
+
+
+def write_wav(path, samples, sample_rate: int = SAMPLE_RATE):
+    """Write 16 bit mono samples to a wav file."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with wave.open(str(path), "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(np.asarray(samples, dtype="<i2").tobytes())
+
+
+def segment_value(episode: int, segment: int) -> int:
+    """The value of every sample of a segment, unique across the dataset."""
+    return 100 * (episode + 1) + segment
+
+
+@pytest.fixture
+def segmented_dataset(tmp_path):
+    """
+    A dataset split by split_dataset, with a wav file per segment.
+
+    Every episode has a segments.csv of SEGMENTS and a wav file of every
+    segment alone, like the datasets aligned by rifsalignment. The samples of
+    a segment all have the value segment_value.
+    """
+    from rifsdatasets.split_dataset import split_dataset
+
+    path = tmp_path / "segmented"
+    for episode in range(10):
+        folder = path / "alignments" / f"series{episode % 2}" / f"episode{episode}"
+        for j, (start, end) in enumerate(SEGMENTS):
+            samples = np.full(int(round((end - start) * SAMPLE_RATE)), 1)
+            write_wav(folder / f"{j}.wav", samples * segment_value(episode, j))
+        pd.DataFrame(
+            {
+                "file": [f"{j}.wav" for j in range(len(SEGMENTS))],
+                "start": [start for start, _ in SEGMENTS],
+                "end": [end for _, end in SEGMENTS],
+                "text": [f"episode {episode} segment {j}" for j in range(5)],
+            }
+        ).to_csv(folder / "segments.csv", index=False)
+    split_dataset(str(path), quiet=True)
+    return str(path)
+
+
+@pytest.fixture
+def recording_dataset(tmp_path):
+    """
+    A dataset with a 'train' manifest of segments in whole recordings.
+
+    The samples of a segment all have the value segment_value and the samples
+    between the segments are 0.
+    """
+    from rifsdatasets.manifest import write_manifest
+
+    path = tmp_path / "recordings"
+    rows = []
+    for episode in range(2):
+        samples = np.zeros(int(SEGMENTS[-1][1] * SAMPLE_RATE) + SAMPLE_RATE)
+        for j, (start, end) in enumerate(SEGMENTS):
+            first, last = int(round(start * SAMPLE_RATE)), int(round(end * SAMPLE_RATE))
+            samples[first:last] = segment_value(episode, j)
+            rows.append((f"audio/{episode}.wav", start, end, episode, j))
+        write_wav(path / "audio" / f"{episode}.wav", samples)
+    rows = pd.DataFrame(rows, columns=["id", "start", "end", "episode", "segment"])
+    write_manifest(rows, str(path), "train")
+    return str(path)
@@ -0,0 +1,106 @@
+"""Tests for the noise augmentation."""
+
+import os
+import wave
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from rifsdatasets.augment import NoiseBank, NoiseMixer, augment_split, mix
+from rifsdatasets.manifest import read_manifest, write_manifest
+from tests.conftest import SAMPLE_RATE
+
+
+def _write_wav(path, samples, sample_rate: int = 16000):
+    """Write 16 bit mono samples to a wav file."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with wave.open(path, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(np.asarray(samples, dtype="<i2").tobytes())
+
+
+@pytest.fixture
+def mixer(tmp_path):
+    """A mixer of a noise pack with two sounds in its train split."""
+    rng = np.random.default_rng(0)
+    pack = tmp_path / "noise"
+    for name in ["a.wav", "b.wav"]:
+        _write_wav(str(pack / "audio" / name), rng.integers(-3000, 3000, 4000))
+    (pack / "train.txt").write_text("a.wav\nb.wav\n")
+    return NoiseMixer(NoiseBank(str(pack), "train"), snr_range=(5, 5))
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    """A dataset of ten segments in five files."""
+    rng = np.random.default_rng(1)
+    path = tmp_path / "dataset"
+    for i in range(5):
+        _write_wav(str(path / "audio" / f"{i}.wav"), rng.integers(-9000, 9000, 8000))
+    rows = pd.DataFrame(
+        {
+            "id": [f"audio/{i // 2}.wav" for i in range(10)],
+            "start": [0.0, 0.25] * 5,
+            "end": [0.25, 0.5] * 5,
+        }
+    )
+    write_manifest(rows, str(path), "train")
+    return str(path)
+
+
+def test_mix_reaches_the_snr():
+    rng = np.random.default_rng(0)
+    speech = rng.standard_normal((2, 1000)).astype(np.float32)
+    noise = rng.standard_normal((2, 1000)).astype(np.float32)
+    mixed = mix(speech, noise, np.array([10.0, 0.0]))
+    residual = mixed - speech
+    snr = 10 * np.log10((speech**2).sum(1) / (residual**2).sum(1))
+    np.testing.assert_allclose(snr, [10.0, 0.0], atol=0.01)
+
+
+def test_noise_bank_pickles_without_mapped_sounds(mixer):
+    import pickle
+
+    bank = pickle.loads(pickle.dumps(mixer.bank))
+    assert bank._sounds is None
+    assert len(bank) == 2
+
+
+def test_augment_split_does_not_depend_on_workers(tmp_path, dataset, mixer):
+    outputs = []
+    for workers, batch_size in [(1, 10), (2, 3)]:
+        output = str(tmp_path / f"noisy{workers}")
+        augment_split(
+            dataset,
+            "train",
+            mixer,
+            output,
+            copies=2,
+            num_workers=workers,
+            batch_size=batch_size,
+            quiet=True,
+        )
+        outputs.append(output)
+
+    first, second = (read_manifest(output, "train") for output in outputs)
+    pd.testing.assert_frame_equal(first, second)
+    assert len(first) == 20
+    assert set(first["snr"]) == {5.0}
+    for file_id in first["id"]:
+        with open(os.path.join(outputs[0], file_id), "rb") as f:
+            with open(os.path.join(outputs[1], file_id), "rb") as g:
+                assert f.read() == g.read()
+
+
+def test_augment_split_of_split_dataset_output(tmp_path, segmented_dataset, mixer):
+    output = str(tmp_path / "noisy")
+    augment_split(segmented_dataset, "train", mixer, output, num_workers=1, quiet=True)
+    augmented = read_manifest(output, "train")
+    assert len(augmented) == len(read_manifest(segmented_dataset, "train"))
+    np.testing.assert_allclose(augmented["end"], 0.9)
+    for file_id in augmented["id"]:
+        with wave.open(os.path.join(output, file_id), "rb") as wav:
+            assert wav.getnframes() == int(0.9 * SAMPLE_RATE)
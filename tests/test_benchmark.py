@@ -0,0 +1,39 @@
+"""Tests for the benchmark suite."""
+
+import pytest
+
+from rifsdatasets.benchmark import compare, run_benchmarks
+
+
+def test_compare_reports_regressions():
+    baseline = {"split": {"seconds": 1.0, "peak_rss_mb": 100.0}}
+    results = {
+        "split": {"seconds": 1.05, "peak_rss_mb": 150.0},
+        "merge": {"seconds": 9.0, "peak_rss_mb": 9.0},
+    }
+    assert compare(results, baseline) == ["split: peak_rss_mb 100.00 -> 150.00 (+50%)"]
+    assert compare(results, baseline, tolerance=0.6) == []
+
+
+def test_run_benchmarks(tmp_path):
+    stages = ["import", "clone", "download", "split", "merge"]
+    results = run_benchmarks(stages=stages, workdir=str(tmp_path), quiet=True)
+    assert list(results) == stages
+    for result in results.values():
+        assert set(result) == {
+            "seconds",
+            "files",
+            "bytes",
+            "files_per_second",
+            "megabytes_per_second",
+            "peak_rss_mb",
+        }
+        assert result["seconds"] > 0
+    assert results["download"]["files"] == 16
+    assert results["split"]["files"] == 100
+    assert (tmp_path / "split" / "dataset" / "train.csv").exists()
+
+
+def test_run_benchmarks_rejects_unknown_stages():
+    with pytest.raises(AssertionError):
+        run_benchmarks(stages=["upload"], quiet=True)
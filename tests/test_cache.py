@@ -0,0 +1,92 @@
+"""Tests for DatasetCache."""
+
+import os
+
+from rifsdatasets.cache import DatasetCache
+
+
+def _write(path, content: bytes):
+    """Write a file, creating its folder."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(content)
+
+
+def test_keys_depend_on_content_and_options(tmp_path):
+    _write(str(tmp_path / "a.mp3"), b"a")
+    _write(str(tmp_path / "b.mp3"), b"a")
+    _write(str(tmp_path / "c.mp3"), b"c")
+    key = DatasetCache.audio_key(str(tmp_path / "a.mp3"), sample_rate=16000)
+    assert DatasetCache.audio_key(str(tmp_path / "b.mp3"), sample_rate=16000) == key
+    assert DatasetCache.audio_key(str(tmp_path / "c.mp3"), sample_rate=16000) != key
+    assert DatasetCache.audio_key(str(tmp_path / "a.mp3"), sample_rate=8000) != key
+    assert DatasetCache.repo_key("url", "abc") != DatasetCache.repo_key("url", "abd")
+
+
+def test_put_and_get_files_and_trees(tmp_path):
+    cache = DatasetCache(str(tmp_path / "cache"))
+    _write(str(tmp_path / "a.wav"), b"wav")
+    _write(str(tmp_path / "repo" / "all.csv"), b"id")
+    _write(str(tmp_path / "repo" / ".git" / "HEAD"), b"ref")
+
+    assert not cache.get("file", str(tmp_path / "out.wav"))
+    cache.put("file", str(tmp_path / "a.wav"))
+    cache.put("tree", str(tmp_path / "repo"), ignore=[".git"])
+    assert cache.get("file", str(tmp_path / "out.wav"))
+    assert cache.get("tree", str(tmp_path / "out"))
+    with open(tmp_path / "out.wav", "rb") as f:
+        assert f.read() == b"wav"
+    assert os.listdir(tmp_path / "out") == ["all.csv"]
+
+
+def test_evict_removes_the_least_recently_used_entries(tmp_path):
+    cache = DatasetCache(str(tmp_path / "cache"), max_bytes=10)
+    for i, key in enumerate(["old", "new"]):
+        _write(str(tmp_path / f"{key}.wav"), b"x" * 8)
+        cache.put(key, str(tmp_path / f"{key}.wav"))
+        entry = os.path.join(cache._entry(key), "entry.json")
+        os.utime(entry, (1000 + i, 1000 + i))
+    assert cache.evict() == 8
+    assert not cache.get("old", str(tmp_path / "a.wav"))
+    assert cache.get("new", str(tmp_path / "b.wav"))
+
+
+def _make_repo(path):
+    """A local git repository shaped like the DanPASS repository."""
+    from git import Repo
+
+    for name in ["all.csv", "text_cleaning.csv", "text/a.txt", "audio/a.wav"]:
+        _write(os.path.join(path, name), b"x" * 100)
+    repo = Repo.init(path)
+    repo.git.add(A=True)
+    with repo.git.custom_environment(
+        GIT_AUTHOR_NAME="test",
+        GIT_AUTHOR_EMAIL="test@localhost",
+        GIT_COMMITTER_NAME="test",
+        GIT_COMMITTER_EMAIL="test@localhost",
+    ):
+        repo.git.commit(m="Dataset")
+    return "file://" + path
+
+
+def _entries(root):
+    """Keys of the entries in a cache folder."""
+    return [key for prefix in os.listdir(root) for key in os.listdir(root / prefix)]
+
+
+def test_download_passes_the_cache_size_on(tmp_path, monkeypatch):
+    from rifsdatasets.__main__ import main
+    from rifsdatasets.danpass import DanPASS
+
+    monkeypatch.setattr(DanPASS, "repo_url", _make_repo(str(tmp_path / "repo")))
+    DanPASS.download(str(tmp_path / "a"), quiet=True, cache_dir=str(tmp_path / "c"))
+    assert len(_entries(tmp_path / "c")) == 1
+    assert os.path.exists(tmp_path / "a" / "DanPASS" / "text" / "a.txt")
+
+    # Every entry is larger than a cache of 0 bytes and is evicted.
+    main(
+        ["download", "DanPASS", "--target", str(tmp_path / "b"), "--quiet"]
+        + ["--cache-dir", str(tmp_path / "d"), "--cache-max-gb", "0"]
+    )
+    assert os.path.exists(tmp_path / "b" / "DanPASS" / "text" / "a.txt")
+    assert _entries(tmp_path / "d") == []
@@ -0,0 +1,35 @@
+"""Tests for the incremental sync of Den2Radio."""
+
+import pandas as pd
+
+from rifsdatasets.den2radio import _episode_files
+
+
+def _all_csv(title: str = "Episode"):
+    """A minimal all.csv with one episode of two files."""
+    return pd.DataFrame(
+        {
+            "year": [2020],
+            "title": [title],
+            "download_links": [
+                "['http://den2radio.dk/assets/download.php?file=files/a%20-b.mp3', "
+                "'http://den2radio.dk/assets/download.php?file=files/c.mp3']"
+            ],
+        }
+    )
+
+
+def test_episode_files_lists_every_link(tmp_path):
+    files = _episode_files(_all_csv(), str(tmp_path))
+    assert list(files["url"]) == ["files/a%20-b.mp3", "files/c.mp3"]
+    assert files["wav"][0].endswith("audio/2020/ab.wav")
+    assert files["mp3"][1].endswith("downloads/2020/c.mp3")
+
+
+def test_episode_row_hash_changes_with_the_row(tmp_path):
+    before = _episode_files(_all_csv(), str(tmp_path))
+    same = _episode_files(_all_csv(), str(tmp_path))
+    after = _episode_files(_all_csv("Episode, corrected"), str(tmp_path))
+    assert list(before["row"]) == list(same["row"])
+    assert before["row"][0] == before["row"][1]
+    assert before["row"][0] != after["row"][0]
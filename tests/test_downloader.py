@@ -0,0 +1,228 @@
+"""Tests for the concurrent downloader."""
+
+import hashlib
+import os
+import time
+from collections import Counter
+from functools import partial
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+
+import pytest
+
+from rifsdatasets.downloader import Downloader, DownloadManifest
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """Serve the files of the server from memory."""
+
+    def log_message(self, *args):
+        """Log nothing."""
+
+    def do_GET(self):
+        """Serve a file while counting the open requests of every host."""
+        server = self.server
+        host = self.headers["Host"].rpartition(":")[0]
+        with server.lock:
+            server.requests.append((self.path, dict(self.headers)))
+            server.active[host] += 1
+            server.peak[host] = max(server.peak[host], server.active[host])
+        try:
+            time.sleep(server.delay)
+            self._respond()
+        finally:
+            with server.lock:
+                server.active[host] -= 1
+
+    def _respond(self):
+        """Send a file, the range asked for or an error."""
+        server = self.server
+        with server.lock:
+            failing = server.failures[self.path] > 0
+            server.failures[self.path] -= failing
+        if failing:
+            self.send_error(503)
+            return
+        if self.path not in server.files:
+            self.send_error(404)
+            return
+        data = server.files[self.path]
+        digest = hashlib.sha256(data).hexdigest()
+        validators = {
+            "ETag": f'"{digest[:16]}"',
+            # A date per content stands in for the modification time.
+            "Last-Modified": f"Mon, 01 Jan 2024 00:00:{int(digest, 16) % 60:02d} GMT",
+        }
+        validator = server.validator and validators[server.validator]
+        start = 0
+        if "Range" in self.headers and self.headers.get("If-Range", validator) == (
+            validator
+        ):
+            start = int(self.headers["Range"][len("bytes=") : -1])  # noqa: E203
+        if start and start >= len(data):
+            self.send_response(416)
+            self.send_header("Content-Range", f"bytes */{len(data)}")
+            self.end_headers()
+            return
+        self.send_response(206 if start else 200)
+        if start:
+            self.send_header(
+                "Content-Range", f"bytes {start}-{len(data) - 1}/{len(data)}"
+            )
+        self.send_header("Content-Length", str(len(data) - start))
+        if validator:
+            self.send_header(server.validator, validator)
+        self.end_headers()
+        # A truncated response ends the connection early.
+        stop = server.truncate.pop(self.path, len(data))
+        self.wfile.write(data[start:stop])
+        if stop < len(data):
+            self.close_connection = True
+
+
+@pytest.fixture
+def server():
+    """A local http server, its base url is in server.url."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    server.daemon_threads = True
+    server.lock = Lock()
+    server.files, server.requests, server.delay = {}, [], 0.0
+    server.validator, server.truncate = "ETag", {}
+    server.failures, server.active, server.peak = Counter(), Counter(), Counter()
+    server.url = f"http://127.0.0.1:{server.server_address[1]}"
+    Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_downloads_are_capped_per_host(tmp_path, server):
+    server.delay = 0.05
+    hosts = [server.url, server.url.replace("127.0.0.1", "localhost")]
+    for i in range(8):
+        server.files[f"/{i}"] = os.urandom(1000)
+    with Downloader(max_workers=8, max_per_host=2, quiet=True) as downloader:
+        for i in range(8):
+            downloader.submit(f"{hosts[i % 2]}/{i}", str(tmp_path / str(i)))
+    assert downloader.files == 8 and downloader.bytes == 8000
+    assert dict(server.peak) == {"127.0.0.1": 2, "localhost": 2}
+    for i in range(8):
+        with open(tmp_path / str(i), "rb") as f:
+            assert f.read() == server.files[f"/{i}"]
+
+
+def test_manifest_records_downloads_and_failures(tmp_path, server):
+    server.files["/a.mp3"] = data = os.urandom(3000)
+    manifest = DownloadManifest(str(tmp_path / "manifest.json"))
+    done = []
+    with manifest, Downloader(manifest=manifest, quiet=True) as downloader:
+        for name in ["a.mp3", "b.mp3"]:
+            callback = partial(done.append, name)
+            downloader.submit(f"{server.url}/{name}", str(tmp_path / name), callback)
+    assert done == ["a.mp3"]
+
+    entries = DownloadManifest(str(tmp_path / "manifest.json")).entries
+    a = entries[f"{server.url}/a.mp3"]
+    assert a["status"] == "downloaded" and a["path"] == "a.mp3"
+    assert a["size"] == 3000 and a["sha256"] == hashlib.sha256(data).hexdigest()
+    assert entries[f"{server.url}/b.mp3"]["status"] == "failed"
+    assert [url for url, _ in downloader.errors] == [f"{server.url}/b.mp3"]
+    assert not os.path.exists(tmp_path / "b.mp3")
+
+
+def test_server_errors_are_retried(tmp_path, server):
+    server.files["/a"] = b"data"
+    server.failures["/a"] = 2
+    with Downloader(retries=3, quiet=True) as downloader:
+        downloader.submit(f"{server.url}/a", str(tmp_path / "a"))
+    assert downloader.errors == []
+    assert len(server.requests) == 3
+
+    server.failures["/a"] = 5
+    with Downloader(retries=2, quiet=True) as downloader:
+        downloader.submit(f"{server.url}/a", str(tmp_path / "b"))
+    assert [url for url, _ in downloader.errors] == [f"{server.url}/a"]
+
+
+def test_downloaded_files_are_skipped(tmp_path, server):
+    server.files["/a"] = b"data"
+    manifest = DownloadManifest(str(tmp_path / "manifest.json"))
+    callbacks = []
+    for _ in range(2):
+        with Downloader(manifest=manifest, quiet=True) as downloader:
+            downloader.submit(
+                f"{server.url}/a", str(tmp_path / "a"), lambda: callbacks.append(1)
+            )
+    assert (downloader.files, downloader.skipped) == (0, 1)
+    assert len(server.requests) == 1 and len(callbacks) == 2
+
+    # A file that is gone or has another size is downloaded again.
+    with open(tmp_path / "a", "wb") as f:
+        f.write(b"dat")
+    with Downloader(manifest=manifest, quiet=True) as downloader:
+        downloader.submit(f"{server.url}/a", str(tmp_path / "a"))
+    assert (downloader.files, downloader.skipped) == (1, 0)
+    with open(tmp_path / "a", "rb") as f:
+        assert f.read() == b"data"
+
+
+def _resume(tmp_path, server, changed: int = 0):
+    """Download a file that fails half way and download it again."""
+    server.files["/a"] = os.urandom(100000)
+    server.truncate["/a"] = 40000
+    manifest = DownloadManifest(str(tmp_path / "manifest.json"))
+    with manifest, Downloader(
+        manifest=manifest, chunk_size=10000, quiet=True
+    ) as downloader:
+        downloader.submit(f"{server.url}/a", str(tmp_path / "a"))
+    assert len(downloader.errors) == 1
+    assert os.path.getsize(tmp_path / "a.part") == 40000
+    entry = manifest.get(f"{server.url}/a")
+    assert entry["status"] == "failed" and entry["size"] == 100000
+
+    if changed:
+        server.files["/a"] = os.urandom(changed)
+    manifest = DownloadManifest(str(tmp_path / "manifest.json"))
+    with manifest, Downloader(
+        manifest=manifest, chunk_size=10000, quiet=True
+    ) as downloader:
+        downloader.submit(f"{server.url}/a", str(tmp_path / "a"))
+    assert downloader.errors == []
+    with open(tmp_path / "a", "rb") as f:
+        assert f.read() == server.files["/a"]
+    assert not os.path.exists(tmp_path / "a.part")
+    assert manifest.get(f"{server.url}/a")["status"] == "downloaded"
+    return downloader, server.requests[-1][1]
+
+
+@pytest.mark.parametrize("validator", ["ETag", "Last-Modified"])
+def test_resume_of_an_unchanged_file(tmp_path, server, validator):
+    server.validator = validator
+    downloader, headers = _resume(tmp_path, server)
+    assert headers["Range"] == "bytes=40000-"
+    entry = DownloadManifest(str(tmp_path / "manifest.json")).get(f"{server.url}/a")
+    key = "etag" if validator == "ETag" else "last_modified"
+    assert headers["If-Range"] == entry[key]
+    assert downloader.bytes == 60000
+
+
+@pytest.mark.parametrize(
+    "validator, size", [("ETag", 100000), ("Last-Modified", 100000), (None, 90000)]
+)
+def test_resume_of_a_changed_file(tmp_path, server, validator, size):
+    # Without validators only a change of size can be told apart.
+    server.validator = validator
+    downloader, headers = _resume(tmp_path, server, changed=size)
+    assert downloader.bytes == size
+
+
+def test_truncated_download_is_not_renamed(tmp_path, server):
+    from rifsdatasets.downloader import download_file
+    import requests
+
+    server.files["/a"] = b"x" * 1000
+    server.truncate["/a"] = 10
+    with requests.Session() as session, pytest.raises(Exception):
+        download_file(session, f"{server.url}/a", str(tmp_path / "a"), 5)
+    assert not os.path.exists(tmp_path / "a")
+    assert os.path.getsize(tmp_path / "a.part") == 10
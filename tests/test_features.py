@@ -0,0 +1,99 @@
+"""Tests for the extraction of log-mel features."""
+
+import os
+
+import numpy as np
+import pytest
+
+from rifsdatasets.features import (
+    FeatureConfig,
+    extract_features,
+    load_features,
+    log_mel,
+    mel_filterbank,
+)
+from rifsdatasets.manifest import read_manifest
+from tests.conftest import SAMPLE_RATE, SEGMENTS, segment_value
+
+
+def _tone(frequency: float, seconds: float = 1.0, sample_rate: int = SAMPLE_RATE):
+    """A sine of frequency Hz as 16 bit samples."""
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    return (np.sin(2 * np.pi * frequency * t) * 10000).astype("<i2")
+
+
+def test_log_mel_shape():
+    config = FeatureConfig()
+    features = log_mel(_tone(440), SAMPLE_RATE, config)
+    assert features.shape == (config.num_frames(SAMPLE_RATE), config.n_mels)
+    assert features.dtype == np.float32
+    assert log_mel(_tone(440)[:399], SAMPLE_RATE, config).shape == (0, config.n_mels)
+
+
+def test_log_mel_peaks_at_the_tone():
+    config = FeatureConfig()
+    filters = mel_filterbank(config)
+    bins = np.linspace(0, SAMPLE_RATE / 2, config.n_fft // 2 + 1)
+    for frequency in [300, 1000, 4000]:
+        features = log_mel(_tone(frequency), SAMPLE_RATE, config, filters)
+        band = filters[np.argmin(np.abs(bins - frequency))].argmax()
+        assert abs(int(np.median(features.argmax(axis=1))) - band) <= 1
+
+
+def test_log_mel_converts_samples():
+    config = FeatureConfig()
+    samples = _tone(1000)
+    expected = log_mel(samples, SAMPLE_RATE, config)
+    floats = samples.astype(np.float32) / 32768
+    np.testing.assert_allclose(
+        log_mel(floats, SAMPLE_RATE, config), expected, atol=1e-4
+    )
+    stereo = np.stack([samples, samples], axis=1)
+    np.testing.assert_allclose(
+        log_mel(stereo, SAMPLE_RATE, config), expected, atol=1e-4
+    )
+    resampled = log_mel(_tone(1000, sample_rate=8000), 8000, config)
+    assert len(resampled) == len(expected)
+
+
+@pytest.mark.parametrize("split", ["train", "valid", "test"])
+def test_extract_features_of_split_dataset_output(segmented_dataset, split):
+    config = FeatureConfig()
+    extract_features(segmented_dataset, split, config, num_workers=2, quiet=True)
+    features, index = load_features(segmented_dataset, split, config)
+    assert len(index) == len(read_manifest(segmented_dataset, split))
+    frames = config.num_frames(int(0.9 * SAMPLE_RATE))
+    assert (index["frames"] == frames).all()
+    assert len(features) == frames * len(index)
+    for row in index.to_dict("records"):
+        episode = int(row["id"].split("/")[2][len("episode") :])  # noqa: E203
+        value = segment_value(episode, int(row["file"][: -len(".wav")]))
+        audio = np.full(int(0.9 * SAMPLE_RATE), value, dtype="<i2")
+        expected = log_mel(audio, SAMPLE_RATE, config)
+        offset = row["offset"]
+        np.testing.assert_allclose(
+            features[offset : offset + row["frames"]], expected, atol=1e-4  # noqa: E203
+        )
+
+
+def test_extract_features_of_whole_recordings(recording_dataset):
+    config = FeatureConfig(n_mels=40)
+    output_dir = extract_features(recording_dataset, "train", config, quiet=True)
+    features, index = load_features(recording_dataset, "train", config)
+    assert len(index) == 2 * len(SEGMENTS)
+    assert (index["frames"] == config.num_frames(int(0.9 * SAMPLE_RATE))).all()
+    assert features.shape[1] == 40
+
+    # Features newer than the manifest are not extracted again.
+    array_path = os.path.join(output_dir, "train.npy")
+    modified = os.path.getmtime(array_path)
+    assert (
+        extract_features(recording_dataset, "train", config, quiet=True) == output_dir
+    )
+    assert os.path.getmtime(array_path) == modified
+
+
+def test_load_features_without_extraction(recording_dataset):
+    extract_features(recording_dataset, "train", quiet=True)
+    with pytest.raises(FileNotFoundError):
+        load_features(recording_dataset, "train", FeatureConfig(n_mels=64))
@@ -0,0 +1,76 @@
+"""Tests for the extraction of freesound noisepacks."""
+
+import os
+import zipfile
+
+import numpy as np
+import pytest
+
+from rifsdatasets.downloader import DownloadManifest
+from rifsdatasets.freesound import BASE_URL, _fetch_pack
+from rifsdatasets.utils import ConversionPool, read_wav_header
+from tests.conftest import write_wav
+
+PACK_URL = f"{BASE_URL}/apiv2/packs/1/download/"
+
+
+def _downloaded_pack(target, files):
+    """Write a pack zip of files that was downloaded before an interruption."""
+    folder = target / "pack"
+    folder.mkdir(parents=True)
+    with zipfile.ZipFile(folder / "pack.zip", "w") as zip_ref:
+        for name, path in files.items():
+            zip_ref.write(path, name)
+    manifest = DownloadManifest(str(folder / "manifest.json"))
+    manifest.update(PACK_URL, path="pack.zip", status="downloaded")
+    manifest.save()
+    return folder
+
+
+def _fetch(target, pool):
+    """Extract the downloaded pack with the download resumed."""
+    return _fetch_pack(
+        None, pool, str(target), 1, "pack", 1 << 20, 0, True, False, True
+    )
+
+
+def test_wav_sounds_are_converted_to_the_format(tmp_path):
+    import wave
+
+    pytest.importorskip("miniaudio")
+    sources = tmp_path / "sources"
+    write_wav(sources / "match.wav", np.arange(8000))
+    with wave.open(str(sources / "stereo.wav"), "wb") as f:
+        f.setnchannels(2)
+        f.setsampwidth(2)
+        f.setframerate(44100)
+        f.writeframes(np.zeros((44100, 2), dtype="<i2").tobytes())
+    files = {name: sources / name for name in ["match.wav", "stereo.wav"]}
+    folder = _downloaded_pack(tmp_path / "target", files)
+
+    with ConversionPool(
+        1, quiet=True, streaming=True, sample_rate=16000, channels=1
+    ) as pool:
+        _, _, _, sounds = _fetch(tmp_path / "target", pool)
+    assert pool.report.errors == []
+    assert sorted(sounds) == sorted(str(folder / "audio" / name) for name in files)
+    assert sorted(os.listdir(folder / "audio")) == sorted(files)
+    for sound in sounds:
+        header = read_wav_header(sound)
+        assert (header.sample_rate, header.channels) == (16000, 1)
+    assert read_wav_header(str(folder / "audio" / "stereo.wav")).frames == 16000
+    with open(folder / "audio" / "match.wav", "rb") as f:
+        assert f.read() == (sources / "match.wav").read_bytes()
+    assert not os.path.exists(folder / "pack.zip")
+
+
+def test_zip_is_kept_if_the_extraction_fails(tmp_path):
+    sources = tmp_path / "sources"
+    write_wav(sources / "a.wav", np.zeros(100))
+    folder = _downloaded_pack(tmp_path / "target", {"a.wav": sources / "a.wav"})
+    (folder / "pack.zip").write_bytes(b"not a zip")
+
+    with ConversionPool(1, quiet=True) as pool:
+        with pytest.raises(zipfile.BadZipFile):
+            _fetch(tmp_path / "target", pool)
+    assert os.path.exists(folder / "pack.zip")
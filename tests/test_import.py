@@ -0,0 +1,43 @@
+"""Tests for importing rifsdatasets."""
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+import rifsdatasets
+
+
+def test_import_does_not_load_heavy_modules():
+    code = "import sys, rifsdatasets; print('\\n'.join(sys.modules))"
+    src = os.path.dirname(os.path.dirname(rifsdatasets.__file__))
+    env = {**os.environ, "PYTHONPATH": src}
+    output = subprocess.run(
+        [sys.executable, "-c", code],
+        check=True,
+        capture_output=True,
+        text=True,
+        env=env,
+    ).stdout
+    modules = set(output.split())
+    assert "pandas" not in modules
+    assert "git" not in modules
+    for name in rifsdatasets.all_datasets:
+        assert rifsdatasets._modules[name] not in modules
+
+
+@pytest.mark.parametrize("name", ["split_dataset", "merge_rifsdatasets"])
+def test_function_is_callable_after_its_module_is_imported(name):
+    import importlib
+
+    importlib.import_module(f"rifsdatasets.{name}")
+    assert callable(getattr(rifsdatasets, name))
+    assert getattr(rifsdatasets, name).__name__ == name
+
+
+def test_lazy_names():
+    assert "SegmentDataset" in dir(rifsdatasets)
+    assert list(rifsdatasets.all_datasets)[0] == "LibriVoxDansk"
+    with pytest.raises(AttributeError):
+        rifsdatasets.missing
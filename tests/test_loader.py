@@ -0,0 +1,58 @@
+"""Tests for SegmentDataset."""
+
+import numpy as np
+import pytest
+
+from rifsdatasets.loader import SegmentDataset, segment_bounds
+from tests.conftest import SAMPLE_RATE, SEGMENTS, segment_value
+
+
+def _expected(row) -> int:
+    """The value of the samples of a split_dataset row."""
+    episode = int(row["id"].split("/")[2][len("episode") :])  # noqa: E203
+    return segment_value(episode, int(row["file"][: -len(".wav")]))
+
+
+@pytest.mark.parametrize("split", ["train", "valid", "test"])
+def test_segments_of_split_dataset_output(segmented_dataset, split):
+    dataset = SegmentDataset(segmented_dataset, split)
+    assert len(dataset) > 0
+    for segment in dataset:
+        assert segment.sample_rate == SAMPLE_RATE
+        assert len(segment.audio) == int(0.9 * SAMPLE_RATE)
+        assert (segment.audio == _expected(segment.row)).all()
+
+
+def test_segments_of_whole_recordings(recording_dataset):
+    dataset = SegmentDataset(recording_dataset, "train")
+    assert len(dataset) == 2 * len(SEGMENTS)
+    for segment in dataset:
+        assert len(segment.audio) == int(0.9 * SAMPLE_RATE)
+        value = segment_value(segment.row["episode"], segment.row["segment"])
+        assert (segment.audio == value).all()
+
+
+def test_segments_without_times_are_whole_files(recording_dataset):
+    dataset = SegmentDataset(recording_dataset, "train", start_column=None)
+    assert len(dataset[1].audio) == int(1.9 * SAMPLE_RATE)
+    dataset = SegmentDataset(
+        recording_dataset, "train", start_column=None, end_column=None
+    )
+    assert len(dataset[-1].audio) == int(5.9 * SAMPLE_RATE)
+
+
+@pytest.mark.parametrize(
+    "start, end, frames, bounds",
+    [
+        (np.nan, np.nan, 100, (0, 100)),
+        # The source recording.
+        (2.0, 3.0, 1000, (200, 300)),
+        (9.0, 10.5, 1000, (900, 1000)),
+        # A file of the segment alone.
+        (2.0, 3.0, 100, (0, 100)),
+        (0.0, 1.0, 100, (0, 100)),
+        (0.05, 1.0, 95, (0, 95)),
+    ],
+)
+def test_segment_bounds(start, end, frames, bounds):
+    assert segment_bounds(start, end, 100, frames) == bounds
@@ -0,0 +1,114 @@
+"""Tests for reading and writing manifests."""
+
+import os
+
+import pandas as pd
+import pytest
+
+from rifsdatasets.manifest import (
+    ManifestWriter,
+    iter_manifest,
+    manifest_path,
+    read_manifest,
+    write_manifest,
+)
+
+FORMATS = ["csv", "parquet"]
+
+
+def _segments(n: int, offset: int = 0):
+    """A manifest of n segments."""
+    return pd.DataFrame(
+        {
+            "id": [f"audio/{i}.wav" for i in range(offset, offset + n)],
+            "start": [float(i) for i in range(n)],
+            "text": [f"text {i}" for i in range(n)],
+        }
+    )
+
+
+@pytest.mark.parametrize("output_format", FORMATS)
+def test_write_and_read_round_trip(tmp_path, output_format):
+    df = _segments(5)
+    path = write_manifest(df, str(tmp_path), "train", output_format)
+    assert path == manifest_path(str(tmp_path), "train")
+    pd.testing.assert_frame_equal(read_manifest(str(tmp_path), "train"), df)
+    assert list(read_manifest(str(tmp_path), "train", columns=["id"]).columns) == ["id"]
+
+
+def test_manifest_path_prefers_the_newest_format(tmp_path):
+    assert manifest_path(str(tmp_path), "all").endswith("all.csv")
+    parquet = write_manifest(_segments(2), str(tmp_path), "all", "parquet")
+    _segments(1).to_csv(tmp_path / "all.csv", index=False)
+    os.utime(parquet, (1e10, 1e10))
+    assert manifest_path(str(tmp_path), "all") == parquet
+    assert len(read_manifest(str(tmp_path), "all")) == 2
+
+
+@pytest.mark.parametrize("output_format", FORMATS)
+def test_writing_removes_the_other_format(tmp_path, output_format):
+    other = {"csv": "parquet", "parquet": "csv"}[output_format]
+    write_manifest(_segments(1), str(tmp_path), "all", other)
+    write_manifest(_segments(2), str(tmp_path), "all", output_format)
+    assert os.listdir(tmp_path) == [f"all.{output_format}"]
+
+    write_manifest(_segments(1), str(tmp_path), "all", other)
+    with ManifestWriter(str(tmp_path), "all", ["id"], output_format) as writer:
+        writer.write(_segments(3))
+    assert os.listdir(tmp_path) == [f"all.{output_format}"]
+    assert len(read_manifest(str(tmp_path), "all")) == 3
+
+
+def test_read_missing_manifest_raises(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        read_manifest(str(tmp_path), "train")
+
+
+@pytest.mark.parametrize("output_format", FORMATS)
+def test_iter_manifest_yields_chunks(tmp_path, output_format):
+    write_manifest(_segments(10), str(tmp_path), "train", output_format)
+    chunks = list(iter_manifest(str(tmp_path), "train", chunk_size=4))
+    assert [len(chunk) for chunk in chunks] == [4, 4, 2]
+    assert list(pd.concat(chunks)["id"]) == list(_segments(10)["id"])
+
+
+@pytest.mark.parametrize("output_format", FORMATS)
+def test_writer_appends_chunks_and_fills_missing_columns(tmp_path, output_format):
+    columns = ["id", "start", "text", "speaker"]
+    with ManifestWriter(str(tmp_path), "train", columns, output_format) as writer:
+        writer.write(_segments(3))
+        writer.write(_segments(2, offset=3))
+        assert not os.path.exists(writer.path)
+    df = read_manifest(str(tmp_path), "train")
+    assert list(df.columns) == columns
+    assert list(df["id"]) == [f"audio/{i}.wav" for i in range(5)]
+    assert df["speaker"].isna().all()
+    assert not os.path.exists(writer.tmp_path)
+
+
+@pytest.mark.parametrize("output_format", FORMATS)
+def test_writer_without_rows_writes_an_empty_manifest(tmp_path, output_format):
+    with ManifestWriter(str(tmp_path), "test", ["id", "text"], output_format):
+        pass
+    df = read_manifest(str(tmp_path), "test")
+    assert list(df.columns) == ["id", "text"]
+    assert len(df) == 0
+
+
+@pytest.mark.parametrize("output_format", FORMATS)
+def test_writer_with_only_empty_chunks_writes_an_empty_manifest(
+    tmp_path, output_format
+):
+    with ManifestWriter(str(tmp_path), "test", ["id"], output_format) as writer:
+        writer.write(_segments(0))
+    assert len(read_manifest(str(tmp_path), "test")) == 0
+
+
+def test_writer_removes_the_partial_manifest_on_errors(tmp_path):
+    write_manifest(_segments(2), str(tmp_path), "train")
+    with pytest.raises(RuntimeError):
+        with ManifestWriter(str(tmp_path), "train", ["id"]) as writer:
+            writer.write(_segments(5))
+            raise RuntimeError
+    assert not os.path.exists(writer.tmp_path)
+    assert len(read_manifest(str(tmp_path), "train")) == 2
@@ -0,0 +1,124 @@
+"""Tests for merge_rifsdatasets."""
+
+import json
+import os
+
+import pandas as pd
+import pytest
+
+from rifsdatasets.manifest import read_manifest, write_manifest
+from rifsdatasets.merge_rifsdatasets import _prefix_ids, merge_rifsdatasets
+
+
+def _make_dataset(path, files: int, output_format: str = "csv", **columns):
+    """Write a dataset with audio files and train and all manifests."""
+    os.makedirs(os.path.join(path, "audio"))
+    names = [f"{i}.wav" for i in range(files)]
+    for name in names:
+        with open(os.path.join(path, "audio", name), "wb") as f:
+            f.write(name.encode())
+    train = pd.DataFrame(
+        {"id": [f"audio/{name}" for name in names], "text": names, **columns}
+    )
+    write_manifest(train, path, "train", output_format)
+    write_manifest(pd.DataFrame({"id": names}), path, "all", output_format)
+    return path
+
+
+def _merge(sources, target, **kwargs):
+    """Merge quietly with a fixed seed."""
+    merge_rifsdatasets(
+        sources, target, ["audio"], quiet=True, seed=0, link_mode="copy", **kwargs
+    )
+
+
+def test_prefix_ids():
+    ids = pd.Series(["audio/x.wav", "audio/a/y.wav"])
+    assert list(_prefix_ids(ids, "ds", "train")) == [
+        "audio/ds/x.wav",
+        "audio/ds/a/y.wav",
+    ]
+    assert list(_prefix_ids(ids, "ds", "all")) == ["ds/audio/x.wav", "ds/audio/a/y.wav"]
+
+
+def test_merge_links_files_and_prefixes_ids(tmp_path):
+    a = _make_dataset(str(tmp_path / "a"), 3)
+    b = _make_dataset(str(tmp_path / "b"), 2)
+    target = str(tmp_path / "merged")
+    _merge([a, b], target)
+
+    train = read_manifest(target, "train")
+    assert sorted(train["id"]) == sorted(
+        [f"audio/a/{i}.wav" for i in range(3)] + [f"audio/b/{i}.wav" for i in range(2)]
+    )
+    for file_id in train["id"]:
+        assert os.path.exists(os.path.join(target, file_id))
+    assert sorted(read_manifest(target, "all")["id"])[0] == "a/0.wav"
+
+
+def test_merge_is_reproducible_with_a_seed(tmp_path):
+    a = _make_dataset(str(tmp_path / "a"), 20)
+    b = _make_dataset(str(tmp_path / "b"), 20)
+    _merge([a, b], str(tmp_path / "one"), shuffle_buckets=4)
+    _merge([a, b], str(tmp_path / "two"), shuffle_buckets=4)
+    one = read_manifest(str(tmp_path / "one"), "train")
+    two = read_manifest(str(tmp_path / "two"), "train")
+    pd.testing.assert_frame_equal(one, two)
+    assert list(one["id"]) != sorted(one["id"])
+
+
+@pytest.mark.parametrize("output_format", ["csv", "parquet"])
+def test_merge_unions_the_columns(tmp_path, output_format):
+    a = _make_dataset(str(tmp_path / "a"), 2, output_format, speaker=["s", "t"])
+    b = _make_dataset(str(tmp_path / "b"), 2, output_format)
+    target = str(tmp_path / "merged")
+    _merge([a, b], target, output_format=output_format)
+    train = read_manifest(target, "train").set_index("id")
+    assert train.loc["audio/a/1.wav", "speaker"] == "t"
+    assert pd.isna(train.loc["audio/b/1.wav", "speaker"])
+
+
+def test_incremental_merge_adds_and_replaces_datasets(tmp_path):
+    a = _make_dataset(str(tmp_path / "a"), 2)
+    b = _make_dataset(str(tmp_path / "b"), 2)
+    target = str(tmp_path / "merged")
+    _merge([a], target, incremental=True)
+    _merge([b], target, incremental=True)
+    with open(os.path.join(target, "merge_state.json")) as f:
+        assert sorted(json.load(f)["sources"]) == ["a", "b"]
+    assert len(read_manifest(target, "train")) == 4
+
+    # An unchanged dataset is skipped and the manifests are left alone.
+    mtime = os.path.getmtime(os.path.join(target, "train.csv"))
+    _merge([a, b], target, incremental=True)
+    assert os.path.getmtime(os.path.join(target, "train.csv")) == mtime
+
+    # A changed dataset replaces its rows and files.
+    _make_dataset(str(tmp_path / "c"), 3)
+    os.rename(a, str(tmp_path / "old"))
+    os.rename(str(tmp_path / "c"), a)
+    _merge([a], target, incremental=True)
+    train = read_manifest(target, "train")
+    assert sorted(train["id"]) == sorted(
+        [f"audio/a/{i}.wav" for i in range(3)] + [f"audio/b/{i}.wav" for i in range(2)]
+    )
+    assert len(os.listdir(os.path.join(target, "audio", "a"))) == 3
+
+
+def test_incremental_merge_switches_the_manifest_format(tmp_path):
+    a = _make_dataset(str(tmp_path / "a"), 2)
+    b = _make_dataset(str(tmp_path / "b"), 2)
+    target = str(tmp_path / "merged")
+    _merge([a], target, incremental=True)
+    _merge([b], target, incremental=True, output_format="parquet")
+    assert not os.path.exists(os.path.join(target, "train.csv"))
+    assert len(read_manifest(target, "train")) == 4
+
+    # Only the format changed, so the manifests are written again.
+    _merge([a, b], target, incremental=True)
+    assert sorted(name for name in os.listdir(target) if "." in name) == [
+        "all.csv",
+        "merge_state.json",
+        "train.csv",
+    ]
+    assert len(read_manifest(target, "train")) == 4
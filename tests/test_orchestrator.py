@@ -0,0 +1,81 @@
+"""Tests for downloading several datasets at once."""
+
+import os
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+
+import pytest
+
+import rifsdatasets
+from rifsdatasets.base import Base
+from rifsdatasets.benchmark import _MP3_FRAME
+from rifsdatasets.orchestrator import download_datasets
+
+
+class _Handler(SimpleHTTPRequestHandler):
+    """Serve files without logging every request."""
+
+    def log_message(self, *args):
+        """Log nothing."""
+
+
+def _dataset(name: str, url: str, files: int):
+    """A dataset class fetching mp3 files from url and converting them."""
+
+    def download(target_folder: str, verbose: bool = False, quiet: bool = False):
+        """Fetch the mp3 files and convert them to wav."""
+        from rifsdatasets.downloader import Downloader
+        from rifsdatasets.utils import ConversionPool
+
+        target = os.path.join(target_folder, name)
+        os.makedirs(target, exist_ok=True)
+        with ConversionPool(quiet=quiet, streaming=True) as pool:
+            with Downloader(quiet=quiet) as downloader:
+                for i in range(files):
+                    mp3, wav = (
+                        os.path.join(target, f"{i}.{e}") for e in ["mp3", "wav"]
+                    )
+                    downloader.submit(
+                        f"{url}/{i}.mp3", mp3, partial(pool.submit, mp3, wav)
+                    )
+        if pool.report.errors or downloader.errors:
+            raise RuntimeError("Download failed")
+
+    return type(name, (Base,), {"download": staticmethod(download)})
+
+
+def test_progress_is_combined_across_datasets(tmp_path, monkeypatch, capsys):
+    pytest.importorskip("miniaudio")
+    www = tmp_path / "www"
+    os.makedirs(www)
+    for i in range(3):
+        with open(www / f"{i}.mp3", "wb") as f:
+            f.write(_MP3_FRAME * 50)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), partial(_Handler, directory=www))
+    Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    datasets = {
+        "First": _dataset("First", url, 2),
+        "Second": _dataset("Second", url, 3),
+    }
+    monkeypatch.setattr(rifsdatasets, "all_datasets", datasets)
+    try:
+        summary = download_datasets(
+            ["First", "Second"], str(tmp_path / "data"), progress_interval=0
+        )
+    finally:
+        server.shutdown()
+
+    size = len(_MP3_FRAME) * 50
+    for name, files in [("First", 2), ("Second", 3)]:
+        assert summary[name]["status"] == "done"
+        assert summary[name]["fetched"] == summary[name]["converted"] == files
+        assert summary[name]["fetched_bytes"] == files * size
+    lines = capsys.readouterr().out.splitlines()
+    progress = [line for line in lines if line.startswith("[progress]")]
+    assert progress, "No progress was printed"
+    assert progress[-1].endswith(
+        f"5 files fetched ({5 * size / 1e6:.1f} MB), "
+        f"5 files converted ({5 * size / 1e6:.1f} MB)"
+    )
@@ -0,0 +1,47 @@
+"""Tests for DurationBucketSampler."""
+
+import numpy as np
+
+from rifsdatasets.sampler import DurationBucketSampler
+
+
+def _durations(n: int = 200, seed: int = 0):
+    """Random segment durations in seconds."""
+    return np.random.default_rng(seed).uniform(1.0, 20.0, n)
+
+
+def test_batches_cover_every_segment_once_within_the_budget():
+    durations = _durations()
+    sampler = DurationBucketSampler(durations, max_duration=60.0, seed=1)
+    batches = list(sampler)
+    assert sorted(i for batch in batches for i in batch) == list(range(200))
+    for batch in batches:
+        padded = len(batch) * max(durations[i] for i in batch)
+        assert padded <= 60.0 or len(batch) == 1
+
+
+def test_batches_depend_on_the_seed_and_epoch():
+    durations = _durations()
+    first = list(DurationBucketSampler(durations, 60.0, seed=1))
+    assert list(DurationBucketSampler(durations, 60.0, seed=1)) == first
+    sampler = DurationBucketSampler(durations, 60.0, seed=1)
+    sampler.set_epoch(1)
+    assert list(sampler) != first
+
+
+def test_ranks_share_the_batches_evenly():
+    durations = _durations()
+    ranks = [
+        list(DurationBucketSampler(durations, 60.0, rank=rank, world_size=3))
+        for rank in range(3)
+    ]
+    assert len({len(batches) for batches in ranks}) == 1
+    seen = [i for batches in ranks for batch in batches for i in batch]
+    assert set(seen) == set(range(200))
+
+
+def test_drop_last_drops_the_uneven_batches():
+    durations = _durations()
+    total = len(DurationBucketSampler(durations, 60.0))
+    dropped = DurationBucketSampler(durations, 60.0, world_size=3, drop_last=True)
+    assert len(dropped) == total // 3
@@ -0,0 +1,58 @@
+"""Tests for packing splits into shards and reading them back."""
+
+import pytest
+
+from rifsdatasets.manifest import read_manifest
+from rifsdatasets.shards import ShardReader, pack_shards
+from tests.conftest import SAMPLE_RATE, SEGMENTS, segment_value
+
+
+def _expected(row) -> int:
+    """The value of the samples of a split_dataset row."""
+    episode = int(row["id"].split("/")[2][len("episode") :])  # noqa: E203
+    return segment_value(episode, int(row["file"][: -len(".wav")]))
+
+
+@pytest.mark.parametrize("split", ["train", "valid", "test"])
+def test_round_trip_of_split_dataset_output(segmented_dataset, tmp_path, split):
+    output_dir = str(tmp_path / "shards")
+    shards = pack_shards(
+        segmented_dataset,
+        split,
+        output_dir,
+        shard_size=20000,
+        num_workers=2,
+        quiet=True,
+    )
+    assert len(shards) > 1
+    segments = list(ShardReader(output_dir, split, shuffle_shards=False))
+    ids = [segment.row["id"] for segment in segments]
+    assert ids == read_manifest(segmented_dataset, split)["id"].tolist()
+    for segment in segments:
+        assert segment.sample_rate == SAMPLE_RATE
+        assert len(segment.audio) == int(0.9 * SAMPLE_RATE)
+        assert (segment.audio == _expected(segment.row)).all()
+
+
+@pytest.mark.parametrize("output_format", ["csv", "parquet"])
+def test_round_trip_of_whole_recordings(recording_dataset, tmp_path, output_format):
+    if output_format == "parquet":
+        pytest.importorskip("pyarrow")
+    output_dir = str(tmp_path / "shards")
+    pack_shards(
+        recording_dataset, "train", output_dir, output_format=output_format, quiet=True
+    )
+    segments = list(ShardReader(output_dir, "train", shuffle_buffer=4, seed=0))
+    assert len(segments) == 2 * len(SEGMENTS)
+    for segment in segments:
+        assert len(segment.audio) == int(0.9 * SAMPLE_RATE)
+        value = segment_value(segment.row["episode"], segment.row["segment"])
+        assert (segment.audio == value).all()
+
+
+def test_repacking_removes_stale_shards(recording_dataset, tmp_path):
+    output_dir = str(tmp_path / "shards")
+    pack_shards(recording_dataset, "train", output_dir, shard_size=30000, quiet=True)
+    shards = pack_shards(recording_dataset, "train", output_dir, quiet=True)
+    assert len(shards) == 1
+    assert len(list(ShardReader(output_dir, "train"))) == 2 * len(SEGMENTS)
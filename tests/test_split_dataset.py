@@ -0,0 +1,85 @@
+"""Tests for split_dataset."""
+
+import os
+
+import pandas as pd
+import pytest
+
+from rifsdatasets.manifest import read_manifest
+from rifsdatasets.split_dataset import _split_by_duration, split_dataset
+
+
+def _make_dataset(path, series: int, episodes: int, seconds: float = 60.0):
+    """Write segments.csv files of equal duration, one per episode."""
+    for i in range(series):
+        for j in range(episodes):
+            folder = os.path.join(path, "alignments", f"series{i}", f"episode{j}")
+            os.makedirs(folder)
+            pd.DataFrame(
+                {
+                    "file": ["a.wav", "b.wav"],
+                    "start": [0.0, seconds / 2],
+                    "end": [seconds / 2, seconds],
+                    "text": ["a", "b"],
+                }
+            ).to_csv(os.path.join(folder, "segments.csv"), index=False)
+
+
+def _episodes(dataset_path, split):
+    """The episodes in a split manifest."""
+    ids = read_manifest(dataset_path, split)["id"]
+    return set(ids.map(os.path.dirname))
+
+
+@pytest.mark.parametrize("split_method", ["random", "duration", "stratified"])
+def test_every_file_is_in_exactly_one_split(tmp_path, split_method):
+    _make_dataset(str(tmp_path), series=4, episodes=5)
+    split_dataset(str(tmp_path), split_method=split_method, quiet=True)
+    splits = [_episodes(str(tmp_path), name) for name in ("train", "test", "valid")]
+    assert sum(len(split) for split in splits) == 20
+    assert set().union(*splits) == {
+        os.path.join("alignments", f"series{i}", f"episode{j}")
+        for i in range(4)
+        for j in range(5)
+    }
+
+
+def test_stratified_meets_the_ratios_over_many_small_groups(tmp_path):
+    _make_dataset(str(tmp_path), series=60, episodes=3)
+    split_dataset(
+        str(tmp_path),
+        split_method="stratified",
+        split_ratio=0.8,
+        split_test_ratio=0.5,
+        quiet=True,
+    )
+    train, test, valid = (
+        len(_episodes(str(tmp_path), name)) for name in ("train", "test", "valid")
+    )
+    assert train + test + valid == 180
+    assert abs(train - 144) <= 1
+    assert abs(test - 18) <= 1
+    assert abs(valid - 18) <= 1
+
+
+def test_stratified_is_reproducible(tmp_path):
+    for name in ("a", "b"):
+        _make_dataset(str(tmp_path / name), series=10, episodes=3)
+        split_dataset(str(tmp_path / name), split_method="stratified", quiet=True)
+    assert _episodes(str(tmp_path / "a"), "test") == _episodes(
+        str(tmp_path / "b"), "test"
+    )
+
+
+def test_split_by_duration_carries_the_balance_between_groups():
+    durations = {f"{group}{i}": 1.0 for group in "abcdefghij" for i in range(2)}
+    balance = [0.0, 0.0, 0.0]
+    assigned = [[], [], []]
+    for group in "abcdefghij":
+        files = [f"{group}0", f"{group}1"]
+        for split, files in zip(
+            assigned, _split_by_duration(files, durations, [0.8, 0.1, 0.1], balance)
+        ):
+            split += files
+    assert [len(split) for split in assigned] == [16, 2, 2]
+    assert balance == pytest.approx([0.0, 0.0, 0.0])
@@ -0,0 +1,141 @@
+"""Tests for the conversion helpers in utils."""
+
+import os
+
+import pytest
+
+from rifsdatasets import utils
+from rifsdatasets.benchmark import _MP3_FRAME
+from rifsdatasets.utils import (
+    ConversionPool,
+    convert_mp3_files_to_wav,
+    read_wav_header,
+    write_errors,
+)
+
+
+def _write_mp3(path, frames: int = 100):
+    """Write a silent 44.1 kHz mono mp3 of frames frames of 1152 samples."""
+    with open(path, "wb") as f:
+        f.write(_MP3_FRAME * frames)
+
+
+def test_conversion_is_written_to_part_and_renamed(tmp_path, monkeypatch):
+    written = []
+
+    def convert(src, dst, **options):
+        """Record the path written to."""
+        assert not os.path.exists(tmp_path / "a.wav")
+        written.append(dst)
+        with open(dst, "wb") as f:
+            f.write(b"wav")
+
+    monkeypatch.setattr(utils, "convert_mp3_to_wav", convert)
+    _write_mp3(tmp_path / "a.mp3")
+    report = convert_mp3_files_to_wav(
+        [(str(tmp_path / "a.mp3"), str(tmp_path / "a.wav"))], num_workers=1, quiet=True
+    )
+    assert written == [str(tmp_path / "a.wav.part")]
+    assert sorted(os.listdir(tmp_path)) == ["a.mp3", "a.wav"]
+    assert report.files == 1 and report.bytes == os.path.getsize(tmp_path / "a.mp3")
+
+
+def test_failed_conversion_leaves_no_part_file(tmp_path, monkeypatch):
+    def convert(src, dst, **options):
+        """Write part of the file and fail."""
+        with open(dst, "wb") as f:
+            f.write(b"half")
+        raise ValueError("broken")
+
+    monkeypatch.setattr(utils, "convert_mp3_to_wav", convert)
+    _write_mp3(tmp_path / "a.mp3")
+    errors = []
+    with ConversionPool(num_workers=1, quiet=True) as pool:
+        pool.submit(str(tmp_path / "a.mp3"), str(tmp_path / "a.wav"), errors.append)
+    assert errors == ["ValueError: broken"]
+    assert pool.report.errors == [(str(tmp_path / "a.mp3"), "ValueError: broken")]
+    assert sorted(os.listdir(tmp_path)) == ["a.mp3"]
+
+
+def test_pool_converts_on_processes_and_collects_errors(tmp_path):
+    pytest.importorskip("miniaudio")
+    files = []
+    for i in range(4):
+        _write_mp3(tmp_path / f"{i}.mp3")
+        files.append((str(tmp_path / f"{i}.mp3"), str(tmp_path / "wav" / f"{i}.wav")))
+    with open(tmp_path / "broken.mp3", "wb") as f:
+        f.write(b"not an mp3")
+    files.append((str(tmp_path / "broken.mp3"), str(tmp_path / "wav" / "broken.wav")))
+
+    report = convert_mp3_files_to_wav(
+        files, num_workers=2, quiet=True, streaming=True, sample_rate=16000
+    )
+    assert report.files == 4
+    assert [src for src, _ in report.errors] == [str(tmp_path / "broken.mp3")]
+    assert sorted(os.listdir(tmp_path / "wav")) == [f"{i}.wav" for i in range(4)]
+    assert read_wav_header(str(tmp_path / "wav" / "0.wav")).sample_rate == 16000
+
+    write_errors(str(tmp_path), report.errors)
+    with open(tmp_path / "errors.txt") as f:
+        path, error = f.read().rstrip("\n").split("\t")
+    assert path == str(tmp_path / "broken.mp3")
+    assert error.startswith("CouldntDecodeError")
+
+
+def test_write_errors_appends_paths(tmp_path):
+    write_errors(str(tmp_path), [])
+    assert not os.path.exists(tmp_path / "errors.txt")
+    write_errors(str(tmp_path), [("a", "error")], messages=False)
+    write_errors(str(tmp_path), [("b", "error")])
+    with open(tmp_path / "errors.txt") as f:
+        assert f.read() == "a\nb\terror\n"
+
+
+@pytest.mark.parametrize(
+    "sample_rate, channels, frames",
+    [(None, None, 115200), (16000, None, 41796), (8000, 2, 20898)],
+)
+def test_streaming_conversion(tmp_path, sample_rate, channels, frames):
+    pytest.importorskip("miniaudio")
+    _write_mp3(tmp_path / "a.mp3")
+    utils.convert_mp3_to_wav(
+        str(tmp_path / "a.mp3"),
+        str(tmp_path / "a.wav"),
+        streaming=True,
+        sample_rate=sample_rate,
+        channels=channels,
+        chunk_frames=1000,
+    )
+    header = read_wav_header(str(tmp_path / "a.wav"))
+    assert header.sample_rate == (sample_rate or 44100)
+    assert header.channels == (channels or 1)
+    assert header.sample_width == 2
+    assert header.frames == frames
+
+
+def test_streaming_conversion_with_ffmpeg(tmp_path, monkeypatch):
+    import builtins
+    import shutil
+
+    if shutil.which("ffmpeg") is None:
+        pytest.skip("ffmpeg is not installed")
+    import_module = builtins.__import__
+
+    def without_miniaudio(name, *args, **kwargs):
+        """Import as if miniaudio were not installed."""
+        if name == "miniaudio":
+            raise ImportError(name)
+        return import_module(name, *args, **kwargs)
+
+    monkeypatch.setattr(builtins, "__import__", without_miniaudio)
+    _write_mp3(tmp_path / "a.mp3")
+    utils.convert_mp3_to_wav(
+        str(tmp_path / "a.mp3"),
+        str(tmp_path / "a.wav"),
+        streaming=True,
+        sample_rate=16000,
+        channels=2,
+    )
+    header = read_wav_header(str(tmp_path / "a.wav"))
+    assert (header.sample_rate, header.channels) == (16000, 2)
+    assert abs(header.frames - 41796) <= 1152